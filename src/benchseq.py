@@ -0,0 +1,720 @@
+#!/usr/bin/env python3
+"""
+    File: benchseq.py
+    End to end benchmark harness for the MiniSeq playback engines.
+    Plays scripted scenarios through MainApp and MidiDriver
+    into a timestamping sink, and reports throughput, CPU usage
+    and timing error for each engine.
+
+    Usage: python3 benchseq.py [real|virtual] [scenario ...]
+           python3 benchseq.py compare [real|virtual] [scenario ...]
+           python3 benchseq.py logging [scenario]
+           python3 benchseq.py alloc [cycles]
+           python3 benchseq.py ports [count]
+           python3 benchseq.py imports [budget_ms]
+           python3 benchseq.py sysex [kbytes] [byte_rate]
+           python3 benchseq.py preempt [kbytes] [byte_rate]
+    Date: Mon, 19/10/2026
+    Author: Coolbrother
+"""
+import os
+import sys
+import time
+import subprocess
+import logging
+import tempfile
+import tracemalloc
+import mididriver as drv
+import midisequencer as midseq
+import midigen
+import midilog
+import miditrace
+import midiengine
+import midiport
+import miniseq
+
+ENGINES = midiengine.get_engine_names()
+_MARGIN = 0.5 # in sec, after the end of the scenario
+# import time budget of the headless player, in sec
+IMPORT_BUDGET = 0.05
+# modules which must not be imported by the headless player
+LAZY_MODULES = ("rtmidi", "readline", "signal", "logging.handlers", "http.server",
+        "multiprocessing", "concurrent.futures", "midifile", "midicache", "midimetrics")
+
+#----------------------------------------
+
+class TimestampSink(object):
+    """
+    Fake midiout port, which stamps every message it receives
+    """
+    def __init__(self, clock=None):
+        self.clock = clock or time
+        self.stamps = []
+        self.closed =0
+
+    #----------------------------------------
+
+    def send_message(self, msg):
+        # Note: messages flushed by the engine after the stop are not recorded
+        if self.closed: return
+        self.stamps.append((self.clock.time(), msg))
+
+    #----------------------------------------
+
+    def close_port(self):
+        pass
+
+    #----------------------------------------
+
+#========================================
+
+class StopClock(drv.VirtualClock):
+    """
+    Virtual clock which calls stop_func once, when the limit time is reached
+    """
+    def __init__(self, limit, stop_func):
+        drv.VirtualClock.__init__(self)
+        self._limit = limit
+        self._stop_func = stop_func
+
+    #----------------------------------------
+
+    def sleep(self, secs):
+        drv.VirtualClock.sleep(self, secs)
+        if self._stop_func and self._now >= self._limit:
+            self._stop_func()
+            self._stop_func = None
+
+    #----------------------------------------
+
+class NullSink(object):
+    """ Fake midiout port, which drops the messages """
+
+    def send_message(self, msg):
+        pass
+
+    #----------------------------------------
+
+    def close_port(self):
+        pass
+
+    #----------------------------------------
+
+#========================================
+
+class SlowSink(NullSink):
+    """
+    Fake midiout port, which blocks delay sec for every message,
+    like a slow device
+    """
+    def __init__(self, delay=0.0002):
+        self.delay = delay
+        self.count =0
+
+    #----------------------------------------
+
+    def send_message(self, msg):
+        time.sleep(self.delay)
+        self.count +=1
+
+    #----------------------------------------
+
+#========================================
+
+class WireSink(NullSink):
+    """
+    Fake midiout port, which blocks for the time of the message on the wire,
+    and stamps the note on and note off messages
+    """
+    def __init__(self, byte_rate):
+        self.byte_rate = byte_rate
+        self.note_stamps = []
+        self.off_stamps = []
+
+    #----------------------------------------
+
+    def send_message(self, msg):
+        time.sleep(len(msg) / self.byte_rate)
+        if msg[0] & 0xF0 == midseq.NOTE_ON:
+            self.note_stamps.append(time.perf_counter())
+        elif msg[0] & 0xF0 == midseq.NOTE_OFF:
+            self.off_stamps.append(time.perf_counter())
+
+    #----------------------------------------
+
+#========================================
+
+class SnapClock(drv.VirtualClock):
+    """
+    Virtual clock which takes a tracemalloc snapshot after warmup cycles,
+    and another one after cycles more, then calls stop_func
+    A cycle is a sleep of the engine
+    """
+    def __init__(self, warmup, cycles, stop_func):
+        drv.VirtualClock.__init__(self)
+        self._warmup = warmup
+        self._cycles = cycles
+        self._stop_func = stop_func
+        self._count =0
+        self.snapshots = []
+
+    #----------------------------------------
+
+    def sleep(self, secs):
+        drv.VirtualClock.sleep(self, secs)
+        self._count +=1
+        if self._count == self._warmup or self._count == self._warmup + self._cycles:
+            self.snapshots.append(tracemalloc.take_snapshot())
+            if len(self.snapshots) == 2:
+                self._stop_func()
+
+    #----------------------------------------
+
+#========================================
+
+def scen_dense_chords(seq, bars=8):
+    """ six notes chord on every eighth note """
+    step = seq.ppqn // 2
+    for tick in range(0, bars * seq.ppqn * 4, step):
+        for note in (48, 52, 55, 60, 64, 67):
+            seq.add_event((midseq.NOTE_ON, note, 100), tick)
+        for note in (48, 52, 55, 60, 64, 67):
+            seq.add_event((midseq.NOTE_OFF, note, 0), tick + step)
+
+#----------------------------------------
+
+def scen_cc_flood(seq, bars=4):
+    """ two controller streams, one message per tick on each """
+    for tick in range(bars * seq.ppqn * 4):
+        val = tick % 128
+        seq.add_event((midseq.CONTROL_CHANGE | 1, 1, val), tick)
+        seq.add_event((midseq.CONTROL_CHANGE | 2, 74, 127 - val), tick)
+
+#----------------------------------------
+
+def scen_sparse(seq, bars=8):
+    """ long piece, with one note every two beats """
+    step = seq.ppqn * 2
+    for (i, tick) in enumerate(range(0, bars * seq.ppqn * 4, step)):
+        note = 48 + (i * 5) % 24
+        seq.add_event((midseq.NOTE_ON | 3, note, 90), tick)
+        seq.add_event((midseq.NOTE_OFF | 3, note, 0), tick + step)
+
+#----------------------------------------
+
+def scen_click_seq(seq, bars=8):
+    """ quarter notes melody with the metronome """
+    for (i, tick) in enumerate(range(0, bars * seq.ppqn * 4, seq.ppqn)):
+        note = (60, 62, 64, 65, 67, 69, 71, 72)[i % 8]
+        seq.add_event((midseq.NOTE_ON, note, 100), tick)
+        seq.add_event((midseq.NOTE_OFF, note, 0), tick + seq.ppqn)
+
+#----------------------------------------
+
+def scen_stress(seq, bars=8):
+    """ generated workload, with notes, controllers and pitch bend on 8 channels """
+    wl = midigen.gen_workload(bars=bars, ppqn=seq.ppqn, seed=1, channels=8, bend_rate=4)
+    seq.add_events(wl.ticks, wl.messages)
+
+#----------------------------------------
+
+SCENARIOS = {
+        "chords": (scen_dense_chords, 0),
+        "ccflood": (scen_cc_flood, 0),
+        "sparse": (scen_sparse, 0),
+        "click": (scen_click_seq, 1),
+        "stress": (scen_stress, 0),
+        }
+
+#----------------------------------------
+
+def expected_schedule(seq, clicking):
+    """
+    Returns a function which gives the expected tick
+    for the nth occurrence of a message, and the sequence ticks by message
+    """
+
+    seq_ticks = {}
+    for evt in seq.queue:
+        seq_ticks.setdefault(tuple(evt.message), []).append(evt.tick)
+    click_offsets = {}
+    period = seq.ppqn * 4
+    if clicking:
+        for evt in seq.click_track._ev_lst:
+            click_offsets.setdefault(tuple(evt.message), []).append(evt.tick)
+
+    def func(key, count):
+        ticks = seq_ticks.get(key)
+        if ticks is not None and count < len(ticks):
+            return ticks[count]
+        offsets = click_offsets.get(key)
+        if offsets is None: return None
+        if ticks is not None: count -= len(ticks)
+        (bar, index) = divmod(count, len(offsets))
+        return bar * period + offsets[index]
+
+    return (func, seq_ticks)
+
+#----------------------------------------
+
+def percentile(lst, pc):
+    if not lst: return 0.
+    index = min(len(lst) -1, int(round(pc / 100. * (len(lst) -1))))
+    return lst[index]
+
+#----------------------------------------
+
+def run_scenario(name, engine, virtual=0, bpm=120):
+    """
+    Plays a scenario with an engine, and returns a report dictionary
+    """
+
+    (scen_func, clicking) = SCENARIOS[name]
+    app = miniseq.MainApp()
+    app._seq = seq = midseq.MidiSequencer(bpm=bpm, ppqn=120)
+    seq.init_seq()
+    scen_func(seq)
+    seq.sort_events()
+    seq.update_pos()
+    duration = seq.len * seq._tickms
+
+    def stop_func():
+        sink.closed =1
+        app._playing =0
+        app._clicking =0
+
+    clock = StopClock(duration + _MARGIN, stop_func) if virtual else time
+    sink = TimestampSink(clock)
+    app._driver = drv.MidiDriver(midiout=sink, clock=clock)
+    app._engine = midiengine.create_engine(engine, app)
+    app._driver.set_process_callback(app.midi_process)
+
+    if clicking:
+        app.init_click()
+        app.click_track.active =1
+        app._clicking =1
+    cpu0 = time.process_time()
+    wall0 = time.perf_counter()
+    start = clock.time()
+    app.play()
+    # wall clock timeout, in case the virtual clock is stalled
+    timeout = duration * 4 + 10
+    while app._playing or app._clicking:
+        if not virtual and clock.time() - start >= duration + _MARGIN: break
+        if time.perf_counter() - wall0 >= timeout: break
+        time.sleep(0.001)
+    stop_func()
+    app._driver.stop_engine()
+    wall = time.perf_counter() - wall0
+    cpu = time.process_time() - cpu0
+
+    (expected, seq_ticks) = expected_schedule(seq, clicking)
+    counts = {}
+    errors = []
+    unknown =0
+    for (stamp, msg) in sink.stamps:
+        key = tuple(msg)
+        count = counts.get(key, 0)
+        counts[key] = count +1
+        tick = expected(key, count)
+        if tick is None:
+            unknown +=1
+            continue
+        errors.append((stamp - start) - tick * seq._tickms)
+    errors.sort()
+    abs_errors = sorted(abs(x) for x in errors)
+    nb_events = len(sink.stamps)
+    missed =0
+    for (key, ticks) in seq_ticks.items():
+        missed += max(0, len(ticks) - counts.get(key, 0))
+
+    return {
+            "scenario": name,
+            "engine": engine,
+            "mode": "virtual" if virtual else "real",
+            "events": nb_events,
+            "missed": missed,
+            "unknown": unknown,
+            "duration": duration,
+            "wall": wall,
+            "cpu": cpu,
+            "cpu_pc": 100. * cpu / wall if wall else 0.,
+            # in virtual mode, the throughput is how fast the engine runs
+            "ev_per_sec": nb_events / (cpu if virtual else wall) if (cpu if virtual else wall) else 0.,
+            "err_mean": sum(errors) / len(errors) if errors else 0.,
+            "err_p50": percentile(abs_errors, 50),
+            "err_p95": percentile(abs_errors, 95),
+            "err_p99": percentile(abs_errors, 99),
+            "err_max": abs_errors[-1] if abs_errors else 0.,
+            }
+
+#----------------------------------------
+
+def print_report(reports):
+    print("%-8s %-14s %-7s %7s %6s %10s %6s %9s %9s %9s %9s" % (
+        "scenario", "engine", "mode", "events", "missed", "ev/sec", "cpu%",
+        "mean ms", "p50 ms", "p99 ms", "max ms"))
+    for rep in reports:
+        print("%-8s %-14s %-7s %7d %6d %10.0f %6.1f %9.3f %9.3f %9.3f %9.3f" % (
+            rep["scenario"], rep["engine"], rep["mode"], rep["events"], rep["missed"],
+            rep["ev_per_sec"], rep["cpu_pc"], rep["err_mean"] * 1000,
+            rep["err_p50"] * 1000, rep["err_p99"] * 1000, rep["err_max"] * 1000))
+
+#----------------------------------------
+
+def bench_logging(name="ccflood"):
+    """
+    Compares the per event engine overhead, with logging off and on
+    in virtual clock mode
+    """
+
+    logfile = tempfile.NamedTemporaryFile(prefix="miniseq_", suffix=".log", delete=False).name
+    print("%-8s %-14s %-8s %7s %12s" % ("scenario", "engine", "logging", "events", "us/event"))
+    for engine in ENGINES:
+        for level in (logging.WARNING, logging.DEBUG):
+            midilog.init_logging(level, logfile)
+            rep = run_scenario(name, engine, virtual=1)
+            midilog.stop_logging()
+            per_event = rep["cpu"] / rep["events"] * 1e6 if rep["events"] else 0.
+            print("%-8s %-14s %-8s %7d %12.2f" % (name, engine,
+                "on" if level == logging.DEBUG else "off", rep["events"], per_event))
+
+#----------------------------------------
+
+def compare_engines(names, virtual=1):
+    """
+    Plays the same scenarios with all the registered engines,
+    and prints the totals by engine, relative to the first one
+    """
+
+    totals = []
+    for engine in ENGINES:
+        reports = [run_scenario(name, engine, virtual) for name in names]
+        events = sum(rep["events"] for rep in reports)
+        cpu = sum(rep["cpu"] for rep in reports)
+        wall = sum(rep["wall"] for rep in reports)
+        totals.append({
+            "engine": engine,
+            "events": events,
+            "missed": sum(rep["missed"] for rep in reports),
+            "cpu": cpu,
+            "cpu_pc": 100. * cpu / wall if wall else 0.,
+            "ev_per_sec": events / (cpu if virtual else wall) if (cpu if virtual else wall) else 0.,
+            "err_p99": max(rep["err_p99"] for rep in reports),
+            "err_max": max(rep["err_max"] for rep in reports),
+            })
+
+    print("Scenarios: %s, mode: %s" % (", ".join(names), "virtual" if virtual else "real"))
+    print("%-14s %7s %6s %9s %6s %10s %6s %9s %9s" % (
+        "engine", "events", "missed", "cpu sec", "cpu%", "ev/sec", "ratio", "p99 ms", "max ms"))
+    ref = totals[0]["ev_per_sec"] if totals else 0.
+    for tot in totals:
+        print("%-14s %7d %6d %9.3f %6.1f %10.0f %6.2f %9.3f %9.3f" % (
+            tot["engine"], tot["events"], tot["missed"], tot["cpu"], tot["cpu_pc"],
+            tot["ev_per_sec"], tot["ev_per_sec"] / ref if ref else 0.,
+            tot["err_p99"] * 1000, tot["err_max"] * 1000))
+
+    return totals
+
+#----------------------------------------
+
+def check_alloc(engine, cycles=5000, warmup=500):
+    """
+    Plays a generated workload with the metronome, in virtual clock mode,
+    and returns the net allocated bytes in the engine modules
+    between two tracemalloc snapshots, taken cycles callbacks apart
+    """
+
+    app = miniseq.MainApp()
+    app._seq = seq = midseq.MidiSequencer(bpm=120, ppqn=120)
+    seq.init_seq()
+    bars = (warmup + cycles) * 3 // (seq.ppqn * 4) + 8
+    wl = midigen.gen_workload(bars=bars, ppqn=seq.ppqn, seed=2, channels=4, bend_rate=2)
+    wl.to_seq(seq)
+
+    def stop_func():
+        app._playing =0
+        app._clicking =0
+
+    clock = SnapClock(warmup, cycles, stop_func)
+    app._driver = driver = drv.MidiDriver(midiout=NullSink(), clock=clock)
+    app.init_click()
+    app.click_track.active =1
+    app._clicking =1
+    app._engine = midiengine.create_engine(engine, app)
+    app._playing =1
+    app._engine.set_pos(seq.curtick)
+    # the callback is run in this thread, like in MidiDriver._run
+    driver._running =1
+    callback = app.midi_process
+    tracemalloc.start()
+    try:
+        while app._playing or app._clicking:
+            callback(driver._frames, driver._bufsize)
+            if app._playing or app._clicking:
+                clock.sleep(driver._delay_ms)
+    finally:
+        tracemalloc.stop()
+        driver._running =0
+
+    (snap1, snap2) = clock.snapshots
+    filters = [tracemalloc.Filter(True, mod.__file__)
+            for mod in (miniseq, midiengine, midseq, drv, miditrace)]
+    stats = snap2.filter_traces(filters).compare_to(snap1.filter_traces(filters), "lineno")
+    net = sum(stat.size_diff for stat in stats)
+
+    return (net, [stat for stat in stats if stat.size_diff])
+
+#----------------------------------------
+
+def bench_ports(count=4000, delay=0.0002, port_counts=(0, 1, 2, 4)):
+    """
+    Sends count messages on 16 channels, through slow ports,
+    the channels being spread over the ports
+    0 port sends directly in the engine thread, without port thread
+    Prints the sending time in the engine thread, and the total time
+    """
+
+    msgs = [[0x90 | (i & 0x0F), 60, 100] for i in range(count)]
+    print("Messages: %d, port delay: %.3f ms" % (count, delay * 1000))
+    print("%-6s %12s %12s %10s %12s" % ("ports", "engine ms", "total ms", "msg/sec", "max lat ms"))
+    for nb in port_counts:
+        driver = drv.MidiDriver(midiout=SlowSink(delay))
+        driver.trace = None
+        if nb:
+            driver.enable_ports()
+            for i in range(1, nb):
+                driver.add_port(SlowSink(delay), f"port{i}")
+            for channel in range(16):
+                driver.route_channel(channel, channel % nb)
+        start = time.perf_counter()
+        for msg in msgs:
+            driver.send_imm(msg)
+        engine_time = time.perf_counter() - start
+        for port in driver.ports:
+            while len(port.ring):
+                time.sleep(0.001)
+        # waits the last message in progress
+        for port in driver.ports:
+            port.stop()
+        total_time = time.perf_counter() - start
+        max_lat = max((port.max_latency for port in driver.ports), default=0.)
+        sent = sum(port.sent for port in driver.ports) if nb else count
+        driver.ports = []
+        print("%-6d %12.1f %12.1f %10.0f %12.1f" % (nb, engine_time * 1000,
+            total_time * 1000, sent / total_time, max_lat * 1000))
+
+#----------------------------------------
+
+def bench_sysex(kbytes=16, byte_rate=31250, msg_size=256, note_period=0.001):
+    """
+    Sends a SysEx dump, while the engine thread sends a note every note_period,
+    to a port transmitting byte_rate bytes by sec
+    inline: the dump is sent by send_imm in the engine thread
+    paced: the dump is a PacedJob of the port thread
+    Prints the engine stall, the note latency and the dump throughput
+    """
+
+    count = max(1, kbytes * 1024 // msg_size)
+    dump = bytes([0xF0] + [0x11] * (msg_size -2) + [0xF7]) * count
+    print("SysEx: %d bytes, %d messages, port: %d bytes/sec, a note every %.1f ms" % (
+        len(dump), count, byte_rate, note_period * 1000))
+    print("%-8s %14s %12s %12s %14s" % ("mode", "max stall ms", "p99 lat ms", "max lat ms", "bytes/sec"))
+    for mode in ("inline", "paced"):
+        sink = WireSink(byte_rate)
+        driver = drv.MidiDriver(midiout=sink)
+        driver.trace = None
+        if mode == "paced": driver.enable_ports()
+        duration = len(dump) / byte_rate
+        sched = []
+        max_stall =0.
+        start = time.perf_counter()
+        if mode == "paced":
+            job = driver.send_sysex(dump, byte_rate)
+        else:
+            packets = midiport.split_sysex(dump)
+        nb =0
+        # the engine loop, sending a note each period, and the dump inline
+        while True:
+            now = time.perf_counter()
+            due = start + nb * note_period
+            if now >= due:
+                sched.append(due)
+                t0 = time.perf_counter()
+                driver.send_imm([midseq.NOTE_ON, 60, 100])
+                if mode == "inline" and nb < len(packets):
+                    driver.send_imm(packets[nb])
+                max_stall = max(max_stall, time.perf_counter() - t0)
+                nb +=1
+            elif now - start > duration and (mode == "inline" and nb >= len(packets)
+                    or mode == "paced" and job.is_done()):
+                break
+            else:
+                time.sleep(note_period / 4)
+        elapsed = time.perf_counter() - start
+        driver.stop_ports()
+        lats = sorted(stamp - due for (stamp, due) in zip(sink.note_stamps, sched))
+        rate = job.get_rate() if mode == "paced" else len(dump) / elapsed
+        print("%-8s %14.2f %12.2f %12.2f %14.0f" % (mode, max_stall * 1000,
+            percentile(lats, 99) * 1000, lats[-1] * 1000, rate))
+
+#----------------------------------------
+
+def bench_preempt(kbytes=8, byte_rate=midiport.SYSEX_RATE, msg_size=256):
+    """
+    Releases a sounding note, then sends a panic, while a SysEx dump
+    is sent by the port thread
+    Prints the delay of the note off and of the panic end,
+    which must not wait for the end of the dump
+    """
+
+    count = max(1, kbytes * 1024 // msg_size)
+    dump = bytes([0xF0] + [0x11] * (msg_size -2) + [0xF7]) * count
+    sink = WireSink(byte_rate)
+    driver = drv.MidiDriver(midiout=sink)
+    driver.trace = None
+    driver.enable_ports()
+    driver.send_imm([midseq.NOTE_ON, 60, 100])
+    job = driver.send_sysex(dump, byte_rate)
+    # the dump in flight
+    time.sleep(0.1)
+    start = time.perf_counter()
+    dump_left = len(dump) * (1 - job.get_progress()) / byte_rate
+    driver.release_notes()
+    group = driver.panic()
+    group.wait()
+    panic_delay = time.perf_counter() - start
+    dump_done = job.is_done()
+    while not sink.off_stamps:
+        time.sleep(0.001)
+    off_delay = sink.off_stamps[0] - start
+    driver.stop_ports()
+    print("SysEx: %d bytes, port: %d bytes/sec, %.2f sec of dump left at the panic" % (
+        len(dump), byte_rate, dump_left))
+    print("%-10s %10.2f ms" % ("note off", off_delay * 1000))
+    print("%-10s %10.2f ms" % ("panic", panic_delay * 1000))
+    print("dump %s at the panic end" % ("finished" if dump_done else "in progress"))
+
+#----------------------------------------
+
+def check_imports(module="miniplay", runs=5):
+    """
+    Imports module in new interpreters, with python -X importtime
+    Returns the best cumulative import time in sec,
+    and the LAZY_MODULES which were imported
+    """
+
+    best = None
+    loaded = set()
+    src_dir = os.path.dirname(os.path.abspath(__file__))
+    for _ in range(runs):
+        res = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                cwd=src_dir, capture_output=True, text=True)
+        for line in res.stderr.splitlines():
+            if not line.startswith("import time:"): continue
+            fields = line.split("|")
+            if len(fields) != 3 or not fields[1].strip().isdigit(): continue
+            name = fields[2].strip()
+            if name == module:
+                elapsed = int(fields[1]) / 1e6
+                if best is None or elapsed < best: best = elapsed
+            elif name in LAZY_MODULES:
+                loaded.add(name)
+
+    return (best, sorted(loaded))
+
+#----------------------------------------
+
+def print_usage():
+    """ prints the usage lines of the module docstring """
+    doc = __doc__
+    print("    " + doc[doc.index("Usage:"):doc.index("Date:")].strip())
+    print("    Scenarios:", ", ".join(SCENARIOS))
+
+#----------------------------------------
+
+def check_scenarios(names):
+    """ exits with the usage, when a scenario name is not known """
+    unknown = [name for name in names if name not in SCENARIOS]
+    if not unknown: return
+    print(f"Unknown scenario: {', '.join(unknown)}")
+    print_usage()
+    sys.exit(2)
+
+#----------------------------------------
+
+def main(args):
+    if args and args[0] in ("-h", "--help", "help"):
+        print_usage()
+        return
+
+    if args and args[0] == "logging":
+        check_scenarios(args[1:2])
+        bench_logging(*args[1:2])
+        return
+
+    if args and args[0] == "compare":
+        args = args[1:]
+        virtual =1
+        if args and args[0] in ("real", "virtual"):
+            virtual = args.pop(0) == "virtual"
+        check_scenarios(args)
+        compare_engines(args or list(SCENARIOS), virtual)
+        return
+
+    if args and args[0] == "ports":
+        bench_ports(int(args[1]) if len(args) > 1 else 4000)
+        return
+
+    if args and args[0] == "sysex":
+        bench_sysex(int(args[1]) if len(args) > 1 else 16,
+                int(args[2]) if len(args) > 2 else 31250)
+        return
+
+    if args and args[0] == "preempt":
+        bench_preempt(int(args[1]) if len(args) > 1 else 8,
+                int(args[2]) if len(args) > 2 else midiport.SYSEX_RATE)
+        return
+
+    if args and args[0] == "imports":
+        budget = float(args[1]) / 1000 if len(args) > 1 else IMPORT_BUDGET
+        (elapsed, loaded) = check_imports()
+        if elapsed is None:
+            print("Could not import miniplay")
+            sys.exit(1)
+        failed = elapsed > budget or bool(loaded)
+        print(f"miniplay: imported in {elapsed * 1000:.1f} ms, budget: {budget * 1000:.0f} ms: "
+                f"{'Failed' if failed else 'Ok'}")
+        if loaded: print("    eagerly imported:", ", ".join(loaded))
+        sys.exit(failed)
+
+    if args and args[0] == "alloc":
+        cycles = int(args[1]) if len(args) > 1 else 5000
+        failed =0
+        for engine in ENGINES:
+            (net, stats) = check_alloc(engine, cycles)
+            print(f"{engine}: {net} bytes net allocated over {cycles} cycles: {'Ok' if net <= 0 else 'Failed'}")
+            for stat in stats[:10]:
+                print("    ", stat)
+            if net > 0: failed =1
+        sys.exit(failed)
+
+    virtual =0
+    if args and args[0] in ("real", "virtual"):
+        virtual = args.pop(0) == "virtual"
+    check_scenarios(args)
+    names = args or list(SCENARIOS)
+    reports = []
+    for name in names:
+        for engine in ENGINES:
+            reports.append(run_scenario(name, engine, virtual))
+    print_report(reports)
+
+    return reports
+
+#----------------------------------------
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
+
+#----------------------------------------
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+    File: midicache.py
+    Binary cache of the sequencer state for MiniSeq.
+    A loaded sequence is stored as columns of ticks, tracks
+    and message indexes, a table of unique messages, and the tempo map,
+    keyed by the content hash of the source Midi file.
+    Reloading is a single read, without parsing the Midi file.
+    Date: Mon, 19/10/2026
+    Author: Coolbrother
+"""
+import hashlib
+import os
+import struct
+import sys
+from array import array
+import midifile
+
+CACHE_MAGIC = b"MSQC"
+CACHE_VERSION =1
+CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "miniseq")
+CACHE_MAX_SIZE = 256 * 1024 * 1024
+CACHE_EXT = ".msc"
+# magic, version, reserved, ppqn, initial bpm, source hash,
+# number of events, unique messages, tempo changes, and messages blob size
+_HEADER = struct.Struct("<4sHHLd16sQLLQ")
+_HASH_SIZE =16
+
+#----------------------------------------
+
+def file_hash(filename):
+    """ returns the content hash of a file, as hex string """
+    hasher = hashlib.blake2b(digest_size=_HASH_SIZE)
+    with open(filename, "rb") as fh:
+        while 1:
+            chunk = fh.read(1 << 20)
+            if not chunk: break
+            hasher.update(chunk)
+
+    return hasher.hexdigest()
+
+#----------------------------------------
+
+def _to_le(arr):
+    """ returns the array bytes in little endian order """
+    if sys.byteorder == "big":
+        arr = array(arr.typecode, arr)
+        arr.byteswap()
+    return arr.tobytes()
+
+#----------------------------------------
+
+def _from_le(typecode, data):
+    """ returns an array from little endian bytes """
+    arr = array(typecode)
+    arr.frombytes(data)
+    if sys.byteorder == "big": arr.byteswap()
+    return arr
+
+#----------------------------------------
+
+def dump_seq(seq, fh, key=""):
+    """
+    Writes the state of a MidiSequencer object to a binary file object
+    Returns the number of bytes written
+    """
+
+    queue = seq.queue
+    ticks = array('q', [evt.tick for evt in queue])
+    tracks = array('H', [evt.track for evt in queue])
+    msg_index = array('I')
+    offsets = array('Q', [0])
+    blob = bytearray()
+    indexes = {}
+    add_index = msg_index.append
+    for evt in queue:
+        # Note: bytes(msg) returns msg itself for bytes messages
+        msg = bytes(evt.message)
+        index = indexes.get(msg)
+        if index is None:
+            index = indexes[msg] = len(indexes)
+            blob += msg
+            offsets.append(len(blob))
+        add_index(index)
+    tempo_ticks = array('q', [tick for (tick, bpm) in seq.tempo_map])
+    tempo_bpms = array('d', [bpm for (tick, bpm) in seq.tempo_map])
+
+    header = _HEADER.pack(CACHE_MAGIC, CACHE_VERSION, 0, seq.ppqn, seq._init_bpm,
+            bytes.fromhex(key) if key else bytes(_HASH_SIZE),
+            len(queue), len(indexes), len(tempo_ticks), len(blob))
+    size =0
+    for data in (header, _to_le(ticks), _to_le(tracks), _to_le(msg_index),
+            _to_le(offsets), blob, _to_le(tempo_ticks), _to_le(tempo_bpms)):
+        fh.write(data)
+        size += len(data)
+
+    return size
+
+#----------------------------------------
+
+def read_key(data):
+    """ returns the key of the bytes of a cache file, as hex string, or None """
+    if len(data) < _HEADER.size: return None
+    (magic, version, reserved, ppqn, init_bpm, digest) = _HEADER.unpack_from(data, 0)[:6]
+    if magic != CACHE_MAGIC or version != CACHE_VERSION: return None
+
+    return digest.hex()
+
+#----------------------------------------
+
+def load_seq(seq, data, key=""):
+    """
+    Loads a MidiSequencer object from the bytes of a cache file
+    Returns 1 when loaded, 0 when the data is invalid or from another key
+    """
+
+    size = len(data)
+    if size < _HEADER.size: return 0
+    (magic, version, reserved, ppqn, init_bpm, digest, nb_events, nb_msgs,
+            nb_tempos, blob_size) = _HEADER.unpack_from(data, 0)
+    if magic != CACHE_MAGIC or version != CACHE_VERSION: return 0
+    if key and digest != bytes.fromhex(key): return 0
+    if size != (_HEADER.size + nb_events * 14 + (nb_msgs +1) * 8
+            + blob_size + nb_tempos * 16):
+        return 0
+
+    mv = memoryview(data)
+    pos = _HEADER.size
+    columns = []
+    for (typecode, count) in (('q', nb_events), ('H', nb_events), ('I', nb_events),
+            ('Q', nb_msgs +1)):
+        end = pos + count * array(typecode).itemsize
+        columns.append(_from_le(typecode, mv[pos:end]))
+        pos = end
+    (ticks, tracks, msg_index, offsets) = columns
+    blob = mv[pos:pos + blob_size]
+    pos += blob_size
+    tempo_ticks = _from_le('q', mv[pos:pos + nb_tempos * 8])
+    pos += nb_tempos * 8
+    tempo_bpms = _from_le('d', mv[pos:pos + nb_tempos * 8])
+
+    # unique messages, shared by the events
+    msgs = [bytes(blob[offsets[i]:offsets[i +1]]) for i in range(nb_msgs)]
+    messages = list(map(msgs.__getitem__, msg_index))
+    mv.release()
+
+    seq.clear_events()
+    seq.set_ppqn(ppqn)
+    seq._init_bpm = init_bpm
+    seq.bpm = init_bpm
+    seq.add_events(ticks, messages, tracks)
+    seq.set_tempo_map(list(zip(tempo_ticks, tempo_bpms)))
+    seq.update_pos()
+
+    return 1
+
+#----------------------------------------
+
+class SeqCache(object):
+    """
+    Cache directory of sequencer states, with LRU eviction by total size
+    The modification time of the files is the last use time
+    """
+    def __init__(self, cache_dir=CACHE_DIR, max_size=CACHE_MAX_SIZE):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+    #----------------------------------------
+
+    def get_path(self, key):
+        return os.path.join(self.cache_dir, key + CACHE_EXT)
+
+    #----------------------------------------
+
+    def load(self, seq, key):
+        """
+        Loads the sequencer state for key
+        Returns 1 when found, 0 otherwise
+        """
+
+        path = self.get_path(key)
+        try:
+            with open(path, "rb") as fh:
+                data = fh.read()
+        except OSError:
+            return 0
+        if not load_seq(seq, data, key):
+            # old version, or corrupted file
+            self.remove(key)
+            return 0
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        return 1
+
+    #----------------------------------------
+
+    def store(self, seq, key):
+        """
+        Stores the sequencer state for key, and evicts the oldest files
+        Returns the file size
+        """
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.get_path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as fh:
+                size = dump_seq(seq, fh, key)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path): os.remove(tmp_path)
+            raise
+        self.evict()
+
+        return size
+
+    #----------------------------------------
+
+    def remove(self, key):
+        try:
+            os.remove(self.get_path(key))
+        except OSError:
+            pass
+
+    #----------------------------------------
+
+    def evict(self):
+        """
+        Removes the least recently used files, until the total size fits in max_size
+        Returns the number of removed files
+        """
+
+        entries = []
+        try:
+            with os.scandir(self.cache_dir) as it:
+                for entry in it:
+                    if entry.name.endswith(CACHE_EXT) and entry.is_file():
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        except OSError:
+            return 0
+        total = sum(size for (mtime, size, path) in entries)
+        entries.sort()
+        count =0
+        for (mtime, size, path) in entries:
+            if total <= self.max_size: break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            count +=1
+
+        return count
+
+    #----------------------------------------
+
+    def clear(self):
+        """ removes all the cache files """
+        max_size = self.max_size
+        self.max_size =0
+        try:
+            self.evict()
+        finally:
+            self.max_size = max_size
+
+    #----------------------------------------
+
+#========================================
+
+def load_midi_file(seq, filename, cache=None, workers=0):
+    """
+    Loads a Midi file into a MidiSequencer object, from the cache if possible,
+    otherwise parses it, with workers processes, and stores it in the cache
+    Returns 1 when loaded from the cache, 0 otherwise
+    """
+
+    if cache is None: cache = SeqCache()
+    key = file_hash(filename)
+    if cache.load(seq, key): return 1
+    midifile.load_midi_file(seq, filename, workers)
+    try:
+        cache.store(seq, key)
+    except OSError:
+        # no cache, when the directory is not writable
+        pass
+
+    return 0
+
+#----------------------------------------
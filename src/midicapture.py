@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+    File: midicapture.py
+    Capture of the Midi output stream to a Midi file, for MiniSeq.
+    The engine thread and the control thread push the sent messages
+    with their timestamps in a ring buffer each, and a background thread
+    writes them to the file, merged by timestamp.
+    Date: Mon, 19/10/2026
+    Author: Coolbrother
+"""
+import threading
+import time
+import heapq
+from operator import itemgetter
+import midifile
+import midiring
+
+CAPTURE_FILE = "/tmp/miniseq_capture.mid"
+# 5000 ticks per quarter at 120 bpm, for a resolution of 0.1 ms
+CAPTURE_PPQN = 5000
+CAPTURE_BPM = 120.
+
+#----------------------------------------
+
+class MidiCapture(object):
+    """
+    Records the messages sent by a MidiDriver object
+    push is called from the engine thread, push_control from the control thread,
+    each one being the single producer of its ring, they never wait
+    """
+    def __init__(self, filename=CAPTURE_FILE, ring_size=65536, period=0.05,
+            ppqn=CAPTURE_PPQN, bpm=CAPTURE_BPM):
+        self.filename = filename
+        self.ring = midiring.SpscRing(ring_size)
+        self.control_ring = midiring.SpscRing(ring_size)
+        # sleeping time of the writer thread, between two drains
+        self.period = period
+        self.ppqn = ppqn
+        self.bpm = bpm
+        self._ticks_per_sec = ppqn * bpm / 60.
+        self._start_time =0
+        self._last_tick =0
+        self._writer = None
+        self._thread = None
+        self._running =0
+        self.count =0
+
+    #----------------------------------------
+
+    def is_running(self):
+        return self._running
+
+    #----------------------------------------
+
+    def push(self, stamp, msg):
+        """ adds a message sent by the engine thread, with its timestamp in sec """
+        self.ring.push(stamp, msg)
+
+    #----------------------------------------
+
+    def push_control(self, stamp, msg):
+        """ adds a message sent by the control thread, with its timestamp in sec """
+        self.control_ring.push(stamp, msg)
+
+    #----------------------------------------
+
+    def get_overflows(self):
+        """ returns the number of messages lost, when the rings were full """
+        return self.ring.overflows + self.control_ring.overflows
+
+    #----------------------------------------
+
+    def start(self, start_time):
+        """
+        Opens the file, and starts the writer thread
+        start_time is the timestamp of the tick 0, on the sending clock
+        """
+
+        if self._running: return
+        self.ring.clear()
+        self.control_ring.clear()
+        self._start_time = start_time
+        self._last_tick =0
+        self.count =0
+        self._writer = midifile.MidiFileWriter(self.filename, 0, self.ppqn).open()
+        self._writer.begin_track()
+        self._writer.write_tempo(0, self.bpm)
+        self._running =1
+        self._thread = threading.Thread(target=self._run, name="capture")
+        self._thread.daemon = True
+        self._thread.start()
+
+    #----------------------------------------
+
+    def stop(self):
+        """
+        Stops the writer thread, writes the last messages and closes the file
+        Returns the number of captured messages
+        """
+
+        if not self._running: return self.count
+        self._running =0
+        self._thread.join()
+        self._thread = None
+        self._write_pending()
+        self._writer.close()
+        self._writer = None
+
+        return self.count
+
+    #----------------------------------------
+
+    def _write_pending(self):
+        """ writes the messages available in the rings, merged by timestamp """
+        (stamps, items) = self.ring.drain()
+        (control_stamps, control_items) = self.control_ring.drain()
+        if not items and not control_items: return
+        if control_items:
+            entries = list(heapq.merge(zip(stamps, items),
+                zip(control_stamps, control_items), key=itemgetter(0)))
+        else:
+            entries = zip(stamps, items)
+        writer = self._writer
+        start_time = self._start_time
+        ticks_per_sec = self._ticks_per_sec
+        last_tick = self._last_tick
+        for (stamp, msg) in entries:
+            tick = round((stamp - start_time) * ticks_per_sec)
+            # the clock cannot go backward in the file
+            if tick < last_tick: tick = last_tick
+            writer.write_event(tick, msg)
+            last_tick = tick
+        self._last_tick = last_tick
+        self.count += len(items) + len(control_items)
+
+    #----------------------------------------
+
+    def _run(self):
+        period = self.period
+        while self._running:
+            self._write_pending()
+            time.sleep(period)
+
+    #----------------------------------------
+
+#========================================
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+    File: midichase.py
+    State chasing on seek, for MiniSeq.
+    An index of snapshots of the channel state (controllers, programs,
+    pitch bend and channel pressure) is built at each bar of the sequence.
+    Seeking restores the state from the nearest snapshot before the position,
+    and the events of the end of the bar, in one batch of messages.
+    Date: Mon, 19/10/2026
+    Author: Coolbrother
+"""
+from array import array
+
+CONTROL_CHANGE = 0xB0
+PROGRAM_CHANGE = 0xC0
+CHANNEL_PRESSURE = 0xD0
+PITCH_BEND = 0xE0
+BANK_SELECT_MSB =0
+BANK_SELECT_LSB =32
+RESET_ALL_CONTROLLERS = 0x79
+# channel mode messages, not chased
+CHANNEL_MODE = 120
+# beats by bar, without time signature in the sequencer
+BAR_BEATS =4
+
+#----------------------------------------
+
+def update_state(state, message, track):
+    """
+    Updates a channel state dict with a message
+    The keys are (status << 7 | number) for the controllers,
+    and (status << 7) for the program, the pressure and the pitch bend,
+    the values are (message, track) tuples
+    Note: the RPN and NRPN are chased as the last values of their controllers
+    """
+
+    status = message[0]
+    kind = status & 0xF0
+    if kind == CONTROL_CHANGE:
+        number = message[1]
+        if number < CHANNEL_MODE:
+            state[(status << 7) | number] = (message, track)
+        elif number == RESET_ALL_CONTROLLERS:
+            # the controllers of the channel are reset, not its program
+            for key in [key for key in state if key >> 7 == status]:
+                del state[key]
+    elif kind == PROGRAM_CHANGE or kind == CHANNEL_PRESSURE or kind == PITCH_BEND:
+        state[status << 7] = (message, track)
+
+#----------------------------------------
+
+def _get_rank(key):
+    """
+    Returns the sending order of a state key:
+    by channel, the bank select before the program change,
+    then the other controllers, the pressure and the pitch bend
+    """
+
+    status = key >> 7
+    number = key & 0x7F
+    kind = status & 0xF0
+    if kind == CONTROL_CHANGE:
+        rank =0 if number == BANK_SELECT_MSB or number == BANK_SELECT_LSB else 2
+    elif kind == PROGRAM_CHANGE:
+        rank =1
+    else:
+        rank =3
+
+    return ((status & 0x0F), rank, kind, number)
+
+#----------------------------------------
+
+def get_messages(state):
+    """
+    Returns the messages restoring a channel state,
+    and their track numbers, as two lists in sending order
+    """
+
+    keys = sorted(state, key=_get_rank)
+
+    return ([state[key][0] for key in keys], [state[key][1] for key in keys])
+
+#----------------------------------------
+
+class ChaseIndex(object):
+    """
+    Snapshots of the channel state of a MidiSequencer object, by interval
+    The snapshots are built when a chase needs them,
+    and an edit invalidates the snapshots after its tick only
+    """
+    def __init__(self, seq, interval=None):
+        self._seq = seq
+        # interval in ticks between two snapshots, a bar by default
+        self._interval = interval
+        self.interval =0
+        # state before the tick (k * interval), and index of its first event
+        self.snapshots = []
+        self.indexes = array('q')
+        # whether the snapshots reach the end of the sequence
+        self.complete =0
+        self.changes = -1
+        self.builds =0
+
+    #----------------------------------------
+
+    def update(self):
+        """
+        Removes the snapshots after the ticks changed since the last update
+        """
+
+        seq = self._seq
+        interval = self._interval or seq.ppqn * BAR_BEATS
+        tick = seq.get_changed_tick(self.changes)
+        if interval != self.interval or self.changes < 0:
+            tick =0
+        self.interval = interval
+        self.changes = seq.changes
+        if tick is None: return
+        # the snapshot of the bar of tick is before the change
+        keep = tick // interval +1 if tick > 0 else 0
+        if keep < len(self.snapshots) or self.complete:
+            del self.snapshots[keep:]
+            del self.indexes[keep:]
+            self.complete =0
+
+    #----------------------------------------
+
+    def build(self, pos=None):
+        """
+        Scans the sequence from the last snapshot,
+        until the snapshot at pos, or the end of the sequence
+        Returns the number of snapshots
+        """
+
+        self.update()
+        snapshots = self.snapshots
+        if self.complete or (pos is not None and pos < len(snapshots)):
+            return len(snapshots)
+        queue = self._seq.queue
+        interval = self.interval
+        indexes = self.indexes
+        if snapshots:
+            state = dict(snapshots[-1])
+            index = indexes[-1]
+        else:
+            (state, index) = ({}, 0)
+        next_tick = len(snapshots) * interval
+        size = len(queue)
+        while index < size:
+            evt = queue[index]
+            tick = evt.tick
+            if tick >= next_tick:
+                if pos is not None and len(snapshots) > pos: break
+                snapshots.append(dict(state))
+                indexes.append(index)
+                next_tick += interval
+                continue
+            status = evt.message[0]
+            if CONTROL_CHANGE <= status < 0xF0 and status & 0xF0 != 0xA0:
+                update_state(state, evt.message, evt.track)
+            index +=1
+        if index >= size:
+            # the snapshot after the last event
+            snapshots.append(state)
+            indexes.append(size)
+            self.complete =1
+        self.builds +=1
+
+        return len(snapshots)
+
+    #----------------------------------------
+
+    def get_state(self, tick):
+        """
+        Returns the channel state before tick,
+        from the nearest snapshot and the following events before tick
+        """
+
+        pos = max(tick, 0) // (self._interval or self._seq.ppqn * BAR_BEATS)
+        self.build(pos)
+        queue = self._seq.queue
+        pos = min(pos, len(self.snapshots) -1)
+        state = dict(self.snapshots[pos])
+        # the events of the interval before tick
+        stop = self.indexes[pos +1] if pos +1 < len(self.indexes) else len(queue)
+        for index in range(self.indexes[pos], stop):
+            evt = queue[index]
+            if evt.tick >= tick: break
+            status = evt.message[0]
+            if CONTROL_CHANGE <= status < 0xF0 and status & 0xF0 != 0xA0:
+                update_state(state, evt.message, evt.track)
+
+        return state
+
+    #----------------------------------------
+
+    def chase(self, tick):
+        """
+        Returns the messages restoring the channel state at tick,
+        and their track numbers
+        """
+
+        return get_messages(self.get_state(tick))
+
+    #----------------------------------------
+
+#========================================
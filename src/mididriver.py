@@ -5,31 +5,363 @@
     Date: Sun, 27/08/2023
     Author: Coolbrother
 """
+import os
+import re
+import json
 import time
 import threading
-from rtmidi.midiconstants import (
-        NOTE_ON, NOTE_OFF, ALL_SOUND_OFF, 
-                            CONTROL_CHANGE, RESET_ALL_CONTROLLERS
-        )
-from rtmidi.midiutil import (open_midiport, list_input_ports, list_output_ports)
+from array import array
+import miditrace
+import midiport
+from miditrace import (TR_CALLBACK_START, TR_CALLBACK_END, TR_SEND, TR_SLEEP)
+# Note: rtmidi is imported when opening or listing the ports,
+# so the engine and the null ports run without loading it
+# the constants are from rtmidi.midiconstants
+NOTE_OFF = 0x80
+NOTE_ON = 0x90
+CONTROL_CHANGE = 0xB0
+PROGRAM_CHANGE = 0xC0
+ALL_SOUND_OFF = 0x78
+RESET_ALL_CONTROLLERS = 0x79
+# channel mode messages, not kept in the sent state
+CHANNEL_MODE = 120
+# slots of the sent state: the controllers, programs, pressures
+# and pitch bends of the 16 channels, by (status - CONTROL_CHANGE) << 7 | number
+STATE_SIZE = (0xF0 - CONTROL_CHANGE) << 7
+
+CLIENT_NAME = "MiniSeq"
+# port name opening a NullMidiOut or NullMidiIn object, without rtmidi port
+NULL_PORT = "null"
+PORT_CACHE_FILE = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+        "miniseq", "ports.json")
 
 def beep():
     print("\a\n")
 
 #----------------------------------------
 
+# the keys of the sounding notes, preallocated: the engine stores them
+# in the sets without allocating
+_NOTE_KEYS = tuple(range(16 * 128))
+
+#----------------------------------------
+
+def get_note_offs(notes):
+    """
+    Returns the note off messages of a set of sounding notes,
+    in the cost of the sounding notes only
+    Note: a sounding note is the key (channel << 7 | note)
+    """
+
+    return [bytes((NOTE_OFF | (key >> 7), key & 0x7F, 0)) for key in sorted(notes)]
+
+#----------------------------------------
+
+def get_state_index(msg):
+    """
+    Returns the slot of a message in the sent state,
+    or -1 when the message is not kept
+    """
+
+    status = msg[0]
+    if not CONTROL_CHANGE <= status < 0xF0: return -1
+    if status < PROGRAM_CHANGE:
+        number = msg[1]
+        return ((status - CONTROL_CHANGE) << 7) | number if number < CHANNEL_MODE else -1
+
+    return (status - CONTROL_CHANGE) << 7
+
+#----------------------------------------
+
+def update_sent_state(state, msg):
+    """
+    Updates the sent state of a port with a message,
+    a reset all controllers forgets the controllers, the pressure
+    and the pitch bend of its channel
+    """
+
+    index = get_state_index(msg)
+    if index >= 0:
+        state[index] = msg
+        return
+    status = msg[0]
+    if CONTROL_CHANGE <= status < PROGRAM_CHANGE and msg[1] == RESET_ALL_CONTROLLERS:
+        start = (status & 0x0F) << 7
+        for index in range(start, start + CHANNEL_MODE):
+            state[index] = None
+        state[(0x20 | (status & 0x0F)) << 7] = None
+        state[(0x30 | (status & 0x0F)) << 7] = None
+
+#----------------------------------------
+
+def get_changed_messages(state, msgs):
+    """
+    Returns the messages differing from the sent state of a port,
+    a program change is kept after a bank select of its channel
+    """
+
+    changed = []
+    banks =0
+    for msg in msgs:
+        index = get_state_index(msg)
+        if index >= 0:
+            status = msg[0]
+            sent = state[index]
+            if status & 0xF0 == PROGRAM_CHANGE and (banks >> (status & 0x0F)) & 1:
+                pass
+            elif sent is not None and bytes(sent) == bytes(msg):
+                continue
+            if status < PROGRAM_CHANGE and (msg[1] == 0 or msg[1] == 32):
+                banks |= 1 << (status & 0x0F)
+        changed.append(msg)
+
+    return changed
+
+#----------------------------------------
+
+class MidiDriverError(Exception):
+    """ Error when opening a Midi port """
+
+#========================================
+
+class PortCache(object):
+    """
+    Last port resolved for each port spec, saved in a JSON file
+    The file is read at the first lookup
+    """
+    def __init__(self, filename=PORT_CACHE_FILE):
+        self.filename = filename
+        self._data = None
+
+    #----------------------------------------
+
+    def _load(self):
+        if self._data is None:
+            try:
+                with open(self.filename) as fh:
+                    self._data = json.load(fh)
+            except (OSError, ValueError):
+                self._data = {}
+            if not isinstance(self._data, dict): self._data = {}
+
+        return self._data
+
+    #----------------------------------------
+
+    def get(self, kind, spec):
+        """ returns the cached (index, name) for spec, or None """
+        entry = self._load().get(kind, {}).get(spec)
+        if not isinstance(entry, list) or len(entry) != 2: return None
+
+        return tuple(entry)
+
+    #----------------------------------------
+
+    def set(self, kind, spec, index, name):
+        """ caches the port for spec, and saves the file if changed """
+        ports = self._load().setdefault(kind, {})
+        if ports.get(spec) == [index, name]: return
+        ports[spec] = [index, name]
+        self.save()
+
+    #----------------------------------------
+
+    def save(self):
+        """ writes the file atomically, errors are ignored, as it is only a cache """
+        tmp_path = f"{self.filename}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+            with open(tmp_path, "w") as fh:
+                json.dump(self._data or {}, fh, indent=1)
+            os.replace(tmp_path, self.filename)
+        except OSError:
+            if os.path.exists(tmp_path): os.remove(tmp_path)
+
+    #----------------------------------------
+
+#========================================
+
+def match_port(names, spec, kind="output"):
+    """
+    Returns the index of the first port in names matching spec:
+    a port number, the exact name, or a regex searched in the name, ignoring case
+    Raises MidiDriverError when no port matches
+    """
+
+    if isinstance(spec, int) or (isinstance(spec, str) and spec.isdigit()):
+        index = int(spec)
+        if 0 <= index < len(names): return index
+        raise MidiDriverError(f"Invalid MIDI {kind} port number: {index}, "
+                f"{len(names)} ports available")
+    if spec in names: return names.index(spec)
+    try:
+        pattern = re.compile(spec, re.IGNORECASE)
+    except re.error:
+        pattern = re.compile(re.escape(spec), re.IGNORECASE)
+    for (index, name) in enumerate(names):
+        if pattern.search(name): return index
+    if not names:
+        raise MidiDriverError(f"No MIDI {kind} port matching: {spec!r}, no port available")
+    raise MidiDriverError(f"No MIDI {kind} port matching: {spec!r}, available ports: "
+            + ", ".join(repr(name) for name in names))
+
+#----------------------------------------
+
+def resolve_port(midiio, spec, kind="output", cache=None):
+    """
+    Returns (index, name) of the port of midiio matching spec, without prompting
+    The cached port is checked first, without listing all the ports
+    Raises MidiDriverError when no port matches
+    """
+
+    key = str(spec)
+    if cache is not None:
+        entry = cache.get(kind, key)
+        if entry is not None:
+            (index, name) = entry
+            if index < midiio.get_port_count() and midiio.get_port_name(index) == name:
+                return (index, name)
+    names = midiio.get_ports()
+    index = match_port(names, spec, kind)
+    if cache is not None:
+        cache.set(kind, key, index, names[index])
+
+    return (index, names[index])
+
+#----------------------------------------
+
+class VirtualClock(object):
+    """
+    Virtual clock, with the same interface as the time module
+    sleep advances the clock without waiting,
+    for running the engine faster than real time
+    """
+    def __init__(self, start=0.0):
+        self._now = start
+
+    #----------------------------------------
+
+    def time(self):
+        return self._now
+
+    #----------------------------------------
+
+    def sleep(self, secs):
+        if secs > 0:
+            self._now += secs
+
+    #----------------------------------------
+
+#========================================
+
+class NullMidiIn(object):
+    """
+    Midi input without port, with the callback interface of rtmidi MidiIn
+    inject sends a message to the callback, for testing
+    """
+    def __init__(self):
+        self._callback = None
+        self._data = None
+
+    #----------------------------------------
+
+    def set_callback(self, func, data=None):
+        self._callback = func
+        self._data = data
+
+    #----------------------------------------
+
+    def cancel_callback(self):
+        self._callback = None
+        self._data = None
+
+    #----------------------------------------
+
+    def ignore_types(self, sysex=True, timing=True, active_sense=True):
+        pass
+
+    #----------------------------------------
+
+    def close_port(self):
+        self.cancel_callback()
+
+    #----------------------------------------
+
+    def inject(self, msg, delta=0.0):
+        """ sends msg to the callback, like an incoming message """
+        callback = self._callback
+        if callback is not None:
+            callback((list(msg), delta), self._data)
+
+    #----------------------------------------
+
+#========================================
+
+class NullMidiOut(object):
+    """
+    Midi output without port, with the interface of rtmidi MidiOut
+    The messages are dropped, and counted
+    """
+    def __init__(self):
+        self.count =0
+
+    #----------------------------------------
+
+    def send_message(self, msg):
+        self.count +=1
+
+    #----------------------------------------
+
+    def close_port(self):
+        pass
+
+    #----------------------------------------
+
+#========================================
+
 class MidiDriver(object):
     """ Midi driver manager """
-    def __init__(self, midiout=None, outport=0, rate=48000, frames=480):
+    def __init__(self, midiout=None, outport=0, rate=48000, frames=480, clock=None, midiin=None,
+            port_cache=None):
         self._running =0
         self._thread = None
         self.midiout = midiout
+        self.midiin = midiin
+        # SpscRing object, receiving the input messages when recording
+        self.input_ring = None
         self._outport = outport
         self._process_callback = None
         self._rate = rate
         self._bufsize =64
         self._frames = frames
         self._delay_ms = float(1 / (self._rate / self._frames))
+        # Note: clock can be the time module or a VirtualClock object
+        self.clock = clock or time
+        # Note: set trace to None to disable the trace recording
+        self.trace = miditrace.TraceRing()
+        # MidiMetrics object, when the metrics are enabled
+        self.metrics = None
+        # MidiCapture object, when capturing the sent messages
+        self.capture = None
+        # MidiPort objects, when the messages are sent by the port threads,
+        # the first one is midiout
+        self.ports = []
+        # port index by channel, and by track number
+        self.channel_routes = array('B', bytes(16))
+        self.track_routes = {}
+        # sounding notes table, by port index
+        self.active_notes = [set()]
+        # last controllers, programs, pressures and pitch bends sent, by port index,
+        # None for an unknown value
+        self.sent_state = [[None] * STATE_SIZE]
+        # held by the engine thread during each callback: the control thread
+        # holds the engine with it, to take and clear the sounding notes
+        # and the sent state, updated by the engine thread without lock
+        self.engine_lock = threading.RLock()
+        # threads of the jobs sent without port threads, like the panic
+        self._job_threads = []
+        # PortCache object, or None for resolving the ports without cache
+        self.port_cache = port_cache
 
 
     #----------------------------------------
@@ -44,36 +376,125 @@ class MidiDriver(object):
     #----------------------------------------
 
     def print_input_ports(self):
+        from rtmidi.midiutil import list_input_ports
         list_input_ports()
 
     #----------------------------------------
 
     def print_output_ports(self):
+        from rtmidi.midiutil import list_output_ports
         list_output_ports()
 
     #----------------------------------------
 
-    def open_output_port(self, output_port=None):
+    def open_midi_port(self, spec, kind="output", interactive=0):
         """
-        Note: output_port can be a number or a string
+        Opens the port matching spec: a number, a name or a regex
+        null opens a NullMidiOut or NullMidiIn object
+        interactive prompts for the port, with rtmidi midiutil,
+        when spec is None or not found
+        Returns (midiio, port_name)
+        Raises MidiDriverError when the port cannot be opened
         """
 
+        if spec == NULL_PORT:
+            return (NullMidiOut() if kind == "output" else NullMidiIn(), NULL_PORT)
+        if interactive:
+            from rtmidi.midiutil import open_midiport
+            try:
+                return open_midiport(spec, kind, client_name=CLIENT_NAME)
+            except (IOError, ValueError) as exc:
+                raise MidiDriverError(f"Could not open MIDI {kind}: {exc}")
+            except (EOFError, KeyboardInterrupt):
+                raise MidiDriverError(f"No MIDI {kind} port selected")
+        if spec is None:
+            raise MidiDriverError(f"No MIDI {kind} port given")
+        import rtmidi
         try:
-            self.midiout, port = open_midiport(
-                output_port,
-                "output",
-                client_name="MiniSeq")
-        except (IOError, ValueError) as exc:
-            return "Could not open MIDI output: %s" % exc
-        except (EOFError, KeyboardInterrupt):
-            return
+            if kind == "output":
+                midiio = rtmidi.MidiOut(name=CLIENT_NAME)
+            else:
+                midiio = rtmidi.MidiIn(name=CLIENT_NAME)
+            (index, name) = resolve_port(midiio, spec, kind, self.port_cache)
+            midiio.open_port(index, name=f"{CLIENT_NAME} {kind}")
+        except rtmidi.RtMidiError as exc:
+            raise MidiDriverError(f"Could not open MIDI {kind}: {exc}")
+
+        return (midiio, name)
+
+    #----------------------------------------
+
+    def open_output_port(self, output_port=None, interactive=0):
+        """
+        Returns (midiout, port_name), or an error message
+        Note: output_port can be a number, a name or a regex
+        """
+
+        try:
+            self.midiout, port = self.open_midi_port(output_port, "output", interactive)
+        except MidiDriverError as exc:
+            return str(exc)
         
         return (self.midiout, port)
     
     #----------------------------------------
 
+    def open_input_port(self, input_port=None, interactive=0):
+        """
+        Returns (midiin, port_name), or an error message
+        Note: input_port can be a number, a name or a regex
+        """
+
+        try:
+            self.midiin, port = self.open_midi_port(input_port, "input", interactive)
+        except MidiDriverError as exc:
+            return str(exc)
+        
+        return (self.midiin, port)
+    
+    #----------------------------------------
+
+    def start_input(self, ring):
+        """
+        Starts receiving the input messages in ring, with the clock timestamp
+        Note: the rtmidi callback thread is the single producer of the ring
+        """
+
+        if self.midiin is None: return
+        self.input_ring = ring
+        # sysex are recorded, not the clock and active sensing messages
+        self.midiin.ignore_types(sysex=False, timing=True, active_sense=True)
+        self.midiin.set_callback(self._input_callback)
+
+    #----------------------------------------
+
+    def stop_input(self):
+        """ stops receiving the input messages """
+        if self.midiin is not None:
+            self.midiin.cancel_callback()
+        self.input_ring = None
+
+    #----------------------------------------
+
+    def _input_callback(self, event, data=None):
+        """ rtmidi input callback, event is (message, delta_time) """
+        ring = self.input_ring
+        if ring is not None:
+            ring.push(self.clock.time(), event[0])
+
+    #----------------------------------------
+
     def close_ports(self):
         """ Closing midi ports """
+        self.stop_ports()
+        # the panic in progress ends before closing its port
+        for thread in self._job_threads:
+            thread.join()
+        self._job_threads = []
+        if self.midiin:
+            self.stop_input()
+            self.midiin.close_port()
+            self.midiin = None
         if self.midiout:
             self.midiout.close_port()
             del self.midiout
@@ -82,16 +503,265 @@ class MidiDriver(object):
     
     #----------------------------------------
 
-    def send_imm(self, msg):
-        """ Send message immediately """
+    def _capture(self, msg):
+        """
+        Pushes a message sent by the control thread to the capture,
+        the send path of send_batch, release_notes and panic
+        Note: the control thread pushes under engine_lock, as the single producer
+        of its capture ring, send_imm pushing to the ring of the engine thread
+        """
+
+        capture = self.capture
+        if capture is None: return
+        capture.push_control(self.clock.time(), msg)
+
+    #----------------------------------------
+
+    def send_imm(self, msg, track=-1):
+        """
+        Send message immediately,
+        or enqueue it to its port thread, when the ports are enabled
+        track is the track number of the event, for the routing
+        """
+
+        if self.trace is not None:
+            self.trace.record(TR_SEND, msg[0])
+        if self.metrics is not None:
+            self.metrics.add_sent(msg[0])
+        # Note: the capture ring of the engine thread, without lock
+        if self.capture is not None:
+            self.capture.push(self.clock.time(), msg)
+        status = msg[0]
+        ports = self.ports
+        route =0
+        if ports:
+            route = -1
+            if track >= 0 and self.track_routes:
+                route = self.track_routes.get(track, -1)
+            if route < 0:
+                route = self.channel_routes[status & 0x0F] if status < 0xF0 else 0
+        # note on and note off: updating the sounding notes of the port,
+        # a note on with velocity 0 is a note off
+        if NOTE_OFF <= status < 0xA0:
+            key = _NOTE_KEYS[((status & 0x0F) << 7) | msg[1]]
+            if status >= NOTE_ON and msg[2]: self.active_notes[route].add(key)
+            else: self.active_notes[route].discard(key)
+        elif CONTROL_CHANGE <= status < 0xF0:
+            update_sent_state(self.sent_state[route], msg)
+        if ports:
+            ports[route].send(self.clock.time(), msg)
+            return
         self.midiout.send_message(msg)
 
     #----------------------------------------
 
-    def panic(self):
+    def send_batch(self, msgs, tracks=None, changed=0):
+        """
+        Sends messages from the control thread, in one burst by port,
+        routed like send_imm, between two callbacks of the engine
+        With the port threads, the messages go through the port rings,
+        before the messages of the next callbacks
+        changed: whether sending only the controllers, programs, pressures
+        and pitch bends differing from the last ones sent on the port
+        Returns the number of sent messages
+        from MidiDriver object
+        """
+
+        ports = self.ports
+        if not ports and self.midiout is None: return 0
+        if tracks is None: tracks = [-1] * len(msgs)
+        batches = {}
+        for (msg, track) in zip(msgs, tracks):
+            route = -1
+            if track >= 0 and self.track_routes:
+                route = self.track_routes.get(track, -1)
+            if route < 0:
+                status = msg[0]
+                route = self.channel_routes[status & 0x0F] if status < 0xF0 else 0
+            batches.setdefault(route, []).append(msg)
+        count =0
+        with self.engine_lock:
+            for (route, batch) in batches.items():
+                state = self.sent_state[route]
+                if changed:
+                    batch = get_changed_messages(state, batch)
+                for msg in batch:
+                    update_sent_state(state, msg)
+                count += self._send_held(route, batch)
+
+        return count
+
+    #----------------------------------------
+
+    def release_notes(self):
+        """
+        Sends a note off for each sounding note only, in one burst by port,
+        without resetting the controllers
+        Returns the number of sent note offs
+        Note: with the port threads, the note offs go through the port rings,
+        before the messages of the next callbacks and the SysEx dumps
+        from MidiDriver object
+        """
+
+        # the sounding notes are taken, cleared and released between two callbacks,
+        # a note on sent after it is released by the next call
+        count =0
+        with self.engine_lock:
+            all_notes = self.active_notes
+            self.active_notes = [set() for notes in all_notes]
+            for (index, notes) in enumerate(all_notes):
+                if notes: count += self._send_held(index, get_note_offs(notes))
+
+        return count
+
+    #----------------------------------------
+
+    def _send_held(self, index, msgs):
+        """
+        Sends messages from the control thread to the port at index,
+        the engine being held with engine_lock: through the port ring,
+        the messages not fitting in the ring being sent as a drain job
+        Returns the number of sent messages
+        """
+
+        if not msgs: return 0
+        if self.capture is not None:
+            for msg in msgs:
+                self._capture(msg)
+        if not self.ports:
+            if self.midiout is None: return 0
+            send_message = self.midiout.send_message
+            for msg in msgs:
+                send_message(msg)
+            return len(msgs)
+        port = self.ports[index]
+        stamp = self.clock.time()
+        for (pos, msg) in enumerate(msgs):
+            if not port.send(stamp, msg):
+                port.submit(midiport.PacedJob(msgs[pos:], 0, drain=1))
+                break
+
+        return len(msgs)
+
+    #----------------------------------------
+
+    def enable_ports(self):
+        """
+        Sends the messages by port threads, midiout being the first port
+        from MidiDriver object
+        """
+
+        if self.ports: return
+        port = midiport.MidiPort(self.midiout, "main", clock=self.clock)
+        port.start()
+        self.ports = [port]
+
+    #----------------------------------------
+
+    def add_port(self, midiout, name=""):
+        """
+        Adds an output port with its sender thread, and returns its index
+        from MidiDriver object
+        """
+
+        self.enable_ports()
+        port = midiport.MidiPort(midiout, name or str(len(self.ports)), clock=self.clock)
+        port.start()
+        self.ports.append(port)
+        with self.engine_lock:
+            self.active_notes.append(set())
+            self.sent_state.append([None] * STATE_SIZE)
+
+        return len(self.ports) -1
+
+    #----------------------------------------
+
+    def open_port(self, output_port, name=""):
+        """
+        Opens another output port, and adds it
+        Returns the port index, or an error message
+        Note: output_port can be a number, a name or a regex
+        """
+
+        try:
+            midiout, port = self.open_midi_port(output_port, "output")
+        except MidiDriverError as exc:
+            return str(exc)
+
+        return self.add_port(midiout, name or port)
+
+    #----------------------------------------
+
+    def send_sysex(self, data, byte_rate=midiport.SYSEX_RATE, index=0):
+        """
+        Streams a SysEx dump by the port thread, message by message,
+        paced at byte_rate, and after the time critical messages
+        Returns the PacedJob object
+        Raises ValueError when the dump is not valid
+        from MidiDriver object
+        """
+
+        packets = midiport.split_sysex(data)
+        self.enable_ports()
+        self._check_port(index)
+
+        return self.ports[index].submit(midiport.PacedJob(packets, byte_rate))
+
+    #----------------------------------------
+
+    def _check_port(self, index):
+        if not 0 <= index < max(1, len(self.ports)):
+            raise ValueError(f"Invalid port index: {index}")
+
+    #----------------------------------------
+
+    def route_channel(self, channel, index):
+        """ sends the messages of channel to the port at index """
+        self._check_port(index)
+        self.channel_routes[channel & 0x0F] = index
+
+    #----------------------------------------
+
+    def route_track(self, track, index=None):
+        """
+        sends the events of track to the port at index,
+        or by channel if index is None
+        """
+
+        if index is None:
+            self.track_routes.pop(track, None)
+            return
+        self._check_port(index)
+        self.track_routes[track] = index
+
+    #----------------------------------------
+
+    def stop_ports(self):
+        """ stops the port threads, and closes the other ports """
+        ports = self.ports
+        self.ports = []
+        for port in ports:
+            port.stop()
+            if port.midiout is not self.midiout:
+                port.close_port()
+        self.channel_routes = array('B', bytes(16))
+        self.track_routes = {}
+        with self.engine_lock:
+            self.active_notes = [set()]
+            self.sent_state = [[None] * STATE_SIZE]
+
+    #----------------------------------------
+
+    def panic(self, byte_rate=midiport.PANIC_RATE):
         """ 
         Send all_sound_off event, and reset all controllers events on all channels
         Retrieve from (panic.py) example, from Rtmidi Library
+        The messages are sent by the port threads, as a paced job by port,
+        ahead of their waiting jobs and between the messages of a SysEx dump,
+        or by a thread of the job, when the ports are not enabled,
+        so the caller does not wait
+        Returns a JobGroup object, for waiting the end of the panic,
+        or None without output port
         from MidiDriver object
         """
 
@@ -110,14 +780,30 @@ class MidiDriver(object):
         # all_notes_off = 0x7B
         """
 
-
-        
-        if self.midiout is None: return
-        for channel in range(16):
-            self.midiout.send_message([CONTROL_CHANGE | channel, ALL_SOUND_OFF, 0])
-            self.midiout.send_message([CONTROL_CHANGE | channel, RESET_ALL_CONTROLLERS, 0])
-            time.sleep(0.01)
-        
+        if self.midiout is None: return None
+        with self.engine_lock:
+            self.active_notes = [set() for notes in self.active_notes]
+            # the values after the reset are not known, the next chase sends them all
+            self.sent_state = [[None] * STATE_SIZE for state in self.sent_state]
+            msgs = []
+            for channel in range(16):
+                msgs.append(bytes((CONTROL_CHANGE | channel, ALL_SOUND_OFF, 0)))
+                msgs.append(bytes((CONTROL_CHANGE | channel, RESET_ALL_CONTROLLERS, 0)))
+            if self.capture is not None:
+                for msg in msgs:
+                    self._capture(msg)
+        # all the output ports, without enabling the port threads,
+        # which would keep polling after the panic
+        if not self.ports:
+            job = midiport.PacedJob(msgs, byte_rate, drain=1)
+            self._job_threads = [thread for thread in self._job_threads if thread.is_alive()]
+            self._job_threads.append(midiport.start_job(job, self.midiout, self.clock))
+            return midiport.JobGroup([job])
+        # the panic goes before the jobs waiting on the ports, SysEx dumps included
+        jobs = [port.submit(midiport.PacedJob(msgs, byte_rate, drain=1), first=1)
+                for port in self.ports if port.midiout is not None]
+
+        return midiport.JobGroup(jobs)
 
     #----------------------------------------
 
@@ -127,7 +813,7 @@ class MidiDriver(object):
         if self._running: return
         if self._thread is not None: return
         self._running =1
-        self._thread = threading.Thread(target=self._run, args=())
+        self._thread = threading.Thread(target=self._run, args=(), name="midi_engine")
         self._thread.daemon = True
         self._thread.start()
         beep()
@@ -160,6 +846,17 @@ class MidiDriver(object):
         self._proc_cback = proc_cback
 
     #----------------------------------------
+
+    def dump_trace(self, filename=miditrace.TRACE_FILE):
+        """
+        Dumps the trace ring as Chrome trace event JSON,
+        and returns the number of trace events
+        """
+
+        if self.trace is None: return 0
+        return self.trace.dump(filename)
+
+    #----------------------------------------
     
     def _run(self):
         """
@@ -174,12 +871,28 @@ class MidiDriver(object):
         # be written to output
         if self._proc_cback is None: return
         _delay_ms = self._delay_ms
+        _sleep = self.clock.sleep
+        _sleep_us = int(_delay_ms * 1e6)
+        _perf_counter = time.perf_counter
+        engine_lock = self.engine_lock
         print(f"voici delay_ms: {_delay_ms:.3f} msec.")
         try:
             while self._running:
-                self._proc_cback(self._frames, self._bufsize)
+                trace = self.trace
+                metrics = self.metrics
+                if trace is not None:
+                    trace.record(TR_CALLBACK_START, self._frames)
+                if metrics is not None:
+                    start = _perf_counter()
+                with engine_lock:
+                    self._proc_cback(self._frames, self._bufsize)
+                if metrics is not None:
+                    metrics.add_callback(_perf_counter() - start)
+                if trace is not None:
+                    trace.record(TR_CALLBACK_END)
+                    trace.record(TR_SLEEP, _sleep_us)
                 # Saving CPU time
-                time.sleep(_delay_ms)
+                _sleep(_delay_ms)
                 # beep()
         except KeyboardInterrupt:
             # log.debug("KeyboardInterrupt / INT signal received.")
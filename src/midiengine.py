@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+    File: midiengine.py
+    Scheduling engines for MiniSeq, and engines registry.
+    All engines play the sequence and the click track of the MainApp object,
+    through its MidiDriver object.
+    Date: Mon, 19/10/2026
+    Author: Coolbrother
+"""
+import midilog
+from midilog import log
+from miditrace import (TR_EVENT_POP, TR_HEAP_SIZE)
+
+DEFAULT_ENGINE = "frame"
+_engines = {}
+
+def beep():
+    print("\a\n")
+
+#----------------------------------------
+
+class BaseEngine(object):
+    """
+    Base scheduling engine
+    process is the MidiDriver callback
+    """
+    name = ""
+    description = ""
+
+    def __init__(self, app):
+        self.app = app
+
+    #----------------------------------------
+
+    def reset(self):
+        """ reset the engine state, when stopping """
+        pass
+
+    #----------------------------------------
+
+    def set_pos(self, tick):
+        """ sets the engine at tick, when playing """
+        pass
+
+    #----------------------------------------
+
+    def process(self, frames, bufsize):
+        """ sends the events of a callback """
+        pass
+
+    #----------------------------------------
+
+#========================================
+
+class TickEngine(BaseEngine):
+    """
+    Tick stepping engine, formerly midi_process0
+    Steps the ticks due since the last callback, at the clock time,
+    so it returns at each callback, like the frame engine
+    """
+    name = "tick"
+    description = "tick stepping, the ticks due at each callback"
+
+    def __init__(self, app):
+        BaseEngine.__init__(self, app)
+        self.reset()
+
+    #----------------------------------------
+
+    def reset(self):
+        # clock time of the next tick, None to start at the next callback
+        self._next_time = None
+        # tick of the click track
+        self._tickcount =0
+
+    #----------------------------------------
+
+    def set_pos(self, tick):
+        # the ticks restart from the next callback
+        self._next_time = None
+
+    #----------------------------------------
+
+    def process(self, nbframes, bufsize):
+        """
+        Processing midi callback
+        Sends the events of the ticks due until the current time,
+        the next ticks being sent by the next callbacks
+        Note: the sequence and the click track are already sorted,
+        so the due events are read in place, without intermediate lists
+        """
+
+        app = self.app
+        if app._seq is None: return
+        seq = app._seq
+        driver = app._driver
+        send_imm = driver.send_imm
+        debug = midilog.is_debug()
+        trace = driver.trace
+        metrics = driver.metrics
+        if not app._clicking: self._tickcount =0
+        if not app._playing and not app._clicking:
+            self._next_time = None
+            return
+        curtime = driver.clock.time()
+        next_time = self._next_time
+        if next_time is None: next_time = curtime
+        tickcount = self._tickcount
+
+        # beep()
+        while next_time <= curtime:
+            if app._playing and seq.curtick > seq.len:
+                app._playing =0
+                beep()
+                if not app._clicking: break
+            count =0
+
+            if debug: log.debug("seq.curtick: %d", seq.curtick)
+            # Send the sequence events due for this tick
+            if app._playing:
+                while 1:
+                    evt = seq.peek_event()
+                    if evt is None or evt.tick > seq.curtick: break
+                    seq.next_event()
+                    if trace is not None: trace.record(TR_EVENT_POP, evt.tick)
+                    send_imm(evt.message, evt.track)
+                    if metrics is not None:
+                        metrics.add_error(app.get_timing_error(evt.tick))
+                    count +=1
+
+            # Send the click events due for this tick
+            if app._clicking:
+                click_track = app.click_track
+                while 1:
+                    evt = click_track.get_ev_roll()
+                    if evt is None or evt.tick > tickcount: break
+                    click_track.next_ev()
+                    send_imm(evt.message)
+                    count +=1
+
+            # number of events sent in this tick
+            if trace is not None and count:
+                trace.record(TR_HEAP_SIZE, count)
+
+            if app._clicking: tickcount +=1
+            if app._playing: seq.curtick +=1
+            # the time of the next tick, at the current tempo
+            next_time += seq._tickms
+
+        self._next_time = next_time
+        self._tickcount = tickcount
+        if metrics is not None:
+            metrics.set_pending_events(len(seq.queue) - seq._index)
+
+    #----------------------------------------
+
+#========================================
+
+class FrameEngine(BaseEngine):
+    """
+    Frame offset engine, formerly midi_process
+    Sends the events of one block of frames by callback,
+    counting the time between events as a frames offset
+    """
+    name = "frame"
+    description = "frame offset, sending the events of one block by callback"
+    # frames by block, and sample rate for the offset
+    frames = 240
+    rate = 24000
+
+    def __init__(self, app):
+        BaseEngine.__init__(self, app)
+        self.reset()
+
+    #----------------------------------------
+
+    def reset(self):
+        self.offset =0
+        self.proccount =0
+        # event waiting for the next block
+        self.evt = None
+        # tick and track of the last event returned by next_midi_ev
+        self._last_tick =0
+        self._track = -1
+        self._debug =0
+
+    #----------------------------------------
+
+    def set_pos(self, tick):
+        # the held event and its offset are from the old position
+        self.evt = None
+        self.offset =0
+        self._last_tick = tick
+
+    #----------------------------------------
+
+    def next_midi_ev(self):
+        """
+        Returns next Midi event between seq event or click event.
+        Note: the sequence and the click track are already sorted,
+        so the next event is the earliest of their current events
+        """
+
+        app = self.app
+        if app._seq is None: return
+        seq = app._seq
+        seq_evt = seq.peek_event() if app._playing else None
+        click_evt = app.click_track.get_ev_roll() if app._clicking else None
+        if click_evt is None:
+            if seq_evt is None: return
+            evt = seq.next_event()
+        elif seq_evt is not None and seq_evt.tick <= click_evt.tick:
+            evt = seq.next_event()
+        else:
+            evt = click_evt
+            app.click_track.next_ev()
+        if self._debug:
+            log.debug("From Next_midi_ev func, returning tick: %d, id: %d,\nMessage: %s", evt.tick, evt.id, evt.message)
+        if evt is seq_evt:
+            trace = app._driver.trace
+            if trace is not None: trace.record(TR_EVENT_POP, evt.tick)
+            self._track = evt.track
+        else:
+            # no track routing for the clicks
+            self._track = -1
+
+        return evt
+
+    #----------------------------------------
+
+    def process(self, frames, bufsize):
+        app = self.app
+        event_count =0
+        frames = self.frames
+        self.proccount +=1
+        proccount = self.proccount
+        offset = self.offset
+        evt = self.evt
+        self._debug = debug = midilog.is_debug()
+        if debug:
+            log.debug("[Enter In midi_process Func], frames: %d, proccount: %d, offset: %d, Tickms: %s",
+                    frames, proccount, offset, app._seq._tickms)
+        while True:
+            # beep()
+            if not app._playing: break
+            if offset >= frames:
+                offset -= frames
+                if debug: log.debug("[Before returning, proccount]: %d, Offset Dec: %d\n", proccount, offset)
+                break  # We'll take care of this in the next block ...
+            # Note: This may raise an exception:
+            # Sample offset of the current block midi Data in the current process
+            # But, offset can be 0 too, it works???
+
+            # port.write_midi_event(offset, msg.bytes())
+            if evt:
+                if debug:
+                    log.debug("[Before Write Midi Event]: proccount: %d, Offset: %d,\nMessage: %s, tick: %d, id: %d, event_count: %d\n",
+                            proccount, offset, evt.message, evt.tick, evt.id, event_count)
+                app._driver.send_imm(evt.message, self._track)
+                if app._driver.metrics is not None:
+                    app._driver.metrics.add_error(app.get_timing_error(evt.tick))
+                # End of song, like in the tick engine
+                seq = app._seq
+                if evt.tick >= seq.len and seq._index >= len(seq.queue):
+                    app._playing =0
+                    evt = None
+                    beep()
+                    break
+                evt = None
+            evt = self.next_midi_ev()
+
+            # print(f"Offset: {offset}, msg_time: {msg.time}")
+            if evt:
+                # Note: the delta is taken from the last returned event,
+                # which can be a seq event or a click event
+                deltick = evt.tick - self._last_tick
+                self._last_tick = evt.tick
+                msg_time = deltick * app._seq._tickms
+                if debug:
+                    log.debug("[Before Offset Inc]: Offset: %d, tick: %d, deltick: %d, id: %d,\nmsg_time: %s, Message: %s",
+                            offset, evt.tick, deltick, evt.id, msg_time, evt.message)
+                offset += round(msg_time * self.rate)
+                if debug:
+                    log.debug("[After Offset Inc]: proccount: %d, Offset: %d, evt.tick: %d, evt.deltick: %d\n",
+                            proccount, offset, evt.tick, deltick)
+                event_count +=1
+
+        self.offset = offset
+        self.evt = evt
+        metrics = app._driver.metrics
+        if metrics is not None and app._seq is not None:
+            metrics.set_pending_events(len(app._seq.queue) - app._seq._index)
+
+    #----------------------------------------
+
+#========================================
+
+def register_engine(engine_class, name=None):
+    """
+    Registers an engine class, by its name
+    """
+
+    _engines[name or engine_class.name] = engine_class
+
+#----------------------------------------
+
+def get_engine_names():
+    return list(_engines)
+
+#----------------------------------------
+
+def get_engine_class(name):
+    return _engines.get(name)
+
+#----------------------------------------
+
+def create_engine(name, app):
+    """
+    Returns a new engine object for app, or None if name is not registered
+    """
+
+    engine_class = _engines.get(name)
+    if engine_class is None: return
+    return engine_class(app)
+
+#----------------------------------------
+
+register_engine(FrameEngine)
+register_engine(TickEngine)
+
+#----------------------------------------
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+    File: midiexport.py
+    Export of the sequencer events to Apache Arrow and Parquet, for MiniSeq.
+    The events are converted once to typed columns (array module),
+    which are given to Arrow without copy, as record batches,
+    Arrow IPC files or Parquet files.
+    Note: pyarrow is an optional dependency, imported when exporting
+    Date: Mon, 19/10/2026
+    Author: Coolbrother
+"""
+from array import array
+
+# column names, in the order of the schema
+COLUMNS = ("tick", "seconds", "track", "channel", "type", "data1", "data2", "duration")
+BATCH_SIZE = 1 << 20
+# values of the missing fields in the columns, nulls in Arrow
+NO_CHANNEL = 0xFF
+NO_DURATION = -1
+_NOTE_OFF = 0x80
+_NOTE_ON = 0x90
+
+#----------------------------------------
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+    except ImportError as exc:
+        raise ImportError("Arrow and Parquet export needs the pyarrow module: "
+                "pip install pyarrow") from exc
+
+    return pyarrow
+
+#----------------------------------------
+
+def get_columns(seq):
+    """
+    Returns the events of a MidiSequencer object as a dict of typed arrays,
+    with the COLUMNS names
+    channel is NO_CHANNEL for the system messages,
+    duration is the length in ticks of the notes, NO_DURATION for the others
+    """
+
+    queue = seq.queue
+    ticks = array('q', [evt.tick for evt in queue])
+    tracks = array('H', [evt.track for evt in queue])
+    messages = [evt.message for evt in queue]
+    statuses = [msg[0] for msg in messages]
+    channels = array('B', [st & 0x0F if st < 0xF0 else NO_CHANNEL for st in statuses])
+    types = array('B', [st & 0xF0 if st < 0xF0 else st for st in statuses])
+    # the data bytes of the channel messages only, not of the sysex
+    data1 = array('B', [msg[1] if st < 0xF0 and len(msg) > 1 else 0
+        for (st, msg) in zip(statuses, messages)])
+    data2 = array('B', [msg[2] if st < 0xF0 and len(msg) > 2 else 0
+        for (st, msg) in zip(statuses, messages)])
+
+    return {
+            "tick": ticks,
+            "seconds": get_seconds(seq, ticks),
+            "track": tracks,
+            "channel": channels,
+            "type": types,
+            "data1": data1,
+            "data2": data2,
+            "duration": get_durations(ticks, channels, types, data1, data2),
+            }
+
+#----------------------------------------
+
+def get_seconds(seq, ticks):
+    """
+    Returns the time in sec of the sorted ticks, from the tempo map of seq
+    """
+
+    seconds = array('d', bytes(8 * len(ticks)))
+    ppqn = seq.ppqn
+    # the tempo segments: (start tick, start sec, sec by tick)
+    segments = []
+    (seg_tick, seg_sec, bpm) = (0, 0., seq._init_bpm)
+    for (tick, new_bpm) in seq.tempo_map:
+        if tick > seg_tick:
+            segments.append((seg_tick, seg_sec, 60. / (bpm * ppqn)))
+            seg_sec += (tick - seg_tick) * 60. / (bpm * ppqn)
+            seg_tick = tick
+        bpm = new_bpm
+    segments.append((seg_tick, seg_sec, 60. / (bpm * ppqn)))
+
+    index =0
+    (seg_tick, seg_sec, sec_per_tick) = segments[0]
+    next_tick = segments[1][0] if len(segments) > 1 else None
+    for (i, tick) in enumerate(ticks):
+        while next_tick is not None and tick >= next_tick:
+            index +=1
+            (seg_tick, seg_sec, sec_per_tick) = segments[index]
+            next_tick = segments[index +1][0] if index +1 < len(segments) else None
+        seconds[i] = seg_sec + (tick - seg_tick) * sec_per_tick
+
+    return seconds
+
+#----------------------------------------
+
+def get_durations(ticks, channels, types, data1, data2):
+    """
+    Returns the duration in ticks of the note on events,
+    the first note on being ended by the first note off, by channel and note
+    NO_DURATION for the other events, and the notes not ended
+    """
+
+    durations = array('q', [NO_DURATION]) * len(ticks)
+    pending = {}
+    for (i, typ) in enumerate(types):
+        if typ != _NOTE_ON and typ != _NOTE_OFF: continue
+        key = (channels[i] << 7) | data1[i]
+        if typ == _NOTE_ON and data2[i]:
+            starts = pending.get(key)
+            if starts is None: pending[key] = [i]
+            else: starts.append(i)
+        else:
+            starts = pending.get(key)
+            if starts:
+                start = starts.pop(0)
+                durations[start] = ticks[i] - ticks[start]
+
+    return durations
+
+#----------------------------------------
+
+def to_table(seq, columns=None):
+    """
+    Returns the events of seq as a pyarrow Table
+    The Arrow arrays use the buffers of the columns, without copy,
+    except the columns with nulls
+    columns: the result of get_columns, if already done
+    """
+
+    pa = _import_pyarrow()
+    import pyarrow.compute as pc
+    if columns is None: columns = get_columns(seq)
+    types = {
+            "tick": pa.int64(),
+            "seconds": pa.float64(),
+            "track": pa.uint16(),
+            "channel": pa.uint8(),
+            "type": pa.uint8(),
+            "data1": pa.uint8(),
+            "data2": pa.uint8(),
+            "duration": pa.int64(),
+            }
+    nulls = {"channel": NO_CHANNEL, "duration": NO_DURATION}
+    arrays = []
+    for name in COLUMNS:
+        col = columns[name]
+        arr = pa.Array.from_buffers(types[name], len(col), [None, pa.py_buffer(col)])
+        if name in nulls:
+            missing = pc.equal(arr, nulls[name])
+            if pc.any(missing).as_py():
+                arr = pc.if_else(missing, pa.scalar(None, types[name]), arr)
+        arrays.append(arr)
+    metadata = {"ppqn": str(seq.ppqn), "bpm": str(seq._init_bpm)}
+
+    return pa.Table.from_arrays(arrays, names=list(COLUMNS), metadata=metadata)
+
+#----------------------------------------
+
+def to_batches(seq, batch_size=BATCH_SIZE):
+    """
+    Returns the events of seq as a list of pyarrow RecordBatch objects,
+    of batch_size rows at most, sharing the buffers of the table
+    """
+
+    return to_table(seq).to_batches(max_chunksize=batch_size)
+
+#----------------------------------------
+
+def write_arrow(seq, filename, batch_size=BATCH_SIZE):
+    """
+    Writes the events of seq as an Arrow IPC file (Feather v2)
+    Returns the number of rows
+    """
+
+    pa = _import_pyarrow()
+    table = to_table(seq)
+    with pa.OSFile(filename, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table, max_chunksize=batch_size)
+
+    return table.num_rows
+
+#----------------------------------------
+
+def write_parquet(seq, filename, compression="zstd", row_group_size=BATCH_SIZE):
+    """
+    Writes the events of seq as a Parquet file
+    Returns the number of rows
+    """
+
+    _import_pyarrow()
+    import pyarrow.parquet as pq
+    table = to_table(seq)
+    pq.write_table(table, filename, compression=compression, row_group_size=row_group_size)
+
+    return table.num_rows
+
+#----------------------------------------
+
+def export_file(seq, filename):
+    """
+    Writes the events of seq to filename, as Parquet for the .parquet extension,
+    Arrow IPC otherwise
+    Returns the number of rows
+    """
+
+    if filename.lower().endswith((".parquet", ".pq")):
+        return write_parquet(seq, filename)
+
+    return write_arrow(seq, filename)
+
+#----------------------------------------
@@ -0,0 +1,711 @@
+#!/usr/bin/env python3
+"""
+    File: midifile.py
+    Standard Midi File reader and writer for MiniSeq, format 0 and 1.
+    The file is mapped in memory, and each track chunk is decoded
+    from a memoryview into columns of ticks and messages,
+    which are loaded through the sequencer bulk path.
+    The tracks of format 1 files can be decoded by a pool of processes,
+    returning their columns through shared memory.
+    The writer streams the events to the file, with running status,
+    and patches the track lengths at the end of each track.
+    Date: Mon, 19/10/2026
+    Author: Coolbrother
+"""
+import mmap
+import os
+import struct
+from array import array
+# Note: concurrent.futures and multiprocessing are imported by the parallel decoding only
+
+# default tempo of Standard Midi Files, in beats per minute
+SMF_BPM = 120.
+# size of the writer buffer, before flushing to the file
+_BUFSIZE = 65536
+# file size from which the tracks of a format 1 file are decoded by processes,
+# under it, starting the pool costs more than the decoding
+PARALLEL_MIN_SIZE = 1 << 20
+# track numbers under which the writer keeps the chunk of a track
+# at its number, with empty chunks, like for a conductor track
+MAX_TRACK_GAP = 256
+
+#----------------------------------------
+
+class MidiFileError(Exception):
+    """ invalid or unsupported Midi file """
+    pass
+
+#========================================
+
+def decode_track(data, start, end, msg_cache=None):
+    """
+    Decodes the events of a track chunk, from data[start:end]
+    Returns the columns (ticks, messages, tempos),
+    ticks is an array of absolute ticks, messages a list of bytes,
+    tempos a list of (tick, bpm) tuples
+    Note: identical channel messages share the same bytes object, from msg_cache
+    """
+
+    ticks = array('l')
+    messages = []
+    tempos = []
+    add_tick = ticks.append
+    add_msg = messages.append
+    cache = {} if msg_cache is None else msg_cache
+    get_msg = cache.get
+    pos = start
+    tick =0
+    status =0
+    try:
+        while pos < end:
+            # delta time, variable length quantity
+            byte = data[pos]
+            pos +=1
+            val = byte & 0x7F
+            while byte & 0x80:
+                byte = data[pos]
+                pos +=1
+                val = (val << 7) | (byte & 0x7F)
+            tick += val
+
+            byte = data[pos]
+            if byte & 0x80:
+                pos +=1
+                if byte < 0xF0: status = byte
+            elif status:
+                # running status
+                byte = status
+            else:
+                raise MidiFileError(f"Data byte without status, at offset: {pos}")
+
+            if byte < 0xF0:
+                kind = byte & 0xF0
+                if kind == 0xC0 or kind == 0xD0:
+                    data1 = data[pos]
+                    pos +=1
+                    key = (byte << 8) | data1
+                    msg = get_msg(key)
+                    if msg is None:
+                        msg = cache[key] = bytes((byte, data1))
+                else:
+                    data1 = data[pos]
+                    data2 = data[pos +1]
+                    pos +=2
+                    key = (byte << 16) | (data1 << 8) | data2
+                    msg = get_msg(key)
+                    if msg is None:
+                        msg = cache[key] = bytes((byte, data1, data2))
+                add_tick(tick)
+                add_msg(msg)
+
+            elif byte == 0xFF:
+                # meta event
+                mtype = data[pos]
+                pos +=1
+                byte = data[pos]
+                pos +=1
+                length = byte & 0x7F
+                while byte & 0x80:
+                    byte = data[pos]
+                    pos +=1
+                    length = (length << 7) | (byte & 0x7F)
+                if mtype == 0x51 and length == 3:
+                    usec = (data[pos] << 16) | (data[pos +1] << 8) | data[pos +2]
+                    if usec: tempos.append((tick, 60000000. / usec))
+                elif mtype == 0x2F:
+                    break # end of track
+                pos += length
+
+            elif byte == 0xF0 or byte == 0xF7:
+                # sysex, or escaped bytes for 0xF7
+                val = data[pos]
+                pos +=1
+                length = val & 0x7F
+                while val & 0x80:
+                    val = data[pos]
+                    pos +=1
+                    length = (length << 7) | (val & 0x7F)
+                if pos + length > end:
+                    raise MidiFileError(f"Sysex beyond the end of track, at offset: {pos}")
+                if byte == 0xF0:
+                    msg = b'\xF0' + bytes(data[pos:pos + length])
+                else:
+                    msg = bytes(data[pos:pos + length])
+                pos += length
+                add_tick(tick)
+                add_msg(msg)
+
+            else:
+                raise MidiFileError(f"Invalid status: {byte:#x}, at offset: {pos}")
+
+    except IndexError:
+        raise MidiFileError(f"Truncated track, at offset: {pos}") from None
+
+    return (ticks, messages, tempos)
+
+#----------------------------------------
+
+class MidiFile(object):
+    """
+    Standard Midi File, decoded as columns by track
+    """
+    def __init__(self, filename=None):
+        self.filename = filename
+        self.format =0
+        self.ppqn =120
+        # list of (ticks, messages) columns, by track
+        self.tracks = []
+        # list of (tick, bpm) tuples, from all the tracks
+        self.tempo_map = []
+        # list of (offset, length) of the track chunks data, in the file
+        self.chunks = []
+
+    #----------------------------------------
+
+    def __len__(self):
+        return sum(len(messages) for (ticks, messages) in self.tracks)
+
+    #----------------------------------------
+
+    def read(self, filename=None, workers=0):
+        """
+        Reads the file, mapping it in memory
+        workers is the number of processes for decoding the tracks,
+        0 for decoding in this process
+        Note: the processes are used only for format 1 files with several tracks,
+        from PARALLEL_MIN_SIZE bytes
+        from MidiFile object
+        """
+
+        if filename: self.filename = filename
+        with open(self.filename, "rb") as fh:
+            try:
+                mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # empty file, cannot be mapped
+                raise MidiFileError(f"Empty file: {self.filename}") from None
+            try:
+                with memoryview(mm) as data:
+                    (ntracks, size) = self.read_header(data)
+                    parallel = (workers > 1 and self.format == 1
+                            and len(self.chunks) > 1 and size >= PARALLEL_MIN_SIZE)
+                    if not parallel:
+                        self.read_data(data)
+            finally:
+                mm.close()
+        if parallel:
+            self.read_parallel(ntracks, workers)
+
+        return self
+
+    #----------------------------------------
+
+    def read_parallel(self, ntracks, workers):
+        """
+        Decodes the track chunks in a pool of processes,
+        each one mapping the file, and returning its columns in shared memory
+        from MidiFile object
+        """
+
+        self.tracks = []
+        self.tempo_map = []
+        if len(self.chunks) != ntracks:
+            raise MidiFileError(f"Found {len(self.chunks)} tracks, expected: {ntracks}")
+        if not self.chunks: return
+        workers = min(workers, len(self.chunks))
+        # the biggest tracks first, for balancing the workers
+        order = sorted(range(len(self.chunks)), key=lambda i: -self.chunks[i][1])
+        results = [None] * len(self.chunks)
+        futures = []
+        from concurrent.futures import ProcessPoolExecutor
+        from multiprocessing import resource_tracker
+        # the workers share the tracker of this process, otherwise their trackers
+        # would remove the shared memory blocks when they exit
+        resource_tracker.ensure_running()
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                for index in order:
+                    futures.append(executor.submit(_decode_chunk, self.filename, *self.chunks[index]))
+                for (index, future) in zip(order, futures):
+                    results[index] = future.result()
+        except BaseException:
+            # removes the shared memory of the decoded tracks
+            for future in futures:
+                if future.done() and not future.cancelled() and future.exception() is None:
+                    _read_shared(*future.result()[:4])
+            raise
+
+        msg_cache = {}
+        for (name, nb_events, nb_msgs, blob_size, tempos) in results:
+            self.tracks.append(_read_shared(name, nb_events, nb_msgs, blob_size, msg_cache))
+            self.tempo_map.extend(tempos)
+        self.tempo_map.sort()
+
+    #----------------------------------------
+
+    def read_data(self, data):
+        """
+        Reads the header and the track chunks, from a bytes like object
+        from MidiFile object
+        """
+
+        (ntracks, size) = self.read_header(data)
+        self.tracks = []
+        self.tempo_map = []
+        tempo_map = self.tempo_map
+        msg_cache = {}
+        for (offset, length) in self.chunks:
+            (ticks, messages, tempos) = decode_track(data, offset, offset + length, msg_cache)
+            self.tracks.append((ticks, messages))
+            tempo_map.extend(tempos)
+        if len(self.tracks) != ntracks:
+            raise MidiFileError(f"Found {len(self.tracks)} tracks, expected: {ntracks}")
+        tempo_map.sort()
+
+    #----------------------------------------
+
+    def read_header(self, data):
+        """
+        Reads the header, and the offsets of the track chunks
+        Returns (ntracks, size)
+        from MidiFile object
+        """
+
+        size = len(data)
+        if size < 14 or bytes(data[0:4]) != b"MThd":
+            raise MidiFileError("Not a Standard Midi File")
+        (length, fmt, ntracks, division) = struct.unpack_from(">LHHH", data, 4)
+        if fmt > 1:
+            raise MidiFileError(f"Unsupported Midi file format: {fmt}")
+        if division & 0x8000:
+            raise MidiFileError("Unsupported SMPTE time division")
+        self.format = fmt
+        self.ppqn = division
+        self.chunks = []
+        pos = 8 + length
+        while pos + 8 <= size:
+            ctype = bytes(data[pos:pos +4])
+            (length,) = struct.unpack_from(">L", data, pos +4)
+            pos += 8
+            if ctype == b"MTrk":
+                # truncated last chunk is decoded until the end of file
+                self.chunks.append((pos, min(length, size - pos)))
+            # unknown chunks are skipped
+            pos += length
+
+        return (ntracks, size)
+
+    #----------------------------------------
+
+    def to_seq(self, seq):
+        """
+        Loads the tracks into a MidiSequencer object, through the bulk path
+        The sequencer gets the resolution and the tempo map of the file
+        """
+
+        seq.clear_events()
+        seq.set_ppqn(self.ppqn)
+        seq._init_bpm = SMF_BPM
+        seq.bpm = SMF_BPM
+        if len(self.tracks) == 1:
+            (ticks, messages) = self.tracks[0]
+            seq.add_events(ticks, messages)
+        elif self.tracks:
+            seq.add_events(*merge_tracks(self.tracks))
+        seq.set_tempo_map(self.tempo_map)
+        seq.update_pos()
+
+        return seq
+
+    #----------------------------------------
+
+#========================================
+
+def get_workers(max_workers=8):
+    """ returns the number of processes for decoding, 0 on a single core """
+    count = min(os.cpu_count() or 1, max_workers)
+    return count if count > 1 else 0
+
+#----------------------------------------
+
+def merge_tracks(tracks):
+    """
+    Returns the columns (ticks, messages, tracks) of all the tracks, concatenated
+    Note: add_events sorts them with a stable sort, which merges the sorted
+    runs of the tracks, keeping the track order for equal ticks.
+    It is faster than a k-way merge with heapq, one tuple by event
+    """
+
+    all_ticks = array('l')
+    all_messages = []
+    all_tracks = array('H')
+    for (track, (ticks, messages)) in enumerate(tracks):
+        all_ticks.extend(ticks)
+        all_messages.extend(messages)
+        all_tracks.extend(array('H', [track]) * len(ticks))
+
+    return (all_ticks, all_messages, all_tracks)
+
+#----------------------------------------
+
+def _pack_messages(messages):
+    """
+    Returns the messages as (indexes, offsets, blob) columns of unique messages
+    """
+
+    msg_index = array('I')
+    offsets = array('Q', [0])
+    blob = bytearray()
+    indexes = {}
+    add_index = msg_index.append
+    for msg in messages:
+        index = indexes.get(msg)
+        if index is None:
+            index = indexes[msg] = len(indexes)
+            blob += msg
+            offsets.append(len(blob))
+        add_index(index)
+
+    return (msg_index, offsets, blob)
+
+#----------------------------------------
+
+def _decode_chunk(filename, offset, length):
+    """
+    Pool worker, decodes a track chunk of the mapped file,
+    and returns its columns in a new shared memory block,
+    as (name, nb_events, nb_msgs, blob_size, tempos)
+    """
+
+    with open(filename, "rb") as fh:
+        mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            with memoryview(mm) as data:
+                (ticks, messages, tempos) = decode_track(data, offset, offset + length)
+        finally:
+            mm.close()
+
+    from multiprocessing import shared_memory
+    (msg_index, offsets, blob) = _pack_messages(messages)
+    columns = (ticks.tobytes(), msg_index.tobytes(), offsets.tobytes(), blob)
+    shm = shared_memory.SharedMemory(create=True, size=max(1, sum(map(len, columns))))
+    try:
+        pos =0
+        for data in columns:
+            shm.buf[pos:pos + len(data)] = data
+            pos += len(data)
+        name = shm.name
+    finally:
+        shm.close()
+
+    return (name, len(ticks), len(offsets) -1, len(blob), tempos)
+
+#----------------------------------------
+
+def _read_shared(name, nb_events, nb_msgs, blob_size, msg_cache=None):
+    """
+    Returns the (ticks, messages) columns of a track from shared memory,
+    and removes the shared memory block
+    """
+
+    from multiprocessing import shared_memory
+    cache = {} if msg_cache is None else msg_cache
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        buf = shm.buf
+        ticks = array('l')
+        msg_index = array('I')
+        offsets = array('Q')
+        pos =0
+        for (arr, count) in ((ticks, nb_events), (msg_index, nb_events), (offsets, nb_msgs +1)):
+            end = pos + count * arr.itemsize
+            arr.frombytes(buf[pos:end])
+            pos = end
+        blob = bytes(buf[pos:pos + blob_size])
+        del buf
+    finally:
+        shm.close()
+        shm.unlink()
+
+    # unique messages, shared with the other tracks
+    msgs = []
+    for index in range(nb_msgs):
+        msg = blob[offsets[index]:offsets[index +1]]
+        msgs.append(cache.setdefault(msg, msg))
+    messages = list(map(msgs.__getitem__, msg_index))
+
+    return (ticks, messages)
+
+#----------------------------------------
+
+def load_midi_file(seq, filename, workers=0):
+    """
+    Reads a Midi file, and loads it into a MidiSequencer object
+    workers is the number of processes for decoding the tracks
+    Returns the MidiFile object
+    """
+
+    mf = MidiFile(filename).read(workers=workers)
+    mf.to_seq(seq)
+
+    return mf
+
+#----------------------------------------
+
+def encode_vlq(val):
+    """ returns a variable length quantity, as bytes """
+    if val < 0x80: return bytes((val,))
+    out = bytearray((val & 0x7F,))
+    val >>= 7
+    while val:
+        out.append((val & 0x7F) | 0x80)
+        val >>= 7
+    out.reverse()
+
+    return bytes(out)
+
+#----------------------------------------
+
+class MidiFileWriter(object):
+    """
+    Streaming Standard Midi File writer
+    The events are written track by track, in tick order,
+    the track length is patched when the track is ended
+    """
+    def __init__(self, filename, fmt=1, ppqn=120):
+        self.filename = filename
+        self.format = fmt
+        self.ppqn = ppqn
+        self.ntracks =0
+        self._fh = None
+        self._buf = bytearray()
+        self._track_pos =0 # file position of the track length field
+        self._track_len =0
+        self._last_tick =0
+        self._status =0
+        self._in_track =0
+
+    #----------------------------------------
+
+    def open(self):
+        """ opens the file, and writes the header """
+        self._fh = open(self.filename, "wb")
+        # the number of tracks is patched by close
+        self._fh.write(b"MThd" + struct.pack(">LHHH", 6, self.format, 0, self.ppqn))
+        self.ntracks =0
+
+        return self
+
+    #----------------------------------------
+
+    def close(self):
+        """ ends the current track, patches the number of tracks, and closes the file """
+        if self._fh is None: return
+        try:
+            if self._in_track: self.end_track()
+            self._fh.seek(10)
+            self._fh.write(struct.pack(">H", self.ntracks))
+        finally:
+            self._fh.close()
+            self._fh = None
+
+    #----------------------------------------
+
+    def __enter__(self):
+        return self.open()
+
+    #----------------------------------------
+
+    def __exit__(self, *args):
+        self.close()
+
+    #----------------------------------------
+
+    def _flush(self):
+        self._fh.write(self._buf)
+        self._track_len += len(self._buf)
+        self._buf.clear()
+
+    #----------------------------------------
+
+    def begin_track(self):
+        """ starts a new track chunk, with a length to patch """
+        if self._in_track: self.end_track()
+        fh = self._fh
+        fh.write(b"MTrk")
+        self._track_pos = fh.tell()
+        fh.write(b"\0\0\0\0")
+        self._track_len =0
+        self._last_tick =0
+        self._status =0
+        self._in_track =1
+        self.ntracks +=1
+
+    #----------------------------------------
+
+    def end_track(self):
+        """ writes the end of track, and patches the track length """
+        if not self._in_track: return
+        self._buf += b"\0\xFF\x2F\0"
+        self._flush()
+        fh = self._fh
+        fh.seek(self._track_pos)
+        fh.write(struct.pack(">L", self._track_len))
+        fh.seek(0, 2)
+        self._in_track =0
+
+    #----------------------------------------
+
+    def write_event(self, tick, msg):
+        """
+        Writes a midi message at tick, in the current track
+        msg is a sequence of bytes, sysex messages start with 0xF0,
+        other system messages are escaped with 0xF7
+        """
+
+        buf = self._buf
+        delta = tick - self._last_tick
+        if delta < 0:
+            raise MidiFileError(f"Event at tick {tick}, before the previous tick: {self._last_tick}")
+        if delta < 0x80: buf.append(delta)
+        else: buf += encode_vlq(delta)
+        self._last_tick = tick
+        status = msg[0]
+        if status < 0xF0:
+            if status == self._status:
+                # running status
+                buf += bytes(msg[1:])
+            else:
+                buf += bytes(msg)
+                self._status = status
+        elif status == 0xF0:
+            buf.append(0xF0)
+            buf += encode_vlq(len(msg) -1)
+            buf += bytes(msg[1:])
+            self._status =0
+        else:
+            buf.append(0xF7)
+            buf += encode_vlq(len(msg))
+            buf += bytes(msg)
+            self._status =0
+        if len(buf) >= _BUFSIZE: self._flush()
+
+    #----------------------------------------
+
+    def write_meta(self, tick, mtype, data):
+        """ writes a meta event at tick """
+        buf = self._buf
+        buf += encode_vlq(tick - self._last_tick)
+        self._last_tick = tick
+        buf.append(0xFF)
+        buf.append(mtype)
+        buf += encode_vlq(len(data))
+        buf += data
+        # no running status after a meta event, for the strict readers
+        self._status =0
+        if len(buf) >= _BUFSIZE: self._flush()
+
+    #----------------------------------------
+
+    def write_tempo(self, tick, bpm):
+        """ writes a tempo change at tick """
+        usec = int(round(60000000. / bpm))
+        self.write_meta(tick, 0x51, usec.to_bytes(3, "big"))
+
+    #----------------------------------------
+
+    def write_tempo_map(self, tempo_map, bpm=None):
+        """ writes the initial tempo, and the tempo changes """
+        if bpm is not None and (not tempo_map or tempo_map[0][0] > 0):
+            self.write_tempo(0, bpm)
+        for (tick, val) in tempo_map:
+            self.write_tempo(tick, val)
+
+    #----------------------------------------
+
+#========================================
+
+def iter_click_events(click_track, end_tick):
+    """
+    Yields the (tick, message) of the repeated click pattern, until end_tick
+    """
+
+    ev_lst = click_track._ev_lst
+    if not ev_lst: return
+    bar_len = click_track.ppq * 4
+    bar_tick =0
+    while bar_tick <= end_tick:
+        for evt in ev_lst:
+            tick = bar_tick + evt.tick
+            if tick > end_tick: return
+            yield (tick, evt.message)
+        bar_tick += bar_len
+
+#----------------------------------------
+
+def _write_tempo_events(writer, events, tempo_map, bpm):
+    """
+    Writes events, with the initial tempo and the tempo changes merged
+    """
+
+    write_event = writer.write_event
+    if not tempo_map or tempo_map[0][0] > 0:
+        writer.write_tempo(0, bpm)
+    index =0
+    for evt in events:
+        while index < len(tempo_map) and tempo_map[index][0] <= evt.tick:
+            writer.write_tempo(*tempo_map[index])
+            index +=1
+        write_event(evt.tick, evt.message)
+    writer.write_tempo_map(tempo_map[index:])
+
+#----------------------------------------
+
+def write_midi_file(seq, filename, click=0):
+    """
+    Writes the sequence of a MidiSequencer object as a Standard Midi File
+    Format 0 for the sequence events only,
+    format 1 when the events have several tracks, or with the click track
+    In format 1, the chunk of a track is at its track number, with empty chunks
+    for the missing numbers below MAX_TRACK_GAP, so the tracks are numbered
+    the same when reloading, the tempo changes going in the first chunk
+    Returns the number of tracks
+    """
+
+    queue = seq.queue
+    # the events by track, in one pass
+    buckets = {}
+    for evt in queue:
+        bucket = buckets.get(evt.track)
+        if bucket is None: bucket = buckets[evt.track] = []
+        bucket.append(evt)
+    tracks = sorted(buckets)
+    fmt = 1 if click or len(tracks) > 1 else 0
+    with MidiFileWriter(filename, fmt, seq.ppqn) as writer:
+        write_event = writer.write_event
+        writer.begin_track()
+        if fmt == 0:
+            # the tempo changes are merged with the events
+            _write_tempo_events(writer, queue, seq.tempo_map, seq._init_bpm)
+        else:
+            # the first chunk, with the tempo changes, is the track 0
+            _write_tempo_events(writer, buckets.get(0, ()), seq.tempo_map, seq._init_bpm)
+            for track in tracks:
+                if track == 0: continue
+                # empty chunks for the missing track numbers
+                if track < MAX_TRACK_GAP:
+                    while writer.ntracks < track:
+                        writer.begin_track()
+                writer.begin_track()
+                for evt in buckets[track]:
+                    write_event(evt.tick, evt.message)
+            if click and seq.click_track is not None:
+                writer.begin_track()
+                for (tick, msg) in iter_click_events(seq.click_track, seq.len):
+                    write_event(tick, msg)
+        writer.end_track()
+        ntracks = writer.ntracks
+
+    return ntracks
+
+#----------------------------------------
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+    File: midigen.py
+    Synthetic workload generator, for stress testing the sequencer.
+    Builds large sequences with notes, controllers, pitch bend,
+    tempo changes and sysex bursts, reproducible with a seed.
+    Date: Mon, 19/10/2026
+    Author: Coolbrother
+"""
+import random
+from array import array
+import midisequencer as midseq
+
+#----------------------------------------
+
+class Workload(object):
+    """
+    Generated events, as parallel columns of ticks and messages
+    """
+    def __init__(self, ppqn=120):
+        self.ppqn = ppqn
+        self.ticks = array('l')
+        self.messages = []
+        self.tempo_map = []
+        # shared message tuples, to save memory on large workloads
+        self._msg_cache = {}
+
+    #----------------------------------------
+
+    def __len__(self):
+        return len(self.messages)
+
+    #----------------------------------------
+
+    def add(self, tick, status, data1, data2):
+        """ adding a three bytes channel message """
+        self.ticks.append(tick)
+        self.messages.append(self.get_msg(status, data1, data2))
+
+    #----------------------------------------
+
+    def extend(self, ticks, status, data1_lst, data2_lst):
+        """
+        adding a column of messages with the same status
+        """
+
+        cache = self._msg_cache
+        base = status << 14
+        keys = [base | (d1 << 7) | d2 for (d1, d2) in zip(data1_lst, data2_lst)]
+        for key in set(keys).difference(cache):
+            cache[key] = (status, (key >> 7) & 0x7F, key & 0x7F)
+        self.ticks.extend(ticks)
+        self.messages.extend(map(cache.__getitem__, keys))
+
+    #----------------------------------------
+
+    def get_msg(self, status, data1, data2):
+        """ returns a shared message tuple """
+        key = (status << 14) | (data1 << 7) | data2
+        msg = self._msg_cache.get(key)
+        if msg is None:
+            msg = self._msg_cache[key] = (status, data1, data2)
+        return msg
+
+    #----------------------------------------
+
+    def add_msg(self, tick, msg):
+        """ adding any message, like sysex """
+        self.ticks.append(tick)
+        self.messages.append(msg)
+
+    #----------------------------------------
+
+    def sort(self):
+        """
+        Sort the columns by tick, the note offs before the note ons for equal ticks,
+        so a note struck again at its end tick is not cut by its own note off,
+        and keeping the generation order otherwise
+        """
+
+        ticks = self.ticks
+        messages = self.messages
+        # (tick, is_on) key, as one integer
+        keys = [(tick << 1) | (msg[0] & 0xF0 == 0x90 and len(msg) > 2 and msg[2] > 0)
+                for (tick, msg) in zip(ticks, messages)]
+        order = sorted(range(len(ticks)), key=keys.__getitem__)
+        self.ticks = array('l', [ticks[i] for i in order])
+        self.messages = [messages[i] for i in order]
+
+    #----------------------------------------
+
+    def to_seq(self, seq):
+        """
+        Loads the workload into a MidiSequencer object, through the bulk path
+        """
+
+        seq.add_events(self.ticks, self.messages)
+        if self.tempo_map:
+            seq.set_tempo_map(self.tempo_map)
+        seq.update_pos()
+
+        return seq
+
+    #----------------------------------------
+
+#========================================
+
+# chord intervals, for the polyphony
+_INTERVALS = (0, 7, 4, 12, 10, 16, 19, 14)
+
+def _zeros(count):
+    return [0] * count
+
+#----------------------------------------
+
+def _repeat(val, count):
+    return [val] * count
+
+#----------------------------------------
+
+def _walk(rand, count, val, maxstep, maxval):
+    """ returns a list of values, in a random walk between 0 and maxval """
+    lst = [0] * count
+    span = 2 * maxstep + 1
+    for i in range(count):
+        val += int(rand() * span) - maxstep
+        if val < 0: val =0
+        elif val > maxval: val = maxval
+        lst[i] = val
+    return lst
+
+#----------------------------------------
+
+def gen_workload(bars=64, ppqn=120, seed=0, density=4, polyphony=3,
+        channels=4, cc_rate=4, bend_rate=0, tempo_changes=0,
+        sysex_bursts=0, sysex_count=4, sysex_size=64):
+    """
+    Generate a stress workload, and returns a Workload object
+    parameters :
+    -- bars: length in 4/4 bars
+    -- density: number of note onsets per beat on each channel
+    -- polyphony: number of notes for each onset
+    -- channels: number of channels used, from channel 0
+    -- cc_rate: controller messages per beat on each channel
+    -- bend_rate: pitch bend messages per beat on each channel
+    -- tempo_changes: number of tempo changes along the sequence
+    -- sysex_bursts: number of sysex bursts along the sequence
+    -- sysex_count, sysex_size: messages per burst, and data bytes per message
+    """
+
+    rnd = random.Random(seed)
+    rand = rnd.random
+    wl = Workload(ppqn)
+    randrange = rnd.randrange
+    total = bars * ppqn * 4
+    channels = max(1, min(16, channels))
+    intervals = _INTERVALS[:max(1, min(polyphony, len(_INTERVALS)))]
+
+    for chan in range(channels):
+        # Notes, as chords on random roots
+        if density > 0:
+            step = max(1, ppqn // density)
+            base = 36 + (chan * 7) % 36
+            onsets = range(0, total, step)
+            roots = [base + int(rand() * 12) for _ in onsets]
+            vels = [40 + int(rand() * 88) for _ in onsets]
+            offs = [min(total, tick + step * (1 + int(rand() * 4))) for tick in onsets]
+            for iv in intervals:
+                notes = [root + iv for root in roots]
+                wl.extend(onsets, midseq.NOTE_ON | chan, notes, vels)
+                wl.extend(offs, midseq.NOTE_OFF | chan, notes, _zeros(len(notes)))
+
+        # Controllers, as a random walk
+        if cc_rate > 0:
+            step = max(1, ppqn // cc_rate)
+            ctrl = (1, 7, 10, 11, 74)[chan % 5]
+            ticks = range(0, total, step)
+            wl.extend(ticks, midseq.CONTROL_CHANGE | chan, _repeat(ctrl, len(ticks)),
+                    _walk(rand, len(ticks), randrange(128), 8, 127))
+
+        # Pitch bend, as a random walk
+        if bend_rate > 0:
+            step = max(1, ppqn // bend_rate)
+            ticks = range(0, total, step)
+            vals = _walk(rand, len(ticks), 8192, 512, 16383)
+            wl.extend(ticks, midseq.PITCH_BEND | chan,
+                    [val & 0x7F for val in vals], [val >> 7 for val in vals])
+
+    for i in range(tempo_changes):
+        tick = randrange(total) if i else 0
+        wl.tempo_map.append((tick, float(randrange(60, 200))))
+    wl.tempo_map.sort()
+
+    for i in range(sysex_bursts):
+        tick = randrange(total)
+        for j in range(sysex_count):
+            data = bytes(randrange(128) for _ in range(sysex_size))
+            wl.add_msg(tick, bytes((midseq.SYSEX,)) + data + bytes((midseq.END_OF_EXCLUSIVE,)))
+
+    wl.sort()
+
+    return wl
+
+#----------------------------------------
+
+if __name__ == "__main__":
+    import sys
+    import time
+    bars = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    start = time.perf_counter()
+    wl = gen_workload(bars=bars, channels=16, bend_rate=8, tempo_changes=8, sysex_bursts=4)
+    elapsed = time.perf_counter() - start
+    print(f"Generated {len(wl)} events in {elapsed:.3f} sec.")
+    seq = midseq.MidiSequencer()
+    start = time.perf_counter()
+    wl.to_seq(seq)
+    elapsed = time.perf_counter() - start
+    print(f"Loaded {len(seq.queue)} events in the sequencer in {elapsed:.3f} sec.")
+
+#----------------------------------------
@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+"""
+    File: midijournal.py
+    Append-only journal of the sequence edits, for MiniSeq.
+    The edits are encoded by the control thread, and written to the journal
+    by a background thread, with one fsync by batch.
+    The journal follows a snapshot of the sequence, in the midicache format,
+    and compaction folds it into a new snapshot.
+    Recovery loads the snapshot and replays the journal.
+    Date: Mon, 19/10/2026
+    Author: Coolbrother
+"""
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import deque
+import midicache
+
+JOURNAL_PATH = os.path.join(midicache.CACHE_DIR, "session")
+SNAP_EXT = ".snap"
+JOURNAL_EXT = ".jnl"
+JOURNAL_MAGIC = b"MSQJ"
+JOURNAL_VERSION =2
+# journal size for the compaction, in bytes
+JOURNAL_MAX_SIZE = 16 * 1024 * 1024
+# edit operations
+OP_INSERT =1
+OP_REMOVE =2
+OP_MOVE =3
+OP_TEMPO =4
+OP_REMOVE_TEMPO =5
+# magic, version, reserved, key of the snapshot
+_HEADER = struct.Struct("<4sHH16s")
+# crc32 and size of the body, a SysEx can be longer than 64 KB
+_RECORD = struct.Struct("<II")
+# operation, track, tick, new tick, bpm, followed by the message
+_BODY = struct.Struct("<BHqqd")
+_KEY_SIZE =16
+# number of inserts merged at once, at replay
+MERGE_RUN =256
+
+#----------------------------------------
+
+def encode_record(op, tick, message=b"", track=0, new_tick=0, bpm=0.):
+    """ returns an edit as journal record """
+    body = _BODY.pack(op, track, tick, new_tick, bpm) + bytes(message)
+
+    return _RECORD.pack(zlib.crc32(body), len(body)) + body
+
+#----------------------------------------
+
+def decode_records(data, pos=_HEADER.size):
+    """
+    Returns the list of records in data from pos,
+    as (op, tick, message, track, new_tick, bpm) tuples,
+    and the end of the last valid record
+    Note: the records after a truncated or corrupted one are ignored,
+    it is the end of the journal after a crash
+    """
+
+    records = []
+    size = len(data)
+    while pos + _RECORD.size <= size:
+        (crc, length) = _RECORD.unpack_from(data, pos)
+        start = pos + _RECORD.size
+        body = bytes(data[start:start + length])
+        if len(body) != length or length < _BODY.size or zlib.crc32(body) != crc: break
+        (op, track, tick, new_tick, bpm) = _BODY.unpack_from(body, 0)
+        records.append((op, tick, body[_BODY.size:], track, new_tick, bpm))
+        pos = start + length
+
+    return (records, pos)
+
+#----------------------------------------
+
+def read_key(data):
+    """ returns the snapshot key of the bytes of a journal, as hex string, or None """
+    if len(data) < _HEADER.size: return None
+    (magic, version, reserved, key) = _HEADER.unpack_from(data, 0)
+    if magic != JOURNAL_MAGIC or version != JOURNAL_VERSION: return None
+
+    return key.hex()
+
+#----------------------------------------
+
+def replay_records(seq, records):
+    """
+    Applies the records to seq
+    The long runs of inserts are merged at once,
+    a merge copies the whole queue
+    Returns the number of applied records
+    """
+
+    ticks = []
+    messages = []
+    tracks = []
+
+    def merge():
+        if len(messages) >= MERGE_RUN:
+            seq.merge_events(ticks, messages, tracks)
+        else:
+            for (tick, msg, track) in zip(ticks, messages, tracks):
+                seq.insert_event(tick, msg, track)
+        del ticks[:], messages[:], tracks[:]
+
+    for (op, tick, message, track, new_tick, bpm) in records:
+        if op == OP_INSERT:
+            ticks.append(tick)
+            messages.append(message)
+            tracks.append(track)
+            continue
+        merge()
+        if op == OP_REMOVE:
+            seq.remove_event(tick, message, track)
+        elif op == OP_MOVE:
+            seq.move_event(tick, message, new_tick, track)
+        elif op == OP_TEMPO:
+            seq.add_tempo(tick, bpm)
+        elif op == OP_REMOVE_TEMPO:
+            seq.remove_tempo(tick)
+    merge()
+
+    return len(records)
+
+#----------------------------------------
+
+class MidiJournal(object):
+    """
+    Journal of the edits of a MidiSequencer object
+    The edit methods apply the edit to the sequencer, and journal it
+    defer_func returns whether the engine is running, for deferring the edits
+    Note: the edits and the compaction are done by the control thread only
+    """
+    def __init__(self, seq, path=JOURNAL_PATH, period=0.1, max_size=JOURNAL_MAX_SIZE,
+            defer_func=None):
+        self._seq = seq
+        self._defer_func = defer_func
+        self.snap_path = path + SNAP_EXT
+        self.journal_path = path + JOURNAL_EXT
+        # time between two writes of the background thread
+        self.period = period
+        self.max_size = max_size
+        self.key = None
+        # size of the journal, with the pending records
+        self.size =0
+        self.count =0
+        self.syncs =0
+        self._pending = deque()
+        self._write_lock = threading.Lock()
+        self._fh = None
+        self._thread = None
+        self._running =0
+
+    #----------------------------------------
+
+    def is_running(self):
+        return self._running
+
+    #----------------------------------------
+
+    def recover(self):
+        """
+        Loads the snapshot in the sequencer, and replays the journal
+        Returns the number of replayed edits, or -1 without snapshot
+        """
+
+        with self._seq.edit_lock:
+            return self._recover()
+
+    #----------------------------------------
+
+    def _recover(self):
+        try:
+            with open(self.snap_path, "rb") as fh:
+                snap = fh.read()
+        except OSError:
+            return -1
+        key = midicache.read_key(snap)
+        if key is None or not midicache.load_seq(self._seq, snap, key): return -1
+        del snap
+        self.key = key
+        self.size = self.count =0
+        try:
+            with open(self.journal_path, "rb") as fh:
+                data = fh.read()
+        except OSError:
+            data = b""
+        # a journal of another snapshot is already folded into this one
+        if read_key(data) != key: return 0
+        (records, end) = decode_records(data)
+        replay_records(self._seq, records)
+        self.size = end
+        self.count = len(records)
+
+        return len(records)
+
+    #----------------------------------------
+
+    def start(self):
+        """
+        Starts the writer thread
+        The journal continues after a recovery, otherwise a new snapshot is written
+        """
+
+        if self._running: return
+        if self.key is None or not self._open_journal():
+            self.compact()
+        self._running =1
+        self._thread = threading.Thread(target=self._run, name="journal")
+        self._thread.daemon = True
+        self._thread.start()
+
+    #----------------------------------------
+
+    def stop(self):
+        """ stops the writer thread, after writing the pending records """
+        if not self._running: return
+        self._running =0
+        self._thread.join()
+        self._thread = None
+        self.flush()
+        with self._write_lock:
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+
+    #----------------------------------------
+
+    def flush(self):
+        """
+        Writes the pending records, and syncs the file
+        Returns the number of written bytes
+        """
+
+        with self._write_lock:
+            if self._fh is None or not self._pending: return 0
+            records = []
+            while self._pending:
+                records.append(self._pending.popleft())
+            data = b"".join(records)
+            self._fh.write(data)
+            self._fh.flush()
+            os.fsync(self._fh.fileno())
+            self.syncs +=1
+
+        return len(data)
+
+    #----------------------------------------
+
+    def compact(self):
+        """
+        Writes a snapshot of the sequencer, and starts a new empty journal
+        Returns the size of the snapshot
+        Note: a crash between the two files is safe,
+        the old journal is not for the new snapshot key
+        """
+
+        with self._seq.edit_lock, self._write_lock:
+            self._pending.clear()
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+            key = os.urandom(_KEY_SIZE).hex()
+            os.makedirs(os.path.dirname(self.snap_path) or ".", exist_ok=True)
+            tmp_path = f"{self.snap_path}.{os.getpid()}.tmp"
+            try:
+                with open(tmp_path, "wb") as fh:
+                    snap_size = midicache.dump_seq(self._seq, fh, key)
+                    fh.flush()
+                    os.fsync(fh.fileno())
+                os.replace(tmp_path, self.snap_path)
+            finally:
+                if os.path.exists(tmp_path): os.remove(tmp_path)
+            tmp_path = f"{self.journal_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as fh:
+                fh.write(_HEADER.pack(JOURNAL_MAGIC, JOURNAL_VERSION, 0, bytes.fromhex(key)))
+                fh.flush()
+                os.fsync(fh.fileno())
+            os.replace(tmp_path, self.journal_path)
+            self.key = key
+            self.size = _HEADER.size
+            self.count =0
+            self._fh = open(self.journal_path, "ab")
+
+        return snap_size
+
+    #----------------------------------------
+
+    # Note: the records are encoded before the edit,
+    # so an invalid edit raises without changing the sequence,
+    # and the edits are done under the edit lock of the sequencer,
+    # deferred to the engine thread when it is running
+
+    def _get_defer(self):
+        return self._defer_func() if self._defer_func else 0
+
+    #----------------------------------------
+
+
+    def insert_event(self, tick, message, track=0):
+        record = encode_record(OP_INSERT, tick, message, track)
+        with self._seq.edit_lock:
+            evt = self._seq.insert_event(tick, message, track, self._get_defer())
+            self._log(record)
+
+        return evt
+
+    #----------------------------------------
+
+    def remove_event(self, tick, message, track=0):
+        record = encode_record(OP_REMOVE, tick, message, track)
+        with self._seq.edit_lock:
+            evt = self._seq.remove_event(tick, message, track, self._get_defer())
+            if evt is not None:
+                self._log(record)
+
+        return evt
+
+    #----------------------------------------
+
+    def move_event(self, tick, message, new_tick, track=0):
+        record = encode_record(OP_MOVE, tick, message, track, new_tick)
+        with self._seq.edit_lock:
+            evt = self._seq.move_event(tick, message, new_tick, track, self._get_defer())
+            if evt is not None:
+                self._log(record)
+
+        return evt
+
+    #----------------------------------------
+
+    def add_tempo(self, tick, bpm):
+        record = encode_record(OP_TEMPO, tick, bpm=bpm)
+        with self._seq.edit_lock:
+            self._seq.add_tempo(tick, bpm)
+            self._log(record)
+
+    #----------------------------------------
+
+    def remove_tempo(self, tick):
+        record = encode_record(OP_REMOVE_TEMPO, tick)
+        with self._seq.edit_lock:
+            res = self._seq.remove_tempo(tick)
+            if res:
+                self._log(record)
+
+        return res
+
+    #----------------------------------------
+
+    def log_events(self, ticks, messages, tracks):
+        """ journals events added to the sequencer by merge_events """
+        self._log_records([encode_record(OP_INSERT, tick, msg, track)
+            for (tick, msg, track) in zip(ticks, messages, tracks)])
+
+    #----------------------------------------
+
+    def log_update(self, removed, ticks, messages, tracks):
+        """ journals the events removed and added by update_events """
+        records = [encode_record(OP_REMOVE, tick, msg, track) for (tick, msg, track) in removed]
+        records.extend(encode_record(OP_INSERT, tick, msg, track)
+            for (tick, msg, track) in zip(ticks, messages, tracks))
+        self._log_records(records)
+
+    #----------------------------------------
+
+    def _log_records(self, records):
+        """ journals records encoded beforehand, so a failed encoding journals none of them """
+        for record in records:
+            self._log(record, check=0)
+        self._check_size()
+
+    #----------------------------------------
+
+    def _log(self, record, check=1):
+        self._pending.append(record)
+        self.size += len(record)
+        self.count +=1
+        if check: self._check_size()
+
+    #----------------------------------------
+
+    def _check_size(self):
+        if self.size > self.max_size and self._running:
+            self.compact()
+
+    #----------------------------------------
+
+    def _open_journal(self):
+        """
+        Opens the recovered journal for appending, without the invalid end
+        Returns 0 if it cannot be opened
+        """
+
+        try:
+            fh = open(self.journal_path, "r+b")
+        except OSError:
+            return 0
+        if self.size < _HEADER.size:
+            fh.close()
+            return 0
+        fh.truncate(self.size)
+        fh.seek(self.size)
+        self._fh = fh
+
+        return 1
+
+    #----------------------------------------
+
+    def _run(self):
+        period = self.period
+        while self._running:
+            time.sleep(period)
+            self.flush()
+
+    #----------------------------------------
+
+#========================================
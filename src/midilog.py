@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+    File: midilog.py
+    Logging for the MiniSeq engine.
+    Records are passed through a queue, and written to the file
+    by a background thread, so the engine thread never waits on file I/O.
+    Date: Mon, 19/10/2026
+    Author: Coolbrother
+"""
+import logging
+import queue
+
+LOGFILE = "/tmp/app.log"
+log = logging.getLogger("miniseq")
+log.propagate = False
+log.setLevel(logging.WARNING)
+_listener = None
+_handler = None
+
+#----------------------------------------
+
+class LazyQueueHandler(logging.Handler):
+    """
+    Queue handler which does not format the record in the calling thread
+    The message is formatted by the listener thread, when written to the file
+    Note: like logging.handlers.QueueHandler, without importing logging.handlers
+    """
+    def __init__(self, que):
+        logging.Handler.__init__(self)
+        self.queue = que
+
+    #----------------------------------------
+
+    def emit(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except Exception:
+            self.handleError(record)
+
+    #----------------------------------------
+
+#========================================
+
+def init_logging(level=logging.DEBUG, filename=LOGFILE, filemode='w'):
+    """
+    Starts the logging to filename, through the background listener thread
+    Note: called by the application, not at import time
+    """
+
+    from logging.handlers import QueueListener
+    global _listener, _handler
+    stop_logging()
+    que = queue.SimpleQueue()
+    file_handler = logging.FileHandler(filename, mode=filemode)
+    file_handler.setFormatter(logging.Formatter("%(message)s"))
+    _listener = QueueListener(que, file_handler)
+    _handler = LazyQueueHandler(que)
+    log.addHandler(_handler)
+    log.setLevel(level)
+    _listener.start()
+
+#----------------------------------------
+
+def stop_logging():
+    """
+    Flushes the pending records, and stops the listener thread
+    """
+
+    global _listener, _handler
+    if _listener is None: return
+    log.removeHandler(_handler)
+    log.setLevel(logging.WARNING)
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
+    _handler = None
+
+#----------------------------------------
+
+def set_level(level):
+    log.setLevel(level)
+
+#----------------------------------------
+
+def is_debug():
+    """ whether debug records are enabled """
+    return log.isEnabledFor(logging.DEBUG)
+
+#----------------------------------------
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+    File: midimetrics.py
+    Engine metrics, and Prometheus text endpoint for MiniSeq.
+    The engine thread only writes counters in preallocated arrays,
+    the HTTP server thread copies them when scraped.
+    Date: Mon, 19/10/2026
+    Author: Coolbrother
+"""
+import threading
+from array import array
+from bisect import bisect_left
+from http.server import (BaseHTTPRequestHandler, ThreadingHTTPServer)
+
+# upper bounds of the callback duration buckets, in sec
+DURATION_BUCKETS = (0.0001, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 1.0)
+QUANTILES = (0.5, 0.9, 0.99, 1.0)
+METRICS_PORT = 9100
+
+#----------------------------------------
+
+class MidiMetrics(object):
+    """
+    Engine counters, written by the engine thread only
+    """
+    def __init__(self, period=0.01, nb_errors=1024):
+        # period of the callback, for counting overruns
+        self.period = period
+        self._bounds = DURATION_BUCKETS
+        self.duration_counts = array('Q', bytes(8 * (len(DURATION_BUCKETS) +1)))
+        self.duration_sum = array('d', [0.])
+        self.overruns = array('Q', [0])
+        # 16 channels, and one for system messages
+        self.sent = array('Q', bytes(8 * 17))
+        # events after the play position, in the sequencer queue
+        self.pending_events = array('Q', [0])
+        # ring of last timing errors, in sec
+        self.errors = array('d', bytes(8 * nb_errors))
+        self._err_size = nb_errors
+        self._err_index =0
+        self.nb_errors =0
+
+    #----------------------------------------
+
+    def add_callback(self, duration):
+        """ records the duration of a process callback """
+        self.duration_counts[bisect_left(self._bounds, duration)] +=1
+        self.duration_sum[0] += duration
+        if duration > self.period:
+            self.overruns[0] +=1
+
+    #----------------------------------------
+
+    def add_sent(self, status):
+        """ counts a sent message, by channel """
+        if status < 0xF0:
+            self.sent[status & 0x0F] +=1
+        else:
+            self.sent[16] +=1
+
+    #----------------------------------------
+
+    def set_pending_events(self, count):
+        self.pending_events[0] = count
+
+    #----------------------------------------
+
+    def add_error(self, error):
+        """ records a timing error, in sec """
+        index = self._err_index
+        self.errors[index] = error
+        index +=1
+        if index >= self._err_size: index =0
+        self._err_index = index
+        self.nb_errors +=1
+
+    #----------------------------------------
+
+    def get_quantiles(self):
+        """
+        Returns the quantiles of the absolute timing errors, as (quantile, value) tuples
+        """
+
+        count = min(self.nb_errors, len(self.errors))
+        lst = sorted(abs(x) for x in self.errors[:count])
+        result = []
+        for q in QUANTILES:
+            if lst:
+                val = lst[min(count -1, int(q * (count -1) + 0.5))]
+            else:
+                val = 0.
+            result.append((q, val))
+
+        return result
+
+    #----------------------------------------
+
+    def to_prometheus(self, state=None):
+        """
+        Returns the metrics in Prometheus text format
+        state is a dictionary of transport gauges
+        """
+
+        # copy the counters first
+        counts = self.duration_counts[:]
+        duration_sum = self.duration_sum[0]
+        sent = self.sent[:]
+        lines = []
+        add = lines.append
+
+        add("# HELP miniseq_callback_duration_seconds Duration of the engine process callback.")
+        add("# TYPE miniseq_callback_duration_seconds histogram")
+        total =0
+        for (bound, count) in zip(self._bounds, counts):
+            total += count
+            add(f'miniseq_callback_duration_seconds_bucket{{le="{bound}"}} {total}')
+        total += counts[-1]
+        add(f'miniseq_callback_duration_seconds_bucket{{le="+Inf"}} {total}')
+        add(f"miniseq_callback_duration_seconds_sum {duration_sum}")
+        add(f"miniseq_callback_duration_seconds_count {total}")
+
+        add("# HELP miniseq_callback_overruns_total Callbacks longer than the engine period.")
+        add("# TYPE miniseq_callback_overruns_total counter")
+        add(f"miniseq_callback_overruns_total {self.overruns[0]}")
+
+        add("# HELP miniseq_events_sent_total Messages sent to the midi output, by channel.")
+        add("# TYPE miniseq_events_sent_total counter")
+        for chan in range(16):
+            add(f'miniseq_events_sent_total{{channel="{chan}"}} {sent[chan]}')
+        add(f'miniseq_events_sent_total{{channel="system"}} {sent[16]}')
+
+        add("# HELP miniseq_pending_events Number of events after the play position, in the sequencer queue.")
+        add("# TYPE miniseq_pending_events gauge")
+        add(f"miniseq_pending_events {self.pending_events[0]}")
+
+        add("# HELP miniseq_timing_error_seconds Absolute timing error of the sent events.")
+        add("# TYPE miniseq_timing_error_seconds summary")
+        for (q, val) in self.get_quantiles():
+            add(f'miniseq_timing_error_seconds{{quantile="{q}"}} {val}')
+        add(f"miniseq_timing_error_seconds_count {self.nb_errors}")
+
+        if state:
+            for (name, val) in state.items():
+                add(f"# TYPE miniseq_{name} gauge")
+                add(f"miniseq_{name} {val}")
+
+        return "\n".join(lines) + "\n"
+
+    #----------------------------------------
+
+#========================================
+
+class MetricsServer(object):
+    """
+    Local HTTP endpoint, serving the metrics from a background thread
+    """
+    def __init__(self, metrics, state_func=None, port=METRICS_PORT, host="127.0.0.1"):
+        self.metrics = metrics
+        self._state_func = state_func
+        self.port = port
+        self.host = host
+        self._server = None
+        self._thread = None
+
+    #----------------------------------------
+
+    def start(self):
+        """ start the server thread """
+        if self._server is not None: return
+        server_obj = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = server_obj.get_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        # port can be 0, for any free port
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metrics")
+        self._thread.daemon = True
+        self._thread.start()
+
+    #----------------------------------------
+
+    def stop(self):
+        """ stop the server thread """
+        if self._server is None: return
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        self._server = None
+        self._thread = None
+
+    #----------------------------------------
+
+    def get_text(self):
+        state = self._state_func() if self._state_func else None
+        return self.metrics.to_prometheus(state)
+
+    #----------------------------------------
+
+#========================================
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+    File: midiport.py
+    Output port with its own sender thread, for MiniSeq.
+    The engine thread enqueues the timestamped messages in a ring buffer,
+    and the sender thread writes them to the port,
+    so a slow port does not delay the engine nor the other ports.
+    Large SysEx dumps and the panic are sent by the same thread, as paced jobs
+    of lower priority than the ring messages, the drain jobs, like the panic
+    and the note offs, being sent before the SysEx dumps, between their messages.
+    Date: Mon, 19/10/2026
+    Author: Coolbrother
+"""
+import threading
+import time
+from collections import deque
+import midiring
+
+# byte rate of a Midi DIN cable: 31250 bauds, 10 bits by byte
+SYSEX_RATE = 3125
+PANIC_RATE = SYSEX_RATE
+SYSEX_START = 0xF0
+SYSEX_END = 0xF7
+
+#----------------------------------------
+
+def split_sysex(data):
+    """
+    Splits a SysEx dump, like a .syx file, in its SysEx messages
+    Returns the list of messages as bytes
+    Raises ValueError when the dump is not a sequence of F0 ... F7 messages
+    """
+
+    data = bytes(data)
+    packets = []
+    pos =0
+    while pos < len(data):
+        if data[pos] != SYSEX_START:
+            raise ValueError(f"SysEx start expected at byte {pos}, found: 0x{data[pos]:02X}")
+        end = data.find(SYSEX_END, pos +1)
+        if end < 0:
+            raise ValueError(f"Unterminated SysEx message at byte {pos}")
+        packets.append(data[pos:end +1])
+        pos = end +1
+    if not packets: raise ValueError("Empty SysEx dump")
+
+    return packets
+
+#----------------------------------------
+
+class PacedJob(object):
+    """
+    Messages sent by a port thread at a byte rate,
+    when no ring message is waiting
+    Note: the messages are not split, a SysEx message cannot be interrupted
+    a byte_rate of 0 sends the messages without pacing
+    a drain job is time critical: it is sent before the other jobs,
+    and until its end when the port stops, not cancelled
+    """
+    def __init__(self, packets, byte_rate=SYSEX_RATE, drain=0):
+        self.packets = packets
+        self.byte_rate = byte_rate
+        self.drain = drain
+        self.total_bytes = sum(len(packet) for packet in packets)
+        self.sent_bytes =0
+        self.index =0
+        self.start_time =0.
+        self.end_time =0.
+        self.cancelled =0
+        self._next_time =0.
+        self._done = threading.Event()
+
+    #----------------------------------------
+
+    def is_done(self):
+        return self._done.is_set()
+
+    #----------------------------------------
+
+    def wait(self, timeout=None):
+        """ waits the end of the job, returns whether it is done """
+        return self._done.wait(timeout)
+
+    #----------------------------------------
+
+    def cancel(self):
+        """ stops the job before the next packet """
+        self.cancelled =1
+
+    #----------------------------------------
+
+    def get_progress(self):
+        """ returns the ratio of sent bytes """
+        return self.sent_bytes / self.total_bytes if self.total_bytes else 1.
+
+    #----------------------------------------
+
+    def get_rate(self):
+        """ returns the measured throughput, in bytes by sec """
+        elapsed = self.end_time - self.start_time
+        return self.sent_bytes / elapsed if elapsed > 0 else 0.
+
+    #----------------------------------------
+
+    def send_next(self, send_message, now):
+        """
+        Sends the next packet, when its time is reached
+        Called by the port thread only
+        Returns 1 when a packet is sent
+        """
+
+        if now < self._next_time: return 0
+        if not self.index: self.start_time = now
+        packet = self.packets[self.index]
+        send_message(packet)
+        self.index +=1
+        self.sent_bytes += len(packet)
+        # the next packet when this one is on the wire
+        if self.byte_rate:
+            self._next_time = max(now, self._next_time) + len(packet) / self.byte_rate
+        else:
+            self._next_time = now
+        self.end_time = self._next_time
+
+        return 1
+
+    #----------------------------------------
+
+    def finish(self):
+        """ releases the waiting threads """
+        self._done.set()
+
+    #----------------------------------------
+
+    def run(self, send_message, clock=time):
+        """
+        Sends the remaining packets, sleeping between them, and finishes the job
+        Returns the number of sent packets
+        """
+
+        count =0
+        while not self.cancelled and self.index < len(self.packets):
+            now = clock.time()
+            if self.send_next(send_message, now): count +=1
+            else: clock.sleep(self._next_time - now)
+        self.finish()
+
+        return count
+
+    #----------------------------------------
+
+#========================================
+
+def start_job(job, midiout, clock=time):
+    """
+    Sends a PacedJob to a port without sender thread,
+    by a thread ending with the job
+    Returns the thread
+    """
+
+    thread = threading.Thread(target=job.run, args=(midiout.send_message, clock), name="midi_job")
+    thread.daemon = True
+    thread.start()
+
+    return thread
+
+#----------------------------------------
+
+class JobGroup(object):
+    """
+    Completion handle of PacedJob objects sent on several ports
+    """
+    def __init__(self, jobs):
+        self.jobs = jobs
+
+    #----------------------------------------
+
+    def is_done(self):
+        return all(job.is_done() for job in self.jobs)
+
+    #----------------------------------------
+
+    def wait(self, timeout=None):
+        """ waits the end of all the jobs, returns whether they are done """
+        end = None if timeout is None else time.monotonic() + timeout
+        for job in self.jobs:
+            remain = None if end is None else max(0., end - time.monotonic())
+            if not job.wait(remain): return False
+
+        return True
+
+    #----------------------------------------
+
+    def cancel(self):
+        for job in self.jobs:
+            job.cancel()
+
+    #----------------------------------------
+
+#========================================
+
+class MidiPort(object):
+    """
+    Midi output port, served by a sender thread
+    send is called by the engine thread only
+    """
+    def __init__(self, midiout, name="", ring_size=16384, period=0.0005, clock=None):
+        self.midiout = midiout
+        self.name = name
+        self.ring = midiring.SpscRing(ring_size)
+        # sleeping time of the sender thread, when the ring is empty
+        self.period = period
+        self.clock = clock or time
+        self.sent =0
+        # max delay between the enqueuing and the sending, in sec
+        self.max_latency =0.
+        # PacedJob objects, sent in order, after the ring messages,
+        # the drain jobs before the others
+        self.urgent_jobs = deque()
+        self.jobs = deque()
+        self._thread = None
+        self._running =0
+
+    #----------------------------------------
+
+    def is_running(self):
+        return self._running
+
+    #----------------------------------------
+
+    def send(self, stamp, msg):
+        """
+        Enqueues a message, without blocking
+        Returns 0 when the ring is full, the message is lost
+        """
+
+        return self.ring.push(stamp, msg)
+
+    #----------------------------------------
+
+    def submit(self, job, first=0):
+        """
+        adds a PacedJob, it can be called from any thread
+        a drain job goes ahead of the waiting SysEx dumps,
+        and with first, ahead of the other drain jobs, like the panic
+        """
+
+        if not job.drain: self.jobs.append(job)
+        elif first: self.urgent_jobs.appendleft(job)
+        else: self.urgent_jobs.append(job)
+
+        return job
+
+    #----------------------------------------
+
+    def start(self):
+        """ start the sender thread """
+        if self._running: return
+        self._running =1
+        self._thread = threading.Thread(target=self._run, name=f"midi_port_{self.name}")
+        self._thread.daemon = True
+        self._thread.start()
+
+    #----------------------------------------
+
+    def stop(self):
+        """
+        stop the sender thread, after sending the enqueued messages
+        the drain jobs are sent until their end, like the panic,
+        the other jobs not finished are cancelled
+        """
+
+        if not self._running: return
+        self._running =0
+        self._thread.join()
+        self._thread = None
+        self.flush()
+        for jobs in (self.urgent_jobs, self.jobs):
+            while jobs:
+                job = jobs.popleft()
+                if job.drain: job.run(self.midiout.send_message, self.clock)
+                job.cancel()
+                job.finish()
+
+    #----------------------------------------
+
+    def flush(self):
+        """
+        Sends the enqueued messages
+        Returns the number of sent messages
+        """
+
+        (stamps, items) = self.ring.drain()
+        if not items: return 0
+        send_message = self.midiout.send_message
+        for msg in items:
+            send_message(msg)
+        latency = self.clock.time() - stamps[0]
+        if latency > self.max_latency: self.max_latency = latency
+        self.sent += len(items)
+
+        return len(items)
+
+    #----------------------------------------
+
+    def send_job(self):
+        """
+        Sends the next packet of the current job, when due,
+        the drain jobs first, so they interrupt a SysEx dump between two messages
+        Returns 1 when a packet is sent
+        """
+
+        for jobs in (self.urgent_jobs, self.jobs):
+            while jobs:
+                job = jobs[0]
+                if job.cancelled or job.index >= len(job.packets):
+                    jobs.popleft()
+                    job.finish()
+                    continue
+                return job.send_next(self.midiout.send_message, self.clock.time())
+
+        return 0
+
+    #----------------------------------------
+
+    def close_port(self):
+        self.stop()
+        if self.midiout:
+            self.midiout.close_port()
+            self.midiout = None
+
+    #----------------------------------------
+
+    def _run(self):
+        period = self.period
+        flush = self.flush
+        send_job = self.send_job
+        while self._running:
+            # the ring messages first, they are time critical
+            if not flush() and not send_job():
+                time.sleep(period)
+
+    #----------------------------------------
+
+#========================================
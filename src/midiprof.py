@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+    File: midiprof.py
+    Sampling profiler for MiniSeq.
+    A side thread samples the stacks of the other threads
+    with sys._current_frames, without sys.setprofile,
+    and writes collapsed stacks or speedscope JSON.
+    Date: Mon, 19/10/2026
+    Author: Coolbrother
+"""
+import json
+import os
+import sys
+import threading
+import time
+
+PROF_FILE = "/tmp/miniseq_prof.speedscope.json"
+
+#----------------------------------------
+
+class SamplingProfiler(object):
+    """
+    Samples periodically the stacks of the selected threads
+    """
+    def __init__(self, interval=0.005, thread_names=None):
+        self.interval = interval
+        # None for all threads, except the profiler itself
+        self.thread_names = thread_names
+        self._thread = None
+        self._running =0
+        # {thread_name: {stack: count}}, a stack is a tuple of frame keys
+        self.samples = {}
+        self.nb_samples =0
+        self._start_time =0
+        self.duration =0
+
+    #----------------------------------------
+
+    def is_running(self):
+        return self._running
+
+    #----------------------------------------
+
+    def start(self):
+        """ start the sampling thread """
+        if self._running: return
+        self.samples = {}
+        self.nb_samples =0
+        self._running =1
+        self._start_time = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="profiler")
+        self._thread.daemon = True
+        self._thread.start()
+
+    #----------------------------------------
+
+    def stop(self):
+        """ stop the sampling thread """
+        if not self._running: return
+        self._running =0
+        self._thread.join()
+        self._thread = None
+        self.duration = time.perf_counter() - self._start_time
+
+    #----------------------------------------
+
+    def _run(self):
+        own_id = threading.get_ident()
+        interval = self.interval
+        thread_names = self.thread_names
+        samples = self.samples
+        while self._running:
+            names = {}
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for (tid, frame) in sys._current_frames().items():
+                if tid == own_id: continue
+                name = names.get(tid, str(tid))
+                if thread_names is not None and name not in thread_names: continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                    frame = frame.f_back
+                stack.reverse()
+                counts = samples.setdefault(name, {})
+                key = tuple(stack)
+                counts[key] = counts.get(key, 0) +1
+            self.nb_samples +=1
+            time.sleep(interval)
+
+    #----------------------------------------
+
+    def get_collapsed(self):
+        """
+        Returns the samples as collapsed stacks lines, for flamegraph tools
+        """
+
+        lines = []
+        for (name, counts) in self.samples.items():
+            for (stack, count) in counts.items():
+                frames = [name] + ["%s (%s:%d)" % (func, os.path.basename(filename), line)
+                        for (func, filename, line) in stack]
+                lines.append("%s %d" % (";".join(frames), count))
+
+        return lines
+
+    #----------------------------------------
+
+    def get_speedscope(self):
+        """
+        Returns the samples as a speedscope file dictionary, one profile by thread
+        """
+
+        frames = []
+        frame_index = {}
+        profiles = []
+        for (name, counts) in self.samples.items():
+            samples = []
+            weights = []
+            for (stack, count) in counts.items():
+                indexes = []
+                for key in stack:
+                    index = frame_index.get(key)
+                    if index is None:
+                        index = frame_index[key] = len(frames)
+                        frames.append({"name": key[0], "file": key[1], "line": key[2]})
+                    indexes.append(index)
+                samples.append(indexes)
+                weights.append(count * self.interval)
+            profiles.append({
+                "type": "sampled",
+                "name": name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights,
+                })
+
+        return {
+                "$schema": "https://www.speedscope.app/file-format-schema.json",
+                "shared": {"frames": frames},
+                "profiles": profiles,
+                "name": "MiniSeq",
+                "exporter": "midiprof",
+                }
+
+    #----------------------------------------
+
+    def write(self, filename=PROF_FILE):
+        """
+        Writes speedscope JSON if filename ends with .json,
+        otherwise collapsed stacks
+        """
+
+        with open(filename, "w") as fh:
+            if filename.endswith(".json"):
+                json.dump(self.get_speedscope(), fh)
+            else:
+                fh.write("\n".join(self.get_collapsed()) + "\n")
+
+    #----------------------------------------
+
+#========================================
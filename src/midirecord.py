@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+    File: midirecord.py
+    Midi input recording for MiniSeq.
+    The input callback pushes the timestamped messages in a ring buffer,
+    and a background thread drains them in batches into a record track,
+    which is merged into the sequencer when the recording stops.
+    Date: Mon, 19/10/2026
+    Author: Coolbrother
+"""
+import threading
+import time
+from array import array
+import midiring
+
+# track number of the recorded events in the sequencer
+RECORD_TRACK = 0xFFFF
+
+#----------------------------------------
+
+class MidiRecorder(object):
+    """
+    Record track, filled from the input ring of a MidiDriver object
+    """
+    def __init__(self, seq, ring_size=65536, period=0.01, track=RECORD_TRACK):
+        self._seq = seq
+        self.ring = midiring.SpscRing(ring_size)
+        # sleeping time of the drain thread, between two batches
+        self.period = period
+        self.track = track
+        # record track, as columns
+        self.ticks = array('l')
+        self.messages = []
+        # (timestamp, tick) of the recording reference
+        self._anchor = (0, 0)
+        self._thread = None
+        self._running =0
+
+    #----------------------------------------
+
+    def __len__(self):
+        return len(self.messages)
+
+    #----------------------------------------
+
+    def is_running(self):
+        return self._running
+
+    #----------------------------------------
+
+    def set_anchor(self, anchor_time, anchor_tick):
+        """
+        Sets the reference of the ticks: the tick at anchor_time, on the input clock
+        """
+
+        # Note: the tuple is replaced at once, for the drain thread
+        self._anchor = (anchor_time, anchor_tick)
+
+    #----------------------------------------
+
+    def start(self, anchor_time, anchor_tick):
+        """ starts the drain thread, with a new record track """
+        if self._running: return
+        self.ring.clear()
+        self.ticks = array('l')
+        self.messages = []
+        self._anchor = (anchor_time, anchor_tick)
+        self._running =1
+        self._thread = threading.Thread(target=self._run, name="record")
+        self._thread.daemon = True
+        self._thread.start()
+
+    #----------------------------------------
+
+    def stop(self):
+        """
+        Stops the drain thread, and drains the last messages
+        Returns the number of recorded messages
+        """
+
+        if not self._running: return len(self.messages)
+        self._running =0
+        self._thread.join()
+        self._thread = None
+        self.drain()
+
+        return len(self.messages)
+
+    #----------------------------------------
+
+    def drain(self):
+        """
+        Moves the messages available in the ring to the record track
+        Note: called by the drain thread only, when running
+        Returns the number of moved messages
+        """
+
+        (stamps, items) = self.ring.drain()
+        if not items: return 0
+        # the ticks follow the tempo changes after the anchor
+        get_tick_after = self._seq.get_tick_after
+        (anchor_time, anchor_tick) = self._anchor
+        add_tick = self.ticks.append
+        for stamp in stamps:
+            tick = round(get_tick_after(anchor_tick, stamp - anchor_time))
+            # messages received before a new anchor, when pausing
+            if tick < anchor_tick: tick = anchor_tick
+            add_tick(tick)
+        self.messages.extend(map(bytes, items))
+
+        return len(items)
+
+    #----------------------------------------
+
+    def commit(self, defer=0):
+        """
+        Merges the record track into the sequencer, and clears it
+        defer when playing, for swapping the merged queue in the engine thread
+        Returns the number of added events
+        """
+
+        count = len(self.messages)
+        if not count: return 0
+        with self._seq.edit_lock:
+            self._seq.merge_events(self.ticks, self.messages, array('H', [self.track]) * count, defer)
+        self.ticks = array('l')
+        self.messages = []
+
+        return count
+
+    #----------------------------------------
+
+    def _run(self):
+        period = self.period
+        while self._running:
+            self.drain()
+            time.sleep(period)
+
+    #----------------------------------------
+
+#========================================
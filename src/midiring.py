@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+    File: midiring.py
+    Single producer, single consumer ring buffer for MiniSeq.
+    The producer only writes the head index, the consumer only the tail index,
+    so no lock is needed between the two threads.
+    Date: Mon, 19/10/2026
+    Author: Coolbrother
+"""
+from array import array
+
+#----------------------------------------
+
+class SpscRing(object):
+    """
+    Fixed size ring of (timestamp, item) entries, preallocated
+    push is called by the producer thread only,
+    drain by the consumer thread only
+    """
+    def __init__(self, size=65536):
+        # size is rounded up to a power of 2, for masking the index
+        nb =1
+        while nb < size: nb <<= 1
+        self.size = nb
+        self._mask = nb -1
+        self._stamps = array('d', bytes(8 * nb))
+        self._items = [None] * nb
+        # counters of pushed and drained entries
+        self._head =0
+        self._tail =0
+        # entries lost when the ring was full
+        self.overflows =0
+
+    #----------------------------------------
+
+    def __len__(self):
+        return self._head - self._tail
+
+    #----------------------------------------
+
+    def push(self, stamp, item):
+        """
+        Adds an entry, without blocking
+        Returns 0 when the ring is full, and counts the overflow
+        """
+
+        head = self._head
+        if head - self._tail >= self.size:
+            self.overflows +=1
+            return 0
+        index = head & self._mask
+        self._stamps[index] = stamp
+        self._items[index] = item
+        # publish the entry, after writing it
+        self._head = head +1
+
+        return 1
+
+    #----------------------------------------
+
+    def drain(self, max_count=0):
+        """
+        Removes the available entries, at most max_count if not 0
+        Returns the lists (stamps, items)
+        """
+
+        tail = self._tail
+        count = self._head - tail
+        if max_count and count > max_count: count = max_count
+        stamps = []
+        items = []
+        if count <= 0: return (stamps, items)
+        mask = self._mask
+        start = tail & mask
+        end = start + count
+        if end <= self.size:
+            stamps.extend(self._stamps[start:end])
+            items.extend(self._items[start:end])
+            self._items[start:end] = [None] * count
+        else:
+            end -= self.size
+            stamps.extend(self._stamps[start:])
+            stamps.extend(self._stamps[:end])
+            items.extend(self._items[start:])
+            items.extend(self._items[:end])
+            self._items[start:] = [None] * (self.size - start)
+            self._items[:end] = [None] * end
+        # release the slots to the producer, after reading them
+        self._tail = tail + count
+
+        return (stamps, items)
+
+    #----------------------------------------
+
+    def clear(self):
+        """ removes all the entries, from the consumer thread """
+        self.drain()
+        self.overflows =0
+
+    #----------------------------------------
+
+#========================================
@@ -6,14 +6,23 @@
     Author: Coolbrother
 """
 
+import gc
+import threading
 from collections import deque
+from array import array
+from bisect import (bisect_left, bisect_right)
+from operator import attrgetter
 
 # Midi constants
 NOTE_OFF = 0x80
 NOTE_ON =0x90
 CONTROL_CHANGE =0xB0
 PROGRAM_CHANGE =0xC0
+PITCH_BEND =0xE0
+SYSEX =0xF0
+END_OF_EXCLUSIVE =0xF7
 _id =0
+_INF = float("inf")
 
 class MidiEvent(object):
     """Container for a MIDI message and a timing tick.
@@ -24,15 +33,17 @@ class MidiEvent(object):
 
     """
 
-    __slots__ = ('id', 'tick', 'message', 'deltick')
+    __slots__ = ('id', 'tick', 'message', 'deltick', 'track')
 
-    def __init__(self, tick=0, message=None, deltick=0):
+    def __init__(self, tick=0, message=None, deltick=0, track=0):
         global _id
         self.id = _id
         _id +=1
         self.tick = tick
         self.message = message
         self.deltick = deltick
+        # track number in the source file
+        self.track = track
 
     #----------------------------------------
 
@@ -90,6 +101,8 @@ class MidiMetronome(object):
         self.repeating =1
         self.repeat_count =0
         self._click_track = None
+        # reusable event, for the events returned by next_ev_roll
+        self._roll_ev = MidiEvent()
 
     #----------------------------------------
 
@@ -250,14 +263,37 @@ class MidiMetronome(object):
         """
         Returns the next event with the tick time modified bellong the repeat_count number
         from MidiMetronome object
+        Note: the returned event is reused by the next call,
+        it is valid until the next call to next_ev_roll or get_ev_roll
         """
         
-        evt = None
         evt0 = self.next_ev()
         if evt0 is None: return
 
-        # copy evt0 to be able to modify its tick time
-        evt = MidiEvent()
+        # modify the tick time in place, in the reusable event
+        evt = self._roll_ev
+        evt.message = evt0.message
+        evt.tick = evt0.tick + (self.ppq * 4 * self.repeat_count)
+
+        return evt
+
+    #----------------------------------------
+
+    def get_ev_roll(self):
+        """
+        Returns the current event with the tick time modified bellong the repeat_count number,
+        without moving to the next event
+        from MidiMetronome object
+        Note: the returned event is reused, like in next_ev_roll
+        """
+        
+        ev_lst = self._ev_lst
+        if self._index >= len(ev_lst):
+            if not self.repeating or not ev_lst: return
+            self._index =0
+            self.repeat_count += 1
+        evt0 = ev_lst[self._index]
+        evt = self._roll_ev
         evt.message = evt0.message
         evt.tick = evt0.tick + (self.ppq * 4 * self.repeat_count)
 
@@ -282,7 +318,8 @@ class MidiMetronome(object):
 class MidiSequencer(object):
     def __init__(self, bpm=120.0, ppqn=120):
         # inter-thread communication
-        self.queue = deque()
+        # Note: queue is a list, for indexing in constant time by next_event
+        self.queue = []
         self._index =0
         self.curtick =0
         self.len =0
@@ -298,6 +335,25 @@ class MidiSequencer(object):
         self.bpm = bpm
         self._metro = MidiMetronome(ppq=self.ppqn)
         self.click_track = None
+        # list of (tick, bpm) tuples, sorted by tick
+        self.tempo_map = []
+        self._init_bpm = bpm
+        self._tempo_index =0
+        self._next_tempo_tick = _INF
+        # merged queue waiting to be swapped by the engine thread,
+        # as (queue, fixups), see merge_events
+        self._pending = None
+        self._pending_lock = threading.Lock()
+        # old queue after the swap, freed by the next merge,
+        # not by the engine thread
+        self._old_queue = None
+        # number of changes of the queue, for the indexes built on it,
+        # and the last (changes, tick) tuples, tick being the first changed tick
+        self.changes =0
+        self._change_log = deque(maxlen=256)
+        # serializes the edits of the control threads: the REPL,
+        # the file watcher and the journal, not the engine thread
+        self.edit_lock = threading.RLock()
 
     #----------------------------------------
 
@@ -326,6 +382,517 @@ class MidiSequencer(object):
 
 
    
+    def add_events(self, ticks, messages, tracks=None):
+        """
+        Bulk adding of events, from parallel sequences of ticks and messages,
+        and optional track numbers
+        The events are sorted with the queue if needed,
+        and the delta ticks are updated
+        from MidiSequencer object
+        """
+
+        queue = self.queue
+        start = len(queue)
+        lasttick = queue[-1].tick if queue else 0
+        is_sorted =1
+        append = queue.append
+        # Note: the garbage collector is disabled while creating many objects,
+        # it would scan the whole heap many times for nothing
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            if tracks is None:
+                for (tick, msg) in zip(ticks, messages):
+                    if tick < lasttick: is_sorted =0
+                    append(MidiEvent(tick, msg))
+                    lasttick = tick
+            else:
+                for (tick, msg, track) in zip(ticks, messages, tracks):
+                    if tick < lasttick: is_sorted =0
+                    append(MidiEvent(tick, msg, 0, track))
+                    lasttick = tick
+        finally:
+            if gc_enabled: gc.enable()
+
+        if is_sorted:
+            self.update_deltas(start)
+        else:
+            self.sort_events()
+        if queue:
+            self.len = queue[-1].tick
+        if len(ticks): self._add_change(min(ticks))
+
+    #----------------------------------------
+
+    def merge_events(self, ticks, messages, tracks=None, defer=0):
+        """
+        Merges new events into the sorted queue, in one linear pass:
+        the runs of existing events between the new ones are copied by slices
+        With defer, the merged queue is swapped by the engine thread
+        at the next peek_event, and the play position is fixed up,
+        otherwise it is swapped now
+        Returns the number of merged events
+        from MidiSequencer object
+        """
+
+        count = len(messages)
+        if not count: return 0
+        if tracks is None: tracks = [0] * count
+        with self._pending_lock:
+            self._old_queue = None
+            self._merge_pending(ticks, messages, tracks)
+        if not defer:
+            self.apply_pending()
+
+        return count
+
+    #----------------------------------------
+
+    def update_events(self, removed, ticks=(), messages=(), tracks=None, defer=0, by_track=0):
+        """
+        Removes events, given as (tick, message, track) tuples,
+        and merges new events, in one swap of the queue, like merge_events
+        by_track merges them in the order of a loaded file, see _merge_pending
+        Returns the number of removed events
+        from MidiSequencer object
+        """
+
+        with self._pending_lock:
+            self._old_queue = None
+            count = len(self._remove_pending(removed))
+            if len(messages):
+                if tracks is None: tracks = [0] * len(messages)
+                self._merge_pending(ticks, messages, tracks, by_track)
+        if not defer:
+            self.apply_pending()
+
+        return count
+
+    #----------------------------------------
+
+    def _remove_pending(self, removed):
+        """
+        Builds the pending queue, without the removed events
+        Returns the list of the removed events
+        """
+
+        pending = self._pending
+        (base, fixups) = pending if pending is not None else (self.queue, [])
+        size = len(base)
+        get_tick = attrgetter('tick')
+        found = set()
+        for (tick, message, track) in removed:
+            msg = bytes(message)
+            index = bisect_left(base, tick, key=get_tick)
+            while index < size and base[index].tick == tick:
+                evt = base[index]
+                if index not in found and evt.track == track and bytes(evt.message) == msg:
+                    found.add(index)
+                    break
+                index +=1
+        if not found: return []
+
+        # the runs between the removed events are copied by slices
+        positions = array('l', sorted(found))
+        new = []
+        prev =0
+        for pos in positions:
+            new.extend(base[prev:pos])
+            prev = pos +1
+        new.extend(base[prev:])
+        # delta ticks of the events following the removed ones
+        size = len(new)
+        for (num, pos) in enumerate(positions):
+            index = pos - num
+            if index < size:
+                evt = new[index]
+                evt.deltick = evt.tick - new[index -1].tick if index > 0 else evt.tick
+
+        # no ticks for the removed events fixup
+        self._pending = (new, fixups + [(positions, None)])
+
+        return [base[pos] for pos in positions]
+
+    #----------------------------------------
+
+    def _merge_pending(self, ticks, messages, tracks, by_track=0):
+        """
+        Builds the pending queue, with the new events
+        by_track orders the events of a tick by track, like a loaded file
+        (see midifile.merge_tracks), the new events of a track going
+        after the existing ones of the same tick and track
+        Returns the new events, sorted
+        """
+
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            new = [MidiEvent(tick, msg, 0, track)
+                    for (tick, msg, track) in zip(ticks, messages, tracks)]
+        finally:
+            if gc_enabled: gc.enable()
+        new.sort(key=attrgetter('tick', 'track') if by_track else attrgetter('tick'))
+
+        # merging with the pending queue, if not swapped yet
+        pending = self._pending
+        (base, fixups) = pending if pending is not None else (self.queue, [])
+        size = len(base)
+        merged = []
+        extend = merged.extend
+        append = merged.append
+        # index of the new events in the base queue
+        positions = array('l')
+        add_pos = positions.append
+        get_tick = attrgetter('tick')
+        prev =0
+        for evt in new:
+            # new events go after the existing events with the same tick
+            # galloping search from the previous position, for the close events
+            tick = evt.tick
+            lo = prev
+            step =1
+            while lo + step < size and base[lo + step].tick <= tick:
+                lo += step
+                step <<= 1
+            pos = bisect_right(base, tick, lo, min(lo + step, size), key=get_tick)
+            if by_track:
+                # before the events of the same tick with a greater track
+                track = evt.track
+                while pos > prev and base[pos -1].tick == tick and base[pos -1].track > track:
+                    pos -=1
+            if pos > prev:
+                extend(base[prev:pos])
+                prev = pos
+            add_pos(pos)
+            append(evt)
+        extend(base[prev:])
+
+        # delta ticks of the new events, and of the events following them
+        size = len(merged)
+        for (num, pos) in enumerate(positions):
+            first = pos + num
+            for index in range(first, min(first +2, size)):
+                evt = merged[index]
+                evt.deltick = evt.tick - merged[index -1].tick if index > 0 else evt.tick
+
+        fixups = fixups + [(positions, array('l', map(get_tick, new)))]
+        self._pending = (merged, fixups)
+
+        return new
+
+    #----------------------------------------
+
+    def apply_pending(self):
+        """
+        Swaps the merged queue, and moves the play position to the same event
+        Note: new events at the play position are played if their tick
+        is not before the current tick
+        from MidiSequencer object
+        """
+
+        # the engine does not wait for a merge in progress,
+        # it will swap at the next call
+        if not self._pending_lock.acquire(blocking=False): return
+        try:
+            pending = self._pending
+            if pending is None: return
+            (queue, fixups) = pending
+            index = self._index
+            curtick = self.curtick
+            for (positions, ticks) in fixups:
+                if ticks is None:
+                    # removed events before the position
+                    index -= bisect_left(positions, index)
+                    continue
+                # new events before the position, and at the position before curtick
+                lo = bisect_left(positions, index)
+                hi = bisect_right(positions, index, lo)
+                index += bisect_left(ticks, curtick, lo, hi)
+            self._old_queue = self.queue
+            self.queue = queue
+            self._index = index
+            if queue:
+                self.len = queue[-1].tick
+            self._pending = None
+            # the events before the first fixup position are not changed
+            first = min((positions[0] for (positions, ticks) in fixups if len(positions)), default=0)
+            first = min(first, len(queue))
+            self._add_change(queue[first -1].tick if first > 0 else 0)
+        finally:
+            self._pending_lock.release()
+
+    #----------------------------------------
+
+    def find_event(self, tick, message, track=0):
+        """
+        Returns the index of the first event with tick, message and track,
+        or -1 if not found
+        from MidiSequencer object
+        """
+
+        queue = self.queue
+        msg = bytes(message)
+        index = bisect_left(queue, tick, key=attrgetter('tick'))
+        while index < len(queue) and queue[index].tick == tick:
+            evt = queue[index]
+            if evt.track == track and bytes(evt.message) == msg: return index
+            index +=1
+
+        return -1
+
+    #----------------------------------------
+
+    def insert_event(self, tick, message, track=0, defer=0):
+        """
+        Inserts an event after the events with the same tick,
+        and keeps the play position on the same event
+        With defer when playing, or a merged queue waiting for its swap,
+        the event is merged like merge_events, the engine thread
+        swapping the queue, otherwise the queue is changed in place
+        Returns the new event
+        from MidiSequencer object
+        """
+
+        if defer or self._pending is not None:
+            with self._pending_lock:
+                self._old_queue = None
+                evt = self._merge_pending([tick], [message], [track])[0]
+            if not defer:
+                self.apply_pending()
+            return evt
+
+        queue = self.queue
+        index = bisect_right(queue, tick, key=attrgetter('tick'))
+        evt = MidiEvent(tick, message, 0, track)
+        queue.insert(index, evt)
+        self._update_delta(index)
+        self._update_delta(index +1)
+        if index < self._index or (index == self._index and tick < self.curtick):
+            self._index +=1
+        self.len = queue[-1].tick
+        self._add_change(tick)
+
+        return evt
+
+    #----------------------------------------
+
+    def remove_event(self, tick, message, track=0, defer=0):
+        """
+        Removes the first event with tick, message and track,
+        deferred like insert_event
+        Returns the removed event, or None if not found
+        from MidiSequencer object
+        """
+
+        if defer or self._pending is not None:
+            with self._pending_lock:
+                self._old_queue = None
+                removed = self._remove_pending([(tick, message, track)])
+            if not removed: return None
+            if not defer:
+                self.apply_pending()
+            return removed[0]
+
+        index = self.find_event(tick, message, track)
+        if index < 0: return None
+        queue = self.queue
+        evt = queue.pop(index)
+        self._update_delta(index)
+        if index < self._index: self._index -=1
+        self.len = queue[-1].tick if queue else 0
+        self._add_change(tick)
+
+        return evt
+
+    #----------------------------------------
+
+    def move_event(self, tick, message, new_tick, track=0, defer=0):
+        """
+        Moves the first event with tick, message and track to new_tick,
+        deferred like insert_event
+        Returns the moved event, or None if not found
+        from MidiSequencer object
+        """
+
+        if self.remove_event(tick, message, track, defer) is None: return None
+
+        return self.insert_event(new_tick, message, track, defer)
+
+    #----------------------------------------
+
+    def add_tempo(self, tick, bpm):
+        """
+        Adds a tempo change, or replaces the one at tick
+        from MidiSequencer object
+        """
+
+        tempo_map = [item for item in self.tempo_map if item[0] != tick]
+        tempo_map.append((tick, bpm))
+        self.set_tempo_map(tempo_map)
+
+    #----------------------------------------
+
+    def remove_tempo(self, tick):
+        """
+        Removes the tempo change at tick
+        Returns 1 if removed, 0 otherwise
+        from MidiSequencer object
+        """
+
+        tempo_map = [item for item in self.tempo_map if item[0] != tick]
+        if len(tempo_map) == len(self.tempo_map): return 0
+        self.set_tempo_map(tempo_map)
+
+        return 1
+
+    #----------------------------------------
+
+    def _update_delta(self, index):
+        """ sets the delta tick of the event at index, if any """
+        queue = self.queue
+        if index >= len(queue): return
+        evt = queue[index]
+        evt.deltick = evt.tick - queue[index -1].tick if index > 0 else evt.tick
+
+    #----------------------------------------
+
+    def _add_change(self, tick):
+        """ counts a change of the queue, from tick """
+        self.changes +=1
+        self._change_log.append((self.changes, tick))
+
+    #----------------------------------------
+
+    def get_changed_tick(self, changes):
+        """
+        Returns the first tick changed since the count of changes,
+        0 when it is too old, or None without change
+        from MidiSequencer object
+        """
+
+        if changes == self.changes: return None
+        log = list(self._change_log)
+        if not log or log[0][0] > changes +1: return 0
+
+        return min(tick for (count, tick) in log if count > changes)
+
+    #----------------------------------------
+
+    def sort_events(self):
+        """
+        Sort the events by tick, keeping the order of events with the same tick,
+        and update the delta ticks
+        """
+
+        self.queue.sort(key=attrgetter('tick'))
+        self.update_deltas(0)
+
+    #----------------------------------------
+
+    def update_deltas(self, start=0):
+        """
+        Sets the delta ticks from the previous event,
+        as expected by the midi_process engine, from the start index
+        """
+
+        queue = self.queue
+        lasttick = queue[start -1].tick if start > 0 else 0
+        for index in range(start, len(queue)):
+            evt = queue[index]
+            evt.deltick = evt.tick - lasttick
+            lasttick = evt.tick
+
+    #----------------------------------------
+
+    def set_tempo_map(self, tempo_map):
+        """
+        Sets the tempo changes, as a list of (tick, bpm) tuples
+        from MidiSequencer object
+        """
+
+        self.tempo_map = sorted(tempo_map)
+        self._update_tempo(self.curtick)
+
+    #----------------------------------------
+
+    def _update_tempo(self, tick):
+        """
+        Sets the bpm at tick from the tempo map,
+        and the tick of the next tempo change
+        """
+
+        tempo_map = self.tempo_map
+        index = bisect_right(tempo_map, (tick, _INF))
+        if index > 0:
+            self.bpm = tempo_map[index -1][1]
+        elif self.bpm != self._init_bpm:
+            self.bpm = self._init_bpm
+        self._tempo_index = index
+        if index < len(tempo_map):
+            self._next_tempo_tick = tempo_map[index][0]
+        else:
+            self._next_tempo_tick = _INF
+
+    #----------------------------------------
+
+    def get_tick_after(self, tick, secs):
+        """
+        Returns the tick reached secs after tick, as a float,
+        through the tempo changes of the tempo map
+        from MidiSequencer object
+        """
+
+        tempo_map = self.tempo_map
+        if not tempo_map:
+            return tick + secs / self._tickms
+        index = bisect_right(tempo_map, (tick, _INF))
+        bpm = tempo_map[index -1][1] if index > 0 else self._init_bpm
+        while index < len(tempo_map):
+            (next_tick, next_bpm) = tempo_map[index]
+            span = (next_tick - tick) * 60. / (bpm * self.ppqn)
+            if secs < span: break
+            secs -= span
+            (tick, bpm) = (next_tick, next_bpm)
+            index +=1
+
+        return tick + secs * bpm * self.ppqn / 60.
+
+    #----------------------------------------
+
+    def set_ppqn(self, ppqn):
+        """
+        Sets the resolution in ticks per quarter note,
+        and regenerates the click track with it
+        from MidiSequencer object
+        """
+
+        self.ppqn = ppqn
+        # update the tick duration
+        self.bpm = self._bpm
+        self._metro.ppq = ppqn
+        if self.click_track is not None:
+            self.click_track = self._metro.init_click()
+
+    #----------------------------------------
+
+    def clear_events(self):
+        """
+        Removes all the events and the tempo changes
+        from MidiSequencer object
+        """
+
+        self.queue = []
+        self._pending = None
+        self._old_queue = None
+        self.len =0
+        self._add_change(0)
+        self.tempo_map = []
+        self._next_tempo_tick = _INF
+        self.bpm = self._init_bpm
+        self.init_pos()
+
+    #----------------------------------------
+
     def init_seq(self):
         """
         Init the sequencer
@@ -352,6 +919,8 @@ class MidiSequencer(object):
         self.curtick =0
         if self.queue:
             self.len = self.queue[-1].tick
+        if self.tempo_map:
+            self._update_tempo(0)
 
     #----------------------------------------
 
@@ -360,6 +929,8 @@ class MidiSequencer(object):
         self._index =0
         self._tickcount =0
         self.curtick =0
+        if self.tempo_map:
+            self._update_tempo(0)
 
     #----------------------------------------
 
@@ -371,14 +942,18 @@ class MidiSequencer(object):
     #----------------------------------------
 
     def set_pos(self, pos=-1):
-        """ sets sequencer position in tick """
+        """
+        sets sequencer position in tick,
+        at the first event not before pos, found by bisection
+        """
 
         if pos == -1: pos = self.curtick
-        for (index, evt) in enumerate(self.queue):
-            if evt.tick >= pos:
-                self._index = index
-                self.curtick = pos
-                break
+        index = bisect_left(self.queue, pos, key=attrgetter('tick'))
+        if index < len(self.queue):
+            self._index = index
+            self.curtick = pos
+        if self.tempo_map:
+            self._update_tempo(self.curtick)
 
         return self.curtick
 
@@ -405,6 +980,7 @@ class MidiSequencer(object):
         event.deltick = delta
         # 
         self.queue.append(event)
+        self._add_change(event.tick)
 
     #----------------------------------------
 
@@ -417,12 +993,23 @@ class MidiSequencer(object):
         """
         
         try:
-            return self.queue.popleft()
+            return self.queue.pop(0)
         except IndexError:
             return None
 
     #----------------------------------------
 
+    def peek_event(self):
+        """
+        Returns the current event without moving the position, or None at the end
+        """
+        
+        if self._pending is not None: self.apply_pending()
+        if self._index >= len(self.queue): return
+        return self.queue[self._index]
+
+    #----------------------------------------
+
     def next_event(self):
         """
         Poll the input queue for events without blocking.
@@ -435,6 +1022,8 @@ class MidiSequencer(object):
         except IndexError:
             return None
         self._index +=1
+        if evt.tick >= self._next_tempo_tick:
+            self._update_tempo(evt.tick)
 
         return evt
 
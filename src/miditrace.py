@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+    File: miditrace.py
+    Binary trace ring buffer for the MiniSeq engine.
+    Records are stored in preallocated arrays, and can be dumped
+    as Chrome trace event JSON, for chrome://tracing or Perfetto.
+    Date: Mon, 19/10/2026
+    Author: Coolbrother
+"""
+import json
+import threading
+import time
+from array import array
+
+# Trace record kinds
+TR_CALLBACK_START =1
+TR_CALLBACK_END =2
+TR_EVENT_POP =3
+TR_HEAP_SIZE =4
+TR_SEND =5
+TR_SLEEP =6
+TR_NAMES = {
+        TR_CALLBACK_START: "callback",
+        TR_CALLBACK_END: "callback",
+        TR_EVENT_POP: "pop",
+        TR_HEAP_SIZE: "heap",
+        TR_SEND: "send",
+        TR_SLEEP: "sleep",
+        }
+TRACE_FILE = "/tmp/miniseq_trace.json"
+
+#----------------------------------------
+
+class TraceRing(object):
+    """
+    Fixed size ring of trace records
+    Each record is a timestamp in nanosec, a kind, an argument and a thread id,
+    stored in preallocated arrays, so recording allocates nothing
+    """
+    def __init__(self, size=65536):
+        # size is rounded up to a power of 2, for masking the index
+        nb =1
+        while nb < size: nb <<= 1
+        self.size = nb
+        self._mask = nb -1
+        self._stamps = array('q', bytes(8 * nb))
+        self._kinds = array('B', bytes(nb))
+        self._args = array('q', bytes(8 * nb))
+        self._tids = array('Q', bytes(8 * nb))
+        self._index =0
+        self.count =0
+
+    #----------------------------------------
+
+    def record(self, kind, arg=0, _clock=time.perf_counter_ns, _get_ident=threading.get_ident):
+        """ records a trace record at the current time """
+        index = self._index
+        self._stamps[index] = _clock()
+        self._kinds[index] = kind
+        self._args[index] = arg
+        self._tids[index] = _get_ident()
+        self._index = (index +1) & self._mask
+        self.count +=1
+
+    #----------------------------------------
+
+    def clear(self):
+        self._index =0
+        self.count =0
+
+    #----------------------------------------
+
+    def get_records(self):
+        """
+        Returns the records in time order, as (stamp, kind, arg, tid) tuples
+        """
+
+        # copy the arrays first, while the engine may still be recording
+        index = self._index
+        count = self.count
+        stamps = self._stamps[:]
+        kinds = self._kinds[:]
+        args = self._args[:]
+        tids = self._tids[:]
+        if count < self.size:
+            order = range(index)
+        else:
+            order = list(range(index, self.size)) + list(range(index))
+
+        return [(stamps[i], kinds[i], args[i], tids[i]) for i in order]
+
+    #----------------------------------------
+
+    def to_chrome(self):
+        """
+        Returns the records as a Chrome trace event dictionary
+        """
+
+        events = []
+        records = self.get_records()
+        if not records: return {"traceEvents": events}
+        start = records[0][0]
+        thread_names = {}
+        for thread in threading.enumerate():
+            thread_names[thread.ident] = thread.name
+
+        for (stamp, kind, arg, tid) in records:
+            ts = (stamp - start) / 1000.
+            name = TR_NAMES.get(kind, str(kind))
+            evt = {"name": name, "ts": ts, "pid": 1, "tid": tid}
+            if kind == TR_CALLBACK_START:
+                evt["ph"] = "B"
+            elif kind == TR_CALLBACK_END:
+                evt["ph"] = "E"
+            elif kind == TR_SLEEP:
+                # arg is the sleeping time in microsec
+                evt["ph"] = "X"
+                evt["dur"] = arg
+            elif kind == TR_HEAP_SIZE:
+                evt["ph"] = "C"
+                evt["args"] = {"size": arg}
+            elif kind == TR_EVENT_POP:
+                evt["ph"] = "i"
+                evt["s"] = "t"
+                evt["args"] = {"tick": arg}
+            elif kind == TR_SEND:
+                evt["ph"] = "i"
+                evt["s"] = "t"
+                evt["args"] = {"status": arg}
+            else:
+                evt["ph"] = "i"
+                evt["s"] = "t"
+                evt["args"] = {"arg": arg}
+            events.append(evt)
+
+        for (tid, name) in thread_names.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": tid,
+                "args": {"name": name}})
+
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    #----------------------------------------
+
+    def dump(self, filename=TRACE_FILE):
+        """
+        Writes the records as Chrome trace event JSON, and returns the number of trace events
+        """
+
+        data = self.to_chrome()
+        with open(filename, "w") as fh:
+            json.dump(data, fh)
+
+        return len(data["traceEvents"])
+
+    #----------------------------------------
+
+#========================================
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+    File: midiwatch.py
+    Hot reload of the loaded Midi file, for MiniSeq.
+    A background thread polls the file status, and when the file changes,
+    only the track chunks with a new content hash are decoded.
+    The events of a changed track are compared with its previous version,
+    and the difference is applied to the sequencer in one queue swap,
+    under its edit lock, done by the engine thread when playing.
+    Date: Mon, 19/10/2026
+    Author: Coolbrother
+"""
+import hashlib
+import os
+import threading
+import time
+from array import array
+import midifile
+
+# number of events compared at once, when searching the changed region
+_STEP = 1024
+
+#----------------------------------------
+
+def _common_prefix(old, new, count):
+    """
+    Returns the number of equal events at the start of two (ticks, messages) tracks,
+    comparing slices of _STEP events first
+    """
+
+    (old_ticks, old_msgs) = old
+    (new_ticks, new_msgs) = new
+    pos =0
+    while pos < count:
+        end = min(pos + _STEP, count)
+        if old_ticks[pos:end] == new_ticks[pos:end] and old_msgs[pos:end] == new_msgs[pos:end]:
+            pos = end
+            continue
+        while old_ticks[pos] == new_ticks[pos] and old_msgs[pos] == new_msgs[pos]:
+            pos +=1
+        break
+
+    return min(pos, count)
+
+#----------------------------------------
+
+def _common_suffix(old, new, count):
+    """
+    Returns the number of equal events at the end of two tracks, at most count
+    """
+
+    (old_ticks, old_msgs) = old
+    (new_ticks, new_msgs) = new
+    old_end = len(old_msgs)
+    new_end = len(new_msgs)
+    num =0
+    while num < count:
+        step = min(_STEP, count - num)
+        (old_lo, new_lo) = (old_end - num - step, new_end - num - step)
+        (old_hi, new_hi) = (old_end - num, new_end - num)
+        if (old_ticks[old_lo:old_hi] == new_ticks[new_lo:new_hi]
+                and old_msgs[old_lo:old_hi] == new_msgs[new_lo:new_hi]):
+            num += step
+            continue
+        while (old_ticks[old_end - num -1] == new_ticks[new_end - num -1]
+                and old_msgs[old_end - num -1] == new_msgs[new_end - num -1]):
+            num +=1
+        break
+
+    return min(num, count)
+
+#----------------------------------------
+
+def _align_region(old_ticks, new_ticks, start, end):
+    """
+    Returns the common prefix and suffix lengths, without their events at the ticks
+    of the changed region, so the region holds all the events of its ticks
+    """
+
+    (old_size, new_size) = (len(old_ticks), len(new_ticks))
+    while start > 0:
+        tick = old_ticks[start -1]
+        if ((start < old_size - end and old_ticks[start] == tick)
+                or (start < new_size - end and new_ticks[start] == tick)):
+            start -=1
+        else: break
+    while end > 0:
+        tick = old_ticks[old_size - end]
+        (old_last, new_last) = (old_size - end -1, new_size - end -1)
+        if ((old_last >= start and old_ticks[old_last] == tick)
+                or (new_last >= start and new_ticks[new_last] == tick)):
+            end -=1
+        else: break
+
+    return (start, end)
+
+#----------------------------------------
+
+def diff_track(old, new):
+    """
+    Returns the events removed from and added to a track,
+    as lists of (tick, message) tuples, in the track order
+    The changed region is between the common start and end,
+    extended to whole ticks, so its new events can be merged
+    in the order of a loaded file
+    """
+
+    count = min(len(old[1]), len(new[1]))
+    start = _common_prefix(old, new, count)
+    end = _common_suffix(old, new, count - start)
+    (start, end) = _align_region(old[0], new[0], start, end)
+    (old_end, new_end) = (len(old[1]) - end, len(new[1]) - end)
+
+    return (list(zip(old[0][start:old_end], old[1][start:old_end])),
+            list(zip(new[0][start:new_end], new[1][start:new_end])))
+
+#----------------------------------------
+
+class MidiWatcher(object):
+    """
+    Watches a Midi file loaded in a MidiSequencer object,
+    and applies its changes to the sequencer
+    defer_func returns whether the engine is running, for deferring the swap
+    on_change is called with (removed, ticks, messages, tracks) after a change
+    """
+    def __init__(self, seq, filename, period=0.5, defer_func=None, on_change=None, notify=None):
+        self._seq = seq
+        self.filename = filename
+        # time between two polls of the file status
+        self.period = period
+        self._defer_func = defer_func
+        self._on_change = on_change
+        self._notify = notify or print
+        self.ppqn =0
+        # by track: content hash, (ticks, messages) columns, tempo changes
+        self._hashes = []
+        self._tracks = []
+        self._tempos = []
+        self._stat = None
+        self._changed_stat = None
+        # status of the last version which could not be reloaded
+        self._failed_stat = None
+        self.reloads =0
+        self.last_latency =0.
+        self._thread = None
+        self._running =0
+
+    #----------------------------------------
+
+    def is_running(self):
+        return self._running
+
+    #----------------------------------------
+
+    def start(self):
+        """
+        Reads the current version of the file, as reference, and starts the watcher thread
+        Raises OSError or MidiFileError when the file cannot be read
+        """
+
+        if self._running: return
+        self._stat = self._get_stat()
+        data = memoryview(self._read())
+        mf = midifile.MidiFile(self.filename)
+        mf.read_header(data)
+        self.ppqn = mf.ppqn
+        self._hashes = []
+        self._tracks = []
+        self._tempos = []
+        msg_cache = {}
+        for (offset, length) in mf.chunks:
+            chunk = data[offset:offset + length]
+            (ticks, messages, tempos) = midifile.decode_track(data, offset, offset + length, msg_cache)
+            self._hashes.append(hashlib.blake2b(chunk, digest_size=16).digest())
+            self._tracks.append((ticks, messages))
+            self._tempos.append(tempos)
+        self._running =1
+        self._thread = threading.Thread(target=self._run, name="watch")
+        self._thread.daemon = True
+        self._thread.start()
+
+    #----------------------------------------
+
+    def stop(self):
+        if not self._running: return
+        self._running =0
+        self._thread.join()
+        self._thread = None
+
+    #----------------------------------------
+
+    def check(self):
+        """
+        Reloads the file, when its status has changed and is stable since the last poll,
+        so a file being written is not read
+        Returns the result of reload, or None
+        """
+
+        try:
+            stat = self._get_stat()
+        except OSError:
+            return None
+        if stat == self._stat:
+            self._changed_stat = None
+            return None
+        if stat != self._changed_stat:
+            self._changed_stat = stat
+            return None
+        self._changed_stat = None
+        try:
+            res = self.reload()
+        except (OSError, midifile.MidiFileError) as exc:
+            # retried at the next stable status, until it is reloaded
+            if stat != self._failed_stat:
+                self._notify(f"Could not reload: {self.filename}: {exc}")
+                self._failed_stat = stat
+            return None
+        self._stat = stat
+        self._failed_stat = None
+
+        return res
+
+    #----------------------------------------
+
+    def reload(self):
+        """
+        Decodes the changed tracks, and applies the difference to the sequencer,
+        under its edit lock
+        Returns (removed, added) numbers of events
+        """
+
+        t0 = time.perf_counter()
+        data = memoryview(self._read())
+        mf = midifile.MidiFile(self.filename)
+        mf.read_header(data)
+        if mf.ppqn != self.ppqn:
+            self._notify(f"Resolution changed in {self.filename}, reload the file")
+            return (0, 0)
+        # tracks are numbered by chunk, a single track is the track 0, like in to_seq
+        removed = []
+        (ticks, messages, tracks) = ([], [], [])
+        tempo_changed =0
+        msg_cache = {}
+        # the reference is changed only when the whole file is decoded
+        (hashes, all_tracks, all_tempos) = (list(self._hashes), list(self._tracks), list(self._tempos))
+        nb_tracks = max(len(mf.chunks), len(self._tracks))
+        for index in range(nb_tracks):
+            if index < len(mf.chunks):
+                (offset, length) = mf.chunks[index]
+                digest = hashlib.blake2b(data[offset:offset + length], digest_size=16).digest()
+            else:
+                digest = None
+            if index < len(hashes) and digest == hashes[index]: continue
+            if digest is None:
+                (new, tempos) = ((array('l'), []), [])
+            else:
+                (new_ticks, new_msgs, tempos) = midifile.decode_track(data, offset, offset + length, msg_cache)
+                new = (new_ticks, new_msgs)
+            old = all_tracks[index] if index < len(all_tracks) else (array('l'), [])
+            (old_evs, new_evs) = diff_track(old, new)
+            removed.extend((tick, msg, index) for (tick, msg) in old_evs)
+            for (tick, msg) in new_evs:
+                ticks.append(tick)
+                messages.append(msg)
+                tracks.append(index)
+            if index < len(all_tracks):
+                if tempos != all_tempos[index]: tempo_changed =1
+                hashes[index] = digest
+                all_tracks[index] = new
+                all_tempos[index] = tempos
+            else:
+                if tempos: tempo_changed =1
+                hashes.append(digest)
+                all_tracks.append(new)
+                all_tempos.append(tempos)
+        # removed chunks at the end
+        while hashes and hashes[-1] is None:
+            hashes.pop()
+            all_tracks.pop()
+            all_tempos.pop()
+        (self._hashes, self._tracks, self._tempos) = (hashes, all_tracks, all_tempos)
+
+        seq = self._seq
+        with seq.edit_lock:
+            defer = self._defer_func() if self._defer_func else 0
+            if removed or messages:
+                seq.update_events(removed, ticks, messages, tracks, defer, by_track=1)
+            if tempo_changed:
+                seq.set_tempo_map([tempo for tempos in self._tempos for tempo in tempos])
+            self.reloads +=1
+            self.last_latency = time.perf_counter() - t0
+            if self._on_change and (removed or messages):
+                self._on_change(removed, ticks, messages, tracks)
+
+        return (len(removed), len(messages))
+
+    #----------------------------------------
+
+    def _get_stat(self):
+        stat = os.stat(self.filename)
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    #----------------------------------------
+
+    def _read(self):
+        with open(self.filename, "rb") as fh:
+            return fh.read()
+
+    #----------------------------------------
+
+    def _run(self):
+        period = self.period
+        while self._running:
+            time.sleep(period)
+            self.check()
+
+    #----------------------------------------
+
+#========================================
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+    File: miniplay.py
+    Headless player for MiniSeq: plays a Midi file on an output port, and exits.
+    No REPL, no prompt, only the engine modules are imported,
+    for batch runs and tests.
+    Usage: miniplay.py [-e engine] [-k] output_port midi_file
+           output_port can be a number, a name, a regex, or null
+    Date: Mon, 19/10/2026
+    Author: Coolbrother
+"""
+import sys
+import time
+import midiengine
+import miniseq
+
+#----------------------------------------
+
+def play_file(output_port, filename, engine=midiengine.DEFAULT_ENGINE, clicking=0):
+    """
+    Plays filename until the end of the song, or an interrupt
+    Returns the exit status
+    """
+
+    app = miniseq.MainApp()
+    if not app.init_app(output_port, engine): return 1
+    if not app.load_file(filename):
+        app.close()
+        return 1
+    if clicking: app.toggle_click()
+    app.play()
+    try:
+        while app._playing:
+            time.sleep(0.05)
+    except KeyboardInterrupt:
+        pass
+    app.stop()
+    app.close()
+
+    return 0
+
+#----------------------------------------
+
+def main(args):
+    engine = midiengine.DEFAULT_ENGINE
+    clicking =0
+    params = []
+    while args:
+        arg = args.pop(0)
+        if arg == "-e" and args:
+            engine = args.pop(0)
+        elif arg == "-k":
+            clicking =1
+        else:
+            params.append(arg)
+    if len(params) != 2:
+        print(__doc__.strip().splitlines()[4].strip(), file=sys.stderr)
+        return 2
+
+    return play_file(params[0], params[1], engine, clicking)
+
+#----------------------------------------
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
+
+#----------------------------------------
@@ -13,24 +13,27 @@
 """
 import sys
 import time
-from rtmidi.midiutil import open_midiport
-import logging
-from heapq import heappush, heappop
-import readline # for Commands
 import midisequencer as midseq
 import mididriver as drv
+import midilog
+import midiengine
+from miditrace import TRACE_FILE
+# Note: the modules of the file, REPL and optional features are imported when used,
+# so headless runs only load the engine modules
 _DEBUG =1
-_LOGFILE = "/tmp/app.log"
-logging.basicConfig(level=logging.DEBUG, format="%(message)s", filename=_LOGFILE, filemode='w')
-log = logging.getLogger(__name__)
-offset =0
-msg = None
-proccount =0
-evt = None
-_id =0
-_rate = 24000
-def beep():
-    print("\a\n")
+_LOGFILE = midilog.LOGFILE
+_TRACEFILE = TRACE_FILE
+
+#----------------------------------------
+
+def parse_port(text):
+    """ returns a TCP port number from text, or -1 if it is not valid """
+    try:
+        port = int(text)
+    except ValueError:
+        return -1
+
+    return port if 0 < port < 65536 else -1
 
 #----------------------------------------
 
@@ -44,7 +47,20 @@ class MainApp(object):
         self._paused =0
         self.click_track = None
         self._clicking =0
-        self._sending_lst = []
+        self._engine = None
+        self._play_time =0
+        self._play_tick =0
+        self._metrics_server = None
+        self._profiler = None
+        self._capture = None
+        self._recorder = None
+        self._sysex_job = None
+        self._journal = None
+        self._watcher = None
+        # ChaseIndex object, built at the first seek
+        self._chase_index = None
+        # last loaded file
+        self._filename = None
 
 
     #----------------------------------------
@@ -55,8 +71,15 @@ class MainApp(object):
         seq = self._seq
         self._playing =1
         self._paused =0
-        if self._driver and not self._driver._running:
-            self._driver.start_engine()
+        if self._engine: self._engine.set_pos(seq.curtick)
+        if self._driver:
+            # reference for the timing errors
+            self._play_time = self._driver.clock.time()
+            self._play_tick = seq.curtick
+            if self._recorder:
+                self._recorder.set_anchor(self._play_time, self._play_tick)
+            if not self._driver._running:
+                self._driver.start_engine()
         self.notify("Playing...")
 
     #----------------------------------------
@@ -71,7 +94,7 @@ class MainApp(object):
         if state_clicking: self.stop_click()
         self._seq.set_pos(-1)
         if self._driver:
-            self._driver.panic()
+            self._driver.release_notes()
         if state_clicking: self.start_click()
         self.notify("Paused")
 
@@ -91,15 +114,30 @@ class MainApp(object):
         if self._seq is None: return
         if self._driver:
             self._driver.stop_engine()
-            self._driver.panic()
+            self._driver.release_notes()
+        if self._engine: self._engine.reset()
         self._seq.init_pos()
         self.notify("Stopped")
 
     #----------------------------------------
     
+    def panic(self):
+        """
+        Sends all sound off and reset all controllers on all channels,
+        in the background
+        from MainApp object
+        """
+
+        if self._driver is None: return
+        jobs = self._driver.panic()
+        if jobs is None: return
+        self.notify(f"Panic: {len(jobs.jobs)} ports")
+
+    #----------------------------------------
+    
     def goto_start(self):
         if self._seq is None: return
-        pos = self._seq.set_pos(0)
+        pos = self.seek(0)
         msg = f"Goto Start at: {pos} ticks"
         self.notify(msg)
 
@@ -108,19 +146,76 @@ class MainApp(object):
     def goto_end(self):
         if self._seq is None: return
         
-        pos = self._seq.set_pos(self._seq.len)
+        pos = self.seek(self._seq.len)
         msg = f"Goto End at: {pos} ticks"
         self.notify(msg)
 
     #----------------------------------------
+
+    def goto_bar(self, bar):
+        """ sets the position at the start of bar, from 1 """
+        if self._seq is None: return
+        import midichase
+        pos = self.seek((bar -1) * self._seq.ppqn * midichase.BAR_BEATS)
+        self.notify(f"Goto Bar {bar} at: {pos} ticks")
+
+    #----------------------------------------
+
+    def seek(self, tick):
+        """
+        Sets the position at tick, releases the sounding notes,
+        and restores the controllers and programs of the channels at tick,
+        sending only the values differing from the last ones sent
+        The engine is held until the notes are released and the state restored,
+        so the events at the new position follow them
+        Returns the new position
+        from MainApp object
+        """
+
+        seq = self._seq
+        if self._driver is None: return seq.set_pos(tick)
+        # the chase index is built before holding the engine
+        with seq.edit_lock:
+            (msgs, tracks) = self.chase(tick)
+        with self._driver.engine_lock:
+            pos = seq.set_pos(tick)
+            if self._playing and self._engine: self._engine.set_pos(pos)
+            self._driver.release_notes()
+            # the position does not move after the last event
+            if pos == tick and msgs: self._driver.send_batch(msgs, tracks, changed=1)
+
+        return pos
+
+    #----------------------------------------
+
+    def chase(self, tick):
+        """
+        Returns the messages restoring the channel state at tick,
+        and their track numbers, from the chase index
+        """
+
+        if self._chase_index is None:
+            import midichase
+            self._chase_index = midichase.ChaseIndex(self._seq)
+
+        return self._chase_index.chase(tick)
+
+    #----------------------------------------
      
     def close(self):
         """ Close the player """
         if self._seq is None: return
         self._seq.close_seq()
+        self.stop_metrics()
+        if self._profiler: self._profiler.stop()
+        if self._capture: self.toggle_capture()
+        if self._recorder: self.toggle_record()
+        if self._journal: self.toggle_journal()
+        if self._watcher: self.toggle_watch()
         if self._driver: 
             self._driver.close_driver()
         self._midiout = None
+        midilog.stop_logging()
 
     #----------------------------------------
 
@@ -157,6 +252,83 @@ class MainApp(object):
 
     #----------------------------------------
 
+    def load_file(self, filename):
+        """
+        Loads a Standard Midi File in the sequencer
+        from MainApp object
+        """
+
+        if self._seq is None: return
+        if self._playing: self.stop()
+        import midifile
+        import midicache
+        seq = self._seq
+        t0 = time.perf_counter()
+        # the watcher is stopped while loading, and restarts on the loaded file
+        watching = self._watcher is not None
+        if watching: self.toggle_watch()
+        with seq.edit_lock:
+            try:
+                cached = midicache.load_midi_file(seq, filename, workers=midifile.get_workers())
+            except (OSError, midifile.MidiFileError) as exc:
+                self.notify(f"Could not load file: {filename}: {exc}")
+                if watching: self.toggle_watch()
+                return
+            if self._engine: self._engine.reset()
+            self.click_track = seq.click_track
+            self._filename = filename
+            # the journal restarts from the loaded sequence
+            if self._journal: self._journal.compact()
+        if watching: self.toggle_watch()
+        elapsed = time.perf_counter() - t0
+        self.notify(f"Loaded: {filename}, {len(seq.queue)} events, ppqn: {seq.ppqn}, "
+                f"in {elapsed:.3f} sec{' (cached)' if cached else ''}")
+
+        return len(seq.queue)
+
+    #----------------------------------------
+
+    def save_file(self, filename):
+        """
+        Writes the sequence as a Standard Midi File,
+        with the click track when clicking
+        from MainApp object
+        """
+
+        if self._seq is None: return
+        import midifile
+        try:
+            ntracks = midifile.write_midi_file(self._seq, filename, click=self._clicking)
+        except (OSError, midifile.MidiFileError) as exc:
+            self.notify(f"Could not write file: {filename}: {exc}")
+            return
+        self.notify(f"Saved: {filename}, {len(self._seq.queue)} events, {ntracks} tracks")
+
+        return ntracks
+
+    #----------------------------------------
+
+    def export_file(self, filename):
+        """
+        Exports the events as Parquet (.parquet) or Arrow IPC file, for analysis
+        from MainApp object
+        """
+
+        if self._seq is None: return
+        import midiexport
+        t0 = time.perf_counter()
+        try:
+            count = midiexport.export_file(self._seq, filename)
+        except (OSError, ImportError) as exc:
+            self.notify(f"Could not export file: {filename}: {exc}")
+            return
+        elapsed = time.perf_counter() - t0
+        self.notify(f"Exported: {filename}, {count} events, in {elapsed:.3f} sec")
+
+        return count
+
+    #----------------------------------------
+
     def init_click(self):
         """
         init click
@@ -249,182 +421,54 @@ class MainApp(object):
 
     #----------------------------------------
 
-    def midi_process0(self, nbframes, bufsize):
+    def set_engine(self, name):
         """
-        Processing midi callback
-        """
-        
-        if self._seq is None: return
-        seq = self._seq
-        pending_lst = []
-        sending_lst = []
-        tickcount =0
-
-        # beep()
-        while 1: # seq._running\
-                # and (self._playing or self._clicking):
-            if not self._driver._running: break
-            if not self._playing and not self._clicking: break
-            if self._playing and seq.curtick >= seq.len: 
-                self._playing =0
-                beep()
-                if not self._clicking: break
-            sending_lst = []
-            curtime = time.time()
-
-            if _DEBUG: log.debug(f"seq.curtick: {seq.curtick}") 
-            # Pop events off the pending_lst queue
-            # Whether they are sending_lst for this tick
-
-            # if self._playing:
-            while True:
-                # TODO: manage too for click and tickcount
-                if not pending_lst:  break 
-                if (self._playing and self._clicking) or self._playing:
-                    if pending_lst[0].tick > seq.curtick: break
-                elif self._clicking:
-                    if pending_lst[0].tick > tickcount: break
-
-                # There is event ready to send, transfert it to the send_ing list
-                evt = heappop(pending_lst)
-                heappush(sending_lst, evt)
-
-            # Pop up to self._batchsize events off the input queue
-            if self._playing:
-                for i in range(bufsize):
-                    # Seq event
-                    if self._playing:
-                        evt = seq.next_event()
-                        if evt is None: break
-                        # if _DEBUG: log.debug(f"evt.tick: {evt.tick} at count: {seq.curtick}, msg: {evt.message}")
-                        # log.debug("Got event from input queue: %r", evt)
-                        # Check whether event should be sent out immediately
-                        # or needs to be scheduled
-                        if evt.tick <= seq.curtick:
-                            heappush(sending_lst, evt)
-                            # log.debug("Queued event for output.")
-                        else:
-                            heappush(pending_lst, evt)
-                                # log.debug("Scheduled event in pending_lst queue.")
-
-            if self._clicking:
-                for i in range(8):
-                    evt = self.click_track.next_ev_roll()
-                    if evt is None: break
-                    # if _DEBUG: log.debug(f"evt.tick: {evt.tick} at count: {seq.curtick}, msg: {evt.message}")
-                    if evt.tick <= tickcount:
-                        heappush(sending_lst, evt)
-                    else:
-                        heappush(pending_lst, evt)
-             
-            # If this batch contains any sending_lst events,
-            # send them to the MIDI output.
-            if sending_lst:
-                for i in range(len(sending_lst)):
-                    evt = heappop(sending_lst)
-                    # if _DEBUG: log.debug(f"evt.tick: {evt.tick} at curtick: {seq.curtick}, msg: {evt.message}")
-                    self._driver.send_imm(evt.message)
-                    # seq.handle_event(heappop(sending_lst))
-
-            # loop speed adjustment
-            # for precision, we calculate elapsed time for the loop
-            # but for simplicity, we could do time.sleep(self._tickms) only
-            elapsed = time.time() - curtime
-            if elapsed < seq._tickms:
-                time.sleep(seq._tickms - elapsed)
-
-            if self._clicking: tickcount +=1
-            if self._playing: seq.curtick +=1
-
-    #----------------------------------------
-
-    def next_midi_ev(self):
-        """
-        Returns next Midi event between seq event or click event.
+        Selects the scheduling engine, by its registered name
+        from MainApp object
         """
-        
-        if self._seq is None: return
-        seq = self._seq
-        tickcount =0
-        _sending_lst = self._sending_lst
-
-        # _sending_lst is empty
-        # Pop up to self._batchsize events off the input queue
-        if _sending_lst:
-            evt = heappop(_sending_lst)[0]
-            log.debug(f"From Next_midi_ev func, returning tick: {evt.tick}, id: {evt.id},\nMessage: {evt.message}")
-            return evt
-
-        else: # not _sending_lst:
-            if self._playing:
-                for i in range(4):
-                    # Seq event
-                    evt = seq.next_event()
-                    if evt is None: break
-                    # if _DEBUG: log.debug(f"evt.tick: {evt.tick} at count: {seq.curtick}, msg: {evt.message}")
-                    # Note: we add a tuple with evt.id to manage event equality with tick
-                    heappush(_sending_lst, (evt, evt.id))
-
-            if self._clicking:
-                for i in range(4):
-                    evt = self.click_track.next_ev_roll()
-                    if evt is None: break
-                    # if _DEBUG: log.debug(f"evt.tick: {evt.tick} at count: {seq.curtick}, msg: {evt.message}")
-                    heappush(_sending_lst, (evt, evt.id))
 
-       
-    #----------------------------------------
+        engine = midiengine.create_engine(name, self)
+        if engine is None:
+            names = ", ".join(midiengine.get_engine_names())
+            self.notify(f"Unknown engine: {name}, available: {names}")
+            return
+        state_playing = self._playing
+        if state_playing: self.pause()
+        self._engine = engine
+        if state_playing: self.play()
+        self.notify(f"Engine: {engine.name}")
 
+        return engine
+
+    #----------------------------------------
 
     def midi_process(self, frames, bufsize):
-        global offset
-        global msg
-        global proccount
-        event_count =0
-        global evt 
-        frames =240
-        proccount +=1
-        log.debug(f"[Enter In midi_process Func], frames: {frames}, proccount: {proccount}, offset: {offset}, Tickms: {self._seq._tickms}")
-        while True:
-            # beep()
-            if not self._playing: break
-            if offset >= frames:
-                offset -= frames
-                log.debug(f"[Before returning, proccount]: {proccount}, Offset Dec: {offset}\n")
-                return  # We'll take care of this in the next block ...
-            # Note: This may raise an exception:
-            # Sample offset of the current block midi Data in the current process
-            # But, offset can be 0 too, it works???
-            
-            # port.write_midi_event(offset, msg.bytes())
-            if evt:
-                log.debug(f"[Before Write Midi Event]: proccount: {proccount}, Offset: {offset},\nMessage: {evt.message}, tick: {evt.tick}, id: {evt.id}, event_count: {event_count}\n")
-                self._driver.send_imm(evt.message)
-                evt = None
-            try:
-                evt = self.next_midi_ev()
-            except StopIteration:
-                return
+        """
+        Processing midi callback, handled by the current engine
+        from MainApp object
+        """
 
-            # print(f"Offset: {offset}, msg_time: {msg.time}")
-            if evt:
-                msg_time = evt.deltick * self._seq._tickms
-                log.debug(f"[Before Offset Inc]: Offset: {offset}, tick: {evt.tick}, deltick: {evt.deltick}, id: {evt.id},\nmsg_time: {msg_time}, Message: {evt.message}")
-                offset += round(msg_time * _rate)
-                log.debug(f"[After Offset Inc]: proccount: {proccount}, Offset: {offset}, evt.tick: {evt.tick}, evt.deltick: {evt.deltick}\n")
-                event_count +=1
+        self._engine.process(frames, bufsize)
 
     #----------------------------------------
 
-
-    def init_app(self, output_port):
+    def init_app(self, output_port, engine=midiengine.DEFAULT_ENGINE, interactive=0):
         """ 
         Init application 
+        Returns 0 when the output port cannot be opened
         From MainApp object 
         """
 
-        self._driver = drv.MidiDriver()
-        (self._midiout, port) = self._driver.open_output_port(output_port)
+        self._engine = midiengine.create_engine(engine, self)
+        if self._engine is None:
+            self.notify(f"Unknown engine: {engine}, using: {midiengine.DEFAULT_ENGINE}")
+            self._engine = midiengine.create_engine(midiengine.DEFAULT_ENGINE, self)
+        self._driver = drv.MidiDriver(port_cache=drv.PortCache())
+        res = self._driver.open_output_port(output_port, interactive)
+        if not isinstance(res, tuple):
+            self.notify(res)
+            return 0
+        (self._midiout, port) = res
         
         self._seq = midseq.MidiSequencer(bpm=100, ppqn=120)
         self._driver.set_process_callback(self.midi_process)
@@ -433,12 +477,359 @@ class MainApp(object):
         self.gen_notes()
         seq.update_pos()
 
+        return 1
+
+    #----------------------------------------
+
+    def get_timing_error(self, tick):
+        """
+        Returns the timing error in sec, for an event at tick sent now,
+        from the last play start
+        """
+
+        expected = self._play_time + (tick - self._play_tick) * self._seq._tickms
+        return self._driver.clock.time() - expected
+
+    #----------------------------------------
+
+    def get_state(self):
+        """
+        Returns the transport state, as a dictionary of values
+        from MainApp object
+        """
+
+        seq = self._seq
+        return {
+                "playing": self._playing,
+                "paused": self._paused,
+                "clicking": self._clicking,
+                "position_ticks": seq.curtick if seq else 0,
+                "bpm": seq.bpm if seq else 0,
+                }
 
     #----------------------------------------
 
-    def main(self, outport):
+    def start_metrics(self, port=None):
+        """
+        Starts the Prometheus metrics endpoint
+        from MainApp object
+        """
 
-        self.init_app(outport)
+        if self._driver is None: return
+        if self._metrics_server is not None: return
+        import midimetrics
+        if port is None: port = midimetrics.METRICS_PORT
+        metrics = midimetrics.MidiMetrics(period=self._driver._delay_ms)
+        self._metrics_server = midimetrics.MetricsServer(metrics, self.get_state, port)
+        try:
+            self._metrics_server.start()
+        except OSError as exc:
+            self._metrics_server = None
+            self.notify(f"Could not start metrics endpoint: {exc}")
+            return
+        self._driver.metrics = metrics
+        self.notify(f"Metrics at: http://{self._metrics_server.host}:{self._metrics_server.port}/metrics")
+
+    #----------------------------------------
+
+    def stop_metrics(self):
+        """
+        Stops the metrics endpoint
+        from MainApp object
+        """
+
+        if self._metrics_server is None: return
+        if self._driver: self._driver.metrics = None
+        self._metrics_server.stop()
+        self._metrics_server = None
+        self.notify("Metrics Stopped")
+
+    #----------------------------------------
+
+    def toggle_profiler(self, filename=None):
+        """
+        Starts or stops the sampling profiler,
+        on the engine thread and the control thread
+        from MainApp object
+        """
+
+        import midiprof
+        if filename is None: filename = midiprof.PROF_FILE
+        if self._profiler is None:
+            self._profiler = midiprof.SamplingProfiler(
+                    thread_names=("MainThread", "midi_engine"))
+        prof = self._profiler
+        if not prof.is_running():
+            prof.start()
+            self.notify("Profiler Started")
+        else:
+            prof.stop()
+            try:
+                prof.write(filename)
+            except OSError as exc:
+                self.notify(f"Profiler Stopped: could not write file: {filename}: {exc}")
+                return
+            self.notify(f"Profiler Stopped: {prof.nb_samples} samples written to {filename}")
+
+    #----------------------------------------
+
+    def toggle_capture(self, filename=None):
+        """
+        Starts or stops the capture of the sent messages to a Midi file
+        from MainApp object
+        """
+
+        if self._driver is None: return
+        if self._capture is None:
+            import midicapture
+            if filename is None: filename = midicapture.CAPTURE_FILE
+            capture = midicapture.MidiCapture(filename)
+            capture.start(self._driver.clock.time())
+            self._driver.capture = capture
+            self._capture = capture
+            self.notify(f"Capture Started: {filename}")
+        else:
+            capture = self._capture
+            self._driver.capture = None
+            self._capture = None
+            count = capture.stop()
+            msg = f"Capture Stopped: {count} messages written to {capture.filename}"
+            if capture.get_overflows():
+                msg += f", {capture.get_overflows()} messages lost"
+            self.notify(msg)
+
+    #----------------------------------------
+
+    def toggle_record(self, input_port=None):
+        """
+        Starts or stops the recording of the Midi input,
+        the recorded events are added to the sequence when stopping
+        from MainApp object
+        """
+
+        if self._driver is None or self._seq is None: return
+        driver = self._driver
+        seq = self._seq
+        if self._recorder is None:
+            import midirecord
+            if driver.midiin is None:
+                # prompts for the port, when not given in the command
+                res = driver.open_input_port(input_port, interactive=input_port is None)
+                if not isinstance(res, tuple):
+                    if res: self.notify(res)
+                    return
+            recorder = midirecord.MidiRecorder(seq)
+            recorder.start(driver.clock.time(), seq.curtick)
+            driver.start_input(recorder.ring)
+            self._recorder = recorder
+            self.notify("Recording...")
+        else:
+            recorder = self._recorder
+            driver.stop_input()
+            self._recorder = None
+            recorder.stop()
+            with self._seq.edit_lock:
+                if self._journal:
+                    self._journal.log_events(recorder.ticks, recorder.messages,
+                            [recorder.track] * len(recorder))
+                # when playing, the merged events are swapped by the engine thread
+                count = recorder.commit(defer=driver._running)
+            msg = f"Recording Stopped: {count} events recorded"
+            if recorder.ring.overflows:
+                msg += f", {recorder.ring.overflows} messages lost"
+            self.notify(msg)
+
+    #----------------------------------------
+
+    def toggle_journal(self, path=None):
+        """
+        Starts or stops the journal of the edits, with a snapshot of the sequence
+        from MainApp object
+        """
+
+        if self._seq is None: return
+        if self._journal is None:
+            import midijournal
+            journal = midijournal.MidiJournal(self._seq, path or midijournal.JOURNAL_PATH,
+                    defer_func=self._is_engine_running)
+            try:
+                journal.start()
+            except OSError as exc:
+                self.notify(f"Could not start the journal: {exc}")
+                return
+            self._journal = journal
+            self.notify(f"Journal Started: {journal.journal_path}")
+        else:
+            journal = self._journal
+            self._journal = None
+            journal.stop()
+            self.notify(f"Journal Stopped: {journal.count} edits since the snapshot")
+
+    #----------------------------------------
+
+    def recover_session(self, path=None):
+        """
+        Loads the last snapshot, replays the journal, and continues journaling
+        from MainApp object
+        """
+
+        if self._seq is None: return
+        import midijournal
+        if self._playing: self.stop()
+        if self._journal: self.toggle_journal()
+        journal = midijournal.MidiJournal(self._seq, path or midijournal.JOURNAL_PATH,
+                defer_func=self._is_engine_running)
+        t0 = time.perf_counter()
+        count = journal.recover()
+        if count < 0:
+            self.notify(f"No session to recover: {journal.snap_path}")
+            return
+        if self._engine: self._engine.reset()
+        self.click_track = self._seq.click_track
+        elapsed = time.perf_counter() - t0
+        self.notify(f"Recovered: {len(self._seq.queue)} events, {count} edits replayed, "
+                f"in {elapsed:.3f} sec")
+        try:
+            journal.start()
+        except OSError as exc:
+            self.notify(f"Could not start the journal: {exc}")
+            return
+        self._journal = journal
+
+        return count
+
+    #----------------------------------------
+
+    def toggle_watch(self):
+        """
+        Starts or stops the hot reload of the loaded file, when it changes
+        from MainApp object
+        """
+
+        if self._seq is None: return
+        if self._watcher is None:
+            if self._filename is None:
+                self.notify("No file loaded")
+                return
+            import midifile
+            import midiwatch
+            watcher = midiwatch.MidiWatcher(self._seq, self._filename,
+                    defer_func=self._is_engine_running,
+                    on_change=self._on_file_change, notify=self.notify)
+            try:
+                watcher.start()
+            except (OSError, midifile.MidiFileError) as exc:
+                self.notify(f"Could not watch file: {self._filename}: {exc}")
+                return
+            self._watcher = watcher
+            self.notify(f"Watching: {self._filename}")
+        else:
+            watcher = self._watcher
+            self._watcher = None
+            watcher.stop()
+            self.notify(f"Watching Stopped: {watcher.reloads} reloads")
+
+    #----------------------------------------
+
+    def _is_engine_running(self):
+        return self._driver is not None and self._driver._running
+
+    #----------------------------------------
+
+    def _on_file_change(self, removed, ticks, messages, tracks):
+        """
+        Called by the watcher thread, after applying the changes of the file
+        from MainApp object
+        """
+
+        if self._journal:
+            self._journal.log_update(removed, ticks, messages, tracks)
+        watcher = self._watcher
+        latency = watcher.last_latency * 1000 if watcher else 0.
+        self.notify(f"Reloaded: {self._filename}, {len(removed)} events removed, "
+                f"{len(messages)} added, in {latency:.1f} ms")
+
+    #----------------------------------------
+
+    def add_output_port(self, output_port, channels=()):
+        """
+        Opens another output port, with its sender thread,
+        and sends the channels (1 to 16) to it
+        from MainApp object
+        """
+
+        if self._driver is None: return
+        res = self._driver.open_port(output_port)
+        if not isinstance(res, int):
+            if res: self.notify(res)
+            return
+        for channel in channels:
+            self._driver.route_channel(channel -1, res)
+        self.notify(f"Output port {res}: {self._driver.ports[res].name}, channels: {list(channels)}")
+
+    #----------------------------------------
+
+    def send_sysex_file(self, filename, byte_rate=None):
+        """
+        Streams a SysEx file (.syx) to the output port, in the background
+        from MainApp object
+        """
+
+        if self._driver is None: return
+        try:
+            with open(filename, "rb") as fh:
+                data = fh.read()
+            if byte_rate is None: job = self._driver.send_sysex(data)
+            else: job = self._driver.send_sysex(data, byte_rate)
+        except (OSError, ValueError) as exc:
+            self.notify(f"Could not send SysEx: {filename}: {exc}")
+            return
+        self._sysex_job = job
+        self.notify(f"Sending SysEx: {filename}, {job.total_bytes} bytes, "
+                f"{len(job.packets)} messages, in {job.total_bytes / job.byte_rate:.1f} sec")
+
+        return job
+
+    #----------------------------------------
+
+    def print_sysex_status(self):
+        """ prints the progress of the last SysEx job """
+        job = self._sysex_job
+        if job is None:
+            self.notify("No SysEx sent")
+            return
+        state = "Cancelled" if job.cancelled else "Done" if job.is_done() else "Sending"
+        self.notify(f"SysEx {state}: {job.sent_bytes}/{job.total_bytes} bytes "
+                f"({job.get_progress() * 100:.0f}%), at {job.get_rate():.0f} bytes/sec")
+
+    #----------------------------------------
+
+    def dump_trace(self, *args):
+        """
+        Dumps the engine trace ring as Chrome trace JSON
+        from MainApp object
+        Note: args are for using it as a signal handler
+        """
+
+        if self._driver is None: return
+        nb = self._driver.dump_trace(_TRACEFILE)
+        self.notify(f"Trace: {nb} events dumped to {_TRACEFILE}")
+
+    #----------------------------------------
+
+    def main(self, outport, metrics_port=None, engine=midiengine.DEFAULT_ENGINE, filename=None,
+            interactive=0):
+
+        import signal
+        import readline # for Commands
+        if not self.init_app(outport, engine, interactive): return 1
+        if filename:
+            self.load_file(filename)
+        if metrics_port is not None:
+            self.start_metrics(metrics_port)
+        # kill -USR1 <pid> dumps the trace ring
+        if hasattr(signal, "SIGUSR1"):
+            signal.signal(signal.SIGUSR1, self.dump_trace)
         sav_cmd = ""
         try:
            while 1:
@@ -462,11 +853,97 @@ class MainApp(object):
                    self.pause()
                elif cmd == '<':
                    self.goto_start()
+               elif cmd.startswith('g'):
+                   # g bar: goto bar, with the channel state of the bar
+                   try:
+                       bar = int(cmd[1:])
+                   except ValueError:
+                       bar =0
+                   if bar < 1: self.notify("Usage: g bar")
+                   else: self.goto_bar(bar)
                elif cmd == '>':
                    self.goto_end()
+               elif cmd == 't':
+                   self.dump_trace()
+               elif cmd.startswith('prof'):
+                   # prof [file]: toggle the profiler, file.json for speedscope,
+                   # other names for collapsed stacks
+                   args = cmd.split()
+                   if len(args) > 1: self.toggle_profiler(args[1])
+                   else: self.toggle_profiler()
+               elif cmd.startswith('c'):
+                   # c [file]: toggle the capture of the output to a midi file
+                   args = cmd.split(None, 1)
+                   if len(args) > 1: self.toggle_capture(args[1].strip())
+                   else: self.toggle_capture()
+               elif cmd.startswith('r'):
+                   # r [port]: toggle the recording of the midi input
+                   args = cmd.split(None, 1)
+                   if len(args) > 1: self.toggle_record(args[1].strip())
+                   else: self.toggle_record()
+               elif cmd.startswith('o'):
+                   # o port [= ch,ch...]: open another output port,
+                   # and send the channels (1 to 16) to it
+                   (port, _, chans) = cmd[1:].partition('=')
+                   try:
+                       channels = [int(x) for x in chans.replace(',', ' ').split()]
+                   except ValueError:
+                       channels = None
+                   if not port.strip() or channels is None or any(not 1 <= x <= 16 for x in channels):
+                       self.notify("Usage: o port [= ch,ch...]")
+                   else: self.add_output_port(port.strip(), channels)
+               elif cmd == '!':
+                   # !: panic, all sound off and reset controllers
+                   self.panic()
+               elif cmd.startswith('x'):
+                   # x [file]: stream a SysEx file, or print the progress
+                   args = cmd.split(None, 1)
+                   if len(args) > 1: self.send_sysex_file(args[1].strip())
+                   else: self.print_sysex_status()
+               elif cmd.startswith('j'):
+                   # j [recover]: toggle the journal of the edits,
+                   # or recover the last session
+                   if cmd.split()[1:] == ["recover"]: self.recover_session()
+                   else: self.toggle_journal()
+               elif cmd == 'h':
+                   # h: toggle the hot reload of the loaded file
+                   self.toggle_watch()
+               elif cmd.startswith('l'):
+                   # l file: load a midi file
+                   args = cmd.split(None, 1)
+                   if len(args) > 1: self.load_file(args[1].strip())
+                   else: self.notify("Usage: l filename")
+               elif cmd.startswith('w'):
+                   # w file: write the sequence to a midi file,
+                   # or export it for .parquet, .arrow and .feather files
+                   args = cmd.split(None, 1)
+                   if len(args) < 2: self.notify("Usage: w filename")
+                   elif args[1].strip().lower().endswith((".parquet", ".pq", ".arrow", ".feather")):
+                       self.export_file(args[1].strip())
+                   else: self.save_file(args[1].strip())
+               elif cmd.startswith('e'):
+                   # e [name]: select the engine, or list them
+                   args = cmd.split()
+                   if len(args) > 1: self.set_engine(args[1])
+                   else:
+                       for name in midiengine.get_engine_names():
+                           cur = "*" if name == self._engine.name else " "
+                           descr = midiengine.get_engine_class(name).description
+                           self.notify(f"{cur} {name}: {descr}")
+               elif cmd.startswith('m'):
+                   # m [port]: toggle the metrics endpoint
+                   args = cmd.split()
+                   if self._metrics_server: self.stop_metrics()
+                   elif len(args) > 1:
+                       port = parse_port(args[1])
+                       if port < 0: self.notify("Usage: m [port], port from 1 to 65535")
+                       else: self.start_metrics(port)
+                   else: self.start_metrics()
               
         except (KeyboardInterrupt):
            self.close()
+
+        return 0
        
        #----------------------------------------
 
@@ -475,9 +952,32 @@ class MainApp(object):
 if __name__ == '__main__':
     # Note: output_port can be a number or a name
     # output_port = "TiMidity:TiMidity port 0 128:0"
+    # output_port can be a regex, or null for running without port
+    # Usage: miniseq.py [output_port] [-i] [-m metrics_port] [-e engine] [-f midi_file]
+    # -i: prompts for the output port, when not found
     output_port =1
-    if len(sys.argv) > 1: 
-        output_port = sys.argv[1]
+    interactive =0
+    metrics_port = None
+    engine = midiengine.DEFAULT_ENGINE
+    filename = None
+    args = sys.argv[1:]
+    while args:
+        arg = args.pop(0)
+        if arg == "-m" and args:
+            metrics_port = parse_port(args.pop(0))
+            if metrics_port < 0:
+                print("Usage: -m port, port from 1 to 65535")
+                sys.exit(2)
+        elif arg == "-e" and args:
+            engine = args.pop(0)
+        elif arg == "-f" and args:
+            filename = args.pop(0)
+        elif arg == "-i":
+            interactive =1
+        else:
+            output_port = arg
+    import logging
+    midilog.init_logging(logging.DEBUG if _DEBUG else logging.WARNING, _LOGFILE)
     app = MainApp()
-    app.main(output_port)
+    sys.exit(app.main(output_port, metrics_port, engine, filename, interactive))
 #----------------------------------------